@@ -0,0 +1,174 @@
+"""
+Build-time static asset pipeline.
+
+``freetar-assets`` (or ``python -m freetar.assets``) minifies the JS and CSS
+under ``freetar/static`` (jsmin/rcssmin, when installed), writes every file
+to ``static/build`` under a content-hashed name, pre-compresses the text
+formats with gzip and, if the ``brotli`` package is available, brotli, and
+records the mapping in ``static/build/manifest.json``.
+
+At runtime ``init_app`` makes ``url_for('static', filename=...)`` resolve to
+the hashed file, serves it with an immutable Cache-Control header and picks
+the pre-compressed variant the client accepts. Without a manifest nothing
+changes and files are served (and minified) as before.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import sys
+from pathlib import Path
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import jsmin
+except ImportError:  # optional, files are copied unminified
+    jsmin = None
+
+try:
+    import rcssmin
+except ImportError:  # optional, files are copied unminified
+    rcssmin = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = Path(__file__).with_name("static")
+BUILD_DIR = STATIC_DIR / "build"
+MANIFEST_NAME = "manifest.json"
+ENABLED = os.environ.get("FREETAR_ASSETS", "1") == "1"
+
+COMPRESSIBLE = {".js", ".css", ".json", ".csv", ".svg", ".txt", ".wasm", ".ttf", ".html"}
+# Notes and type declarations that live next to the assets but are never served.
+SKIP_SUFFIXES = {".md", ".ts"}
+MIN_COMPRESS_SIZE = 1024
+IMMUTABLE = "public, max-age=31536000, immutable"
+_HASH_LEN = 12
+_CSS_STATIC_URL_RE = re.compile(r"url\(\s*(['\"]?)/static/([^'\")?#]+)\1\s*\)")
+
+
+def _minify(path: Path, data: bytes) -> bytes:
+    if path.name.endswith((".min.js", ".min.css")):
+        return data
+    if path.suffix == ".js" and jsmin is not None:
+        return jsmin.jsmin(data.decode("utf-8"), quote_chars="'\"`").encode("utf-8")
+    if path.suffix == ".css" and rcssmin is not None:
+        return rcssmin.cssmin(data.decode("utf-8")).encode("utf-8")
+    return data
+
+
+def _hashed_name(rel: str, data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()[:_HASH_LEN]
+    stem, dot, ext = rel.rpartition(".")
+    if not dot or "/" in ext:
+        return f"{rel}.{digest}"
+    return f"{stem}.{digest}.{ext}"
+
+
+def _write_variants(target: Path, data: bytes):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_bytes(data)
+    if target.suffix not in COMPRESSIBLE or len(data) < MIN_COMPRESS_SIZE:
+        return
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        target.with_name(target.name + ".gz").write_bytes(gz)
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            target.with_name(target.name + ".br").write_bytes(br)
+
+
+def build(static_dir: Path = STATIC_DIR, build_dir: Path = BUILD_DIR) -> dict:
+    """Rebuild ``build_dir`` from ``static_dir``; returns the manifest."""
+    if build_dir.exists():
+        shutil.rmtree(build_dir)
+    sources = sorted(p for p in static_dir.rglob("*")
+                     if p.is_file() and build_dir not in p.parents and p.suffix not in SKIP_SUFFIXES)
+    # CSS last, so its url(/static/...) references can point at hashed files.
+    sources.sort(key=lambda p: p.suffix == ".css")
+
+    manifest = {}
+    for path in sources:
+        rel = path.relative_to(static_dir).as_posix()
+        data = _minify(path, path.read_bytes())
+        if path.suffix == ".css":
+            data = _CSS_STATIC_URL_RE.sub(
+                lambda m: f"url({m.group(1)}/static/build/{manifest[m.group(2)]}{m.group(1)})"
+                if m.group(2) in manifest else m.group(0),
+                data.decode("utf-8"),
+            ).encode("utf-8")
+        hashed = _hashed_name(rel, data)
+        _write_variants(build_dir / hashed, data)
+        manifest[rel] = hashed
+
+    (build_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding="utf-8")
+    return manifest
+
+
+def load_manifest(build_dir: Path = BUILD_DIR) -> dict:
+    try:
+        return json.loads((build_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as exc:
+        logger.warning("Ignoring unreadable asset manifest: %s", exc)
+        return {}
+
+
+def init_app(app, build_dir: Path = BUILD_DIR) -> bool:
+    """Serve built assets if a manifest exists. Returns whether it did."""
+    manifest = load_manifest(build_dir) if ENABLED else {}
+    if not manifest:
+        return False
+    built = set(manifest.values())
+
+    @app.url_defaults
+    def _hashed_static_url(endpoint, values):
+        if endpoint == "static" and values.get("filename") in manifest:
+            values["filename"] = "build/" + manifest[values["filename"]]
+
+    @app.route("/static/build/<path:filename>", endpoint="built_asset")
+    def built_asset(filename):
+        encoding = None
+        if filename in built:
+            accepted = request.accept_encodings
+            for candidate, suffix in (("br", ".br"), ("gzip", ".gz")):
+                if accepted[candidate] and (build_dir / (filename + suffix)).is_file():
+                    encoding = candidate
+                    break
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        name = filename + (".br" if encoding == "br" else ".gz" if encoding == "gzip" else "")
+        response = send_from_directory(build_dir, name, mimetype=mimetype, max_age=31536000)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        if filename in built:
+            response.headers["Cache-Control"] = IMMUTABLE
+        return response
+
+    return True
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    missing = [name for name, mod in (("jsmin", jsmin), ("rcssmin", rcssmin), ("brotli", brotli)) if mod is None]
+    if missing:
+        print(f"Not installed, skipping that step: {', '.join(missing)}", file=sys.stderr)
+    manifest = build()
+    source = sum(f.stat().st_size for f in STATIC_DIR.rglob("*") if f.is_file() and BUILD_DIR not in f.parents)
+    built = sum((BUILD_DIR / name).stat().st_size for name in manifest.values())
+    print(f"Built {len(manifest)} assets into {BUILD_DIR}: {source:,} B -> {built:,} B before compression")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,27 @@
-import json
+import itertools
 import logging
 import mimetypes
 import os
 import re
 import secrets
 import time
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
 
 import waitress
-from flask import Flask, redirect, render_template, request, url_for
+from flask import Flask, make_response, redirect, render_template, request, url_for
 from flask_caching import Cache
 from flask_minify import Minify
 
-from freetar.ug import Search, ug_tab
+from freetar import assets, compression, imports, jsonstream, parsepool, prefork, sharedcache, upstream, writebehind
+from freetar.ug import chord_memo_stats
+from freetar.collections_index import CollectionsIndex
+from freetar.collections_store import RevisionConflict, open_store as open_collections_store
+from freetar.conditional import make_etag, not_modified, not_modified_response, set_validators
+from freetar.datacache import data_cache, flights, get_search, get_tab, negative_cache
+from freetar.library_patch import PatchError, apply_patch
+from freetar.pagecache import PageCache
+from freetar.prefetch import prefetcher
 from freetar.utils import get_version, FreetarError
 
 logger = logging.getLogger(__name__)
@@ -23,17 +31,28 @@ mimetypes.add_type("application/wasm", ".wasm")
 
 APP_START_TS = int(time.time())
 
-cache = Cache(
-    config={
-        "CACHE_TYPE": "SimpleCache",
-        "CACHE_DEFAULT_TIMEOUT": 0,
-        "CACHE_THRESHOLD": 10000,
-    }
-)
+cache_config = sharedcache.cache_config()
+cache = Cache(config=cache_config)
 
 app = Flask(__name__)
 cache.init_app(app)
-Minify(app=app, html=True, js=True, cssless=True)
+page_cache = PageCache(cache, shared=sharedcache.is_shared(cache_config))
+# Registered first so it runs last, after minification.
+compression.init_app(app, page_cache)
+# Built assets are minified ahead of time; only minify static files at
+# request time when there is no build.
+Minify(app=app, html=True, js=True, cssless=True, static=not assets.init_app(app))
+
+
+@app.before_request
+def _count_request():
+    prefetcher.request_started()
+
+
+@app.teardown_request
+def _uncount_request(exc):
+    prefetcher.request_finished()
+
 
 COLLECTIONS_PATH = Path(__file__).with_name("my_chord_collections.json")
 # Folder to hold per-collection chord library files
@@ -56,61 +75,65 @@ def _resolve_collection_id(collection_id: str | None = None) -> str | None:
     safe_id = _sanitize_collection_id(collection_id)
     if safe_id:
         return safe_id
-    groups = load_collections()
-    for grp in groups:
-        if not isinstance(grp, dict):
-            continue
-        for coll in grp.get("collections", []):
-            if not isinstance(coll, dict):
-                continue
-            cid = _sanitize_collection_id(coll.get("id"))
-            if cid:
-                return cid
-    return None
-
-
-def chord_lib_path_for(collection_id: str | None) -> Path:
-    """
-    Resolve the JSON path for a collection chord library.
-    """
-    safe_id = _resolve_collection_id(collection_id)
-    if not safe_id:
-        safe_id = "default"
-    CHORDS_DIR.mkdir(exist_ok=True)
-    return CHORDS_DIR / f"{safe_id}.json"
+    return collections_index.first_id()
 
 
 def load_chord_library(collection_id: str | None = None):
-    """Return list of chord groups from JSON for a collection, or empty list if missing or invalid."""
+    """Return list of chord groups for a collection, or empty list if missing or invalid."""
     resolved_id = _resolve_collection_id(collection_id)
     if not resolved_id:
         return []
-    path = chord_lib_path_for(resolved_id)
-    if not path.exists():
-        return []
     try:
-        text = path.read_text(encoding="utf-8")
-        data = json.loads(text)
-        if isinstance(data, list):
-            return data
-        return []
-    except Exception:
+        data = collections_store.read_library(resolved_id)
+    except Exception as exc:
+        logger.warning("Failed to load chord library %s: %s", resolved_id, exc)
         return []
+    return data if isinstance(data, list) else []
+
+
+def load_chord_libraries(collection_ids) -> dict:
+    """``{collection_id: groups}`` for many collections in one storage read."""
+    resolved = {cid: _resolve_collection_id(cid) for cid in collection_ids}
+    try:
+        found = collections_store.read_libraries({rid for rid in resolved.values() if rid})
+    except Exception as exc:
+        logger.warning("Failed to load chord libraries: %s", exc)
+        found = {}
+    return {
+        cid: found[rid] if isinstance(found.get(rid), list) else []
+        for cid, rid in resolved.items()
+    }
 
 
-def save_chord_library(data, collection_id: str | None = None):
-    """Persist chord groups to JSON for a collection, pretty printed."""
+def save_chord_library(data, collection_id: str | None = None) -> bool:
+    """Persist chord groups for a collection. Returns False (and logs) on failure."""
     resolved_id = _resolve_collection_id(collection_id)
     if not resolved_id:
-        return
+        return False
     try:
-        chord_lib_path_for(resolved_id).write_text(
-            json.dumps(data, indent=2, ensure_ascii=False),
-            encoding="utf-8",
-        )
+        collections_store.write_library(resolved_id, data)
+    except Exception:
+        logger.exception("Failed to save chord library %s", resolved_id)
+        return False
+    return True
+
+
+def save_collections_and_libraries(groups: list | None, libraries: dict, renames: dict | None = None) -> bool:
+    """
+    Persist metadata (if given) and several chord libraries together, after
+    moving stored libraries (``{from id: to id}``); a single transaction with
+    the SQLite engine. Returns False (and logs) on failure.
+    """
+    libraries = {_sanitize_collection_id(cid): lib for cid, lib in libraries.items()
+                 if _sanitize_collection_id(cid)}
+    try:
+        collections_store.write_many(metadata=groups, libraries=libraries, renames=renames)
     except Exception:
-        # Simple proof of concept. Ignore write errors.
-        pass
+        logger.exception("Failed to save collections")
+        return False
+    if groups is not None:
+        collections_index.replace(groups)
+    return True
 
 
 def _bootstrap_default_collections(existing_groups: list | None = None):
@@ -127,12 +150,16 @@ def _bootstrap_default_collections(existing_groups: list | None = None):
         "collections": [{"id": default_id, "name": DEFAULT_COLLECTION_NAME}],
     }
     groups_with_default = [default_group] + groups_list
-    save_collections(groups_with_default)
-    save_chord_library(DEFAULT_COLLECTION_LIBRARY, default_id)
+    save_collections_and_libraries(groups_with_default, {default_id: DEFAULT_COLLECTION_LIBRARY})
     return groups_with_default
 
 
 def load_collections():
+    """Collection metadata from the in-memory index (read-only, see ``_read_collections``)."""
+    return collections_index.groups()
+
+
+def _read_collections():
     """
     Load collection metadata for the landing page.
 
@@ -148,11 +175,10 @@ def load_collections():
         ...
       ]
     """
-    if not COLLECTIONS_PATH.exists():
-        return _bootstrap_default_collections()
     try:
-        text = COLLECTIONS_PATH.read_text(encoding="utf-8")
-        data = json.loads(text)
+        data = collections_store.read_metadata()
+        if data is None:
+            return _bootstrap_default_collections()
         if isinstance(data, list):
             has_collections = any(
                 isinstance(coll, dict) and _sanitize_collection_id(coll.get("id"))
@@ -163,21 +189,33 @@ def load_collections():
             if data and has_collections:
                 return data
             return _bootstrap_default_collections(data)
-        logger.warning("Collections file is not a list; returning empty default.")
+        logger.warning("Collections metadata is not a list; returning empty default.")
     except Exception as exc:
         logger.warning("Failed to load collections metadata: %s", exc)
     return _bootstrap_default_collections()
 
 
-def save_collections(data: list):
-    """Persist collections metadata to JSON, pretty printed."""
-    try:
-        COLLECTIONS_PATH.write_text(
-            json.dumps(data, indent=2, ensure_ascii=False),
-            encoding="utf-8",
-        )
-    except Exception:
-        pass
+def save_collections(data: list) -> bool:
+    """Persist collections metadata. Returns False (and logs) on failure."""
+    return save_collections_and_libraries(data, {})
+
+
+collections_store = writebehind.wrap(open_collections_store(COLLECTIONS_PATH, CHORDS_DIR))
+collections_index = CollectionsIndex(_read_collections, lambda: collections_store.metadata_version()[0])
+
+
+def _collection_validators(kind: str, *parts, library: str | None = None, all_libraries: bool = False):
+    """ETag and Last-Modified for a view built from the collections metadata and libraries."""
+    versions = [collections_store.metadata_version()]
+    if library is not None:
+        versions.append(collections_store.library_version(_resolve_collection_id(library) or "default"))
+    if all_libraries:
+        versions.append(collections_store.libraries_version())
+    etag = make_etag(kind, get_version(), APP_START_TS, collections_store.kind, *parts,
+                     *(token for token, _ in versions))
+    newest = max(ts for _, ts in versions)
+    last_modified = datetime.fromtimestamp(int(newest), tz=timezone.utc) if newest else None
+    return etag, last_modified
 
 
 def generate_collection_id(existing_ids: set[str] | None = None) -> str:
@@ -194,7 +232,13 @@ def slugify_name(name: str) -> str:
     return slug or "group"
 
 
+def _lazy_library(collection_id):
+    """A library that is only read when the export is encoded (see ``jsonstream``)."""
+    return lambda: load_chord_library(collection_id)
+
+
 def build_collections_export_payload(groups: list[dict]) -> dict:
+    """Export payload; each library is read while the response streams."""
     export_groups: list[dict] = []
     for grp in groups or []:
         if not isinstance(grp, dict):
@@ -205,12 +249,11 @@ def build_collections_export_payload(groups: list[dict]) -> dict:
             if not isinstance(coll, dict):
                 continue
             cid = coll.get("id")
-            library = load_chord_library(cid) if cid is not None else []
             collections_payload.append(
                 {
                     "id": cid,
                     "name": coll.get("name", ""),
-                    "library": library,
+                    "library": _lazy_library(cid) if cid is not None else [],
                 }
             )
         export_groups.append({"group": group_name, "collections": collections_payload})
@@ -218,18 +261,21 @@ def build_collections_export_payload(groups: list[dict]) -> dict:
 
 
 def build_chord_backup():
-    """Return a dict with chord library data and any collection metadata/libraries."""
-    chords = load_chord_library()
+    """
+    Return a dict with chord library data and any collection metadata/libraries.
+    Libraries are loaded lazily, one at a time, when encoded with ``jsonstream``.
+    """
+    chords = _lazy_library(None)
     collections_data = None
 
     collections_groups = load_collections() or []
-    libraries = {}
-    for group in collections_groups:
-        for coll in group.get("collections", []):
-            coll_id = coll.get("id")
-            if not coll_id:
-                continue
-            libraries[coll_id] = load_chord_library(coll_id)
+    collection_ids = dict.fromkeys(
+        coll.get("id")
+        for group in collections_groups
+        for coll in group.get("collections", [])
+        if coll.get("id")
+    )
+    libraries = {cid: _lazy_library(cid) for cid in collection_ids}
 
     if collections_groups or libraries:
         collections_data = {
@@ -240,6 +286,38 @@ def build_chord_backup():
     return {"chords": chords, "collections": collections_data}
 
 
+EXPORT_FORMATS = ("pretty", "compact", "zip")
+
+
+def _export_format(default: str = "pretty") -> str | None:
+    fmt = request.args.get("format", default)
+    return fmt if fmt in EXPORT_FORMATS else None
+
+
+def _export_response(payload, filename: str, fmt: str, attachment: bool = True, like_jsonify: bool = False):
+    """
+    Stream ``payload`` as JSON: indented (``pretty``), ``compact``, or
+    indented inside a ``zip`` archive. With ``like_jsonify``, ``compact`` is
+    byte for byte what ``flask.jsonify`` returns (sorted keys, ASCII escapes,
+    trailing newline).
+    """
+    if fmt == "compact" and like_jsonify:
+        parts = itertools.chain(jsonstream.iterencode(payload, sort_keys=True, ensure_ascii=True), ["\n"])
+    else:
+        parts = jsonstream.iterencode(payload, indent=None if fmt == "compact" else 2)
+    chunks = jsonstream.chunked(parts)
+    mimetype = "application/json"
+    if fmt == "zip":
+        chunks = jsonstream.zipped(filename, chunks)
+        mimetype = "application/zip"
+        filename = filename.removesuffix(".json") + ".zip"
+        attachment = True
+    resp = app.response_class(response=chunks, status=200, mimetype=mimetype)
+    if attachment:
+        resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return resp
+
+
 def _parse_shape_tokens(shape: str):
     """
     Convert a shape like 'x02210' into a list of six positions
@@ -381,7 +459,7 @@ def index():
 
 
 @app.route("/search")
-@cache.cached(query_string=True)
+@page_cache.cached(query_string=True)
 def search():
     search_term = request.args.get("search_term")
     try:
@@ -390,11 +468,12 @@ def search():
         return render_template(
             "error.html",
             error="Invalid page requested. Not a number.",
-        )
+        ), 400
 
     search_results = None
     if search_term:
-        search_results = Search(search_term, page)
+        search_results = get_search(search_term, page)
+        prefetcher.search_page(search_term, page, search_results.total_pages)
 
     return render_template(
         "index.html",
@@ -405,20 +484,20 @@ def search():
 
 
 @app.route("/tab/<artist>/<song>")
-@cache.cached()
+@page_cache.cached()
 def show_tab(artist: str, song: str):
-    tab = ug_tab(f"{artist}/{song}")
-    return render_template(
-        "tab.html",
-        tab=tab,
-        title=f"{tab.artist_name} - {tab.song_name}",
-    )
+    return render_tab(get_tab(f"{artist}/{song}"))
 
 
 @app.route("/tab/<tabid>")
-@cache.cached()
+@page_cache.cached()
 def show_tab2(tabid: int):
-    tab = ug_tab(tabid)
+    return render_tab(get_tab(tabid))
+
+
+def render_tab(tab):
+    """Render a cached TabEntry; both tab URL forms share the parsed entry."""
+    prefetcher.alternatives(tab)
     return render_template(
         "tab.html",
         tab=tab,
@@ -436,6 +515,9 @@ def show_about():
 
 @app.route("/advanced/export-settings")
 def export_settings():
+    fmt = _export_format("compact")
+    if fmt is None:
+        return {"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, 400
     backup = build_chord_backup()
     payload = {
         "version": get_version() or "1",
@@ -443,49 +525,165 @@ def export_settings():
     }
     if backup.get("collections") is not None:
         payload["collections"] = backup["collections"]
-    return payload
+    date_str = datetime.now().strftime("%Y-%m-%d")
+    # The compact default keeps the bytes of the former jsonify response.
+    return _export_response(payload, f"freetar-backup-{date_str}.json", fmt, attachment=False, like_jsonify=True)
 
 
-@app.route("/advanced/import-settings", methods=["POST"])
-def import_settings():
+def _group_namer(existing_names):
+    """``next_group_name(base)``: the name itself, or ``base-02``, ``base-03``... if taken."""
+    seen_names = set(existing_names)
+
+    def next_group_name(base_name: str) -> str:
+        base = (base_name or "").strip() or "\u00a0"
+        if base not in seen_names:
+            seen_names.add(base)
+            return base
+        suffix = 2
+        while True:
+            candidate = f"{base}-{suffix:02d}"
+            if candidate not in seen_names:
+                seen_names.add(candidate)
+                return candidate
+            suffix += 1
+
+    return next_group_name
+
+
+def _run_import(handler):
+    """
+    Run ``handler(reader, progress)`` over the request body as a streaming
+    import and turn its failures into error responses.
+    """
+    progress = imports.tracker.start(request.headers.get("X-Import-Id"), request.content_length)
     try:
-        payload = request.get_json(force=True)
-        if not isinstance(payload, dict):
-            return {"error": "Payload must be a JSON object"}, 400
-    except Exception as exc:
+        reader = imports.open_reader(request, progress)
+        if reader.peek_type() != "object":
+            raise imports.InvalidImport("Payload must be an object")
+        response = handler(reader, progress)
+    except jsonstream.PayloadTooLarge as exc:
+        imports.tracker.finish(progress, str(exc), too_large=True)
+        return {"error": "Payload too large", "detail": str(exc)}, 413
+    except imports.InvalidImport as exc:
+        imports.tracker.finish(progress, str(exc))
+        return {"error": str(exc)}, 400
+    except imports.SaveFailed as exc:
+        imports.tracker.finish(progress, str(exc))
+        return {"error": str(exc)}, 500
+    except ValueError as exc:  # malformed JSON or UTF-8
+        imports.tracker.finish(progress, "Invalid JSON")
         return {"error": "Invalid JSON", "detail": str(exc)}, 400
+    except Exception:
+        # Anything else is a 500; pollers must still see the import end.
+        logger.exception("Import %s failed", progress.import_id or "-")
+        imports.tracker.finish(progress, "Internal error")
+        raise
+    imports.tracker.finish(progress)
+    return response
 
-    if "chords" in payload:
-        chords_payload = payload["chords"]
-        if not isinstance(chords_payload, list):
-            return {"error": "chords must be a list of groups"}, 400
-        save_chord_library(chords_payload)
-
-    if "collections" in payload:
-        collections_payload = payload["collections"]
-        if not isinstance(collections_payload, dict):
-            return {
-                "error": "collections must be an object with groups and libraries"
-            }, 400
-
-        groups = collections_payload.get("groups", [])
-        libraries = collections_payload.get("libraries", {})
-        if not isinstance(groups, list):
-            return {"error": "collections.groups must be a list"}, 400
-        if not isinstance(libraries, dict):
-            return {"error": "collections.libraries must be an object"}, 400
-
-        save_collections(groups)
-        for coll_id, coll_groups in libraries.items():
-            if not isinstance(coll_groups, list):
-                return {
-                    "error": f"collections.libraries['{coll_id}'] must be a list of groups",
-                }, 400
-            save_chord_library(coll_groups, coll_id)
 
+def _write_library_batch(batch: dict, progress, written: list):
+    if not batch:
+        return
+    if not save_collections_and_libraries(None, batch):
+        raise imports.SaveFailed("Could not save collections")
+    progress.libraries_written += len(batch)
+    written.extend(batch)
+    batch.clear()
+
+
+def _discard_libraries(collection_ids: list):
+    """Remove libraries a failed import wrote, which nothing references."""
+    if not collection_ids:
+        return
+    try:
+        collections_store.delete_libraries(collection_ids)
+    except Exception:
+        logger.exception("Failed to remove %d libraries of a failed import", len(collection_ids))
+
+
+def _import_settings(reader, progress):
+    """
+    Collection libraries are staged under temporary ids as batches arrive.
+    Nothing stored changes until the whole payload has been read; then the
+    staged libraries are moved into place together with the metadata.
+    """
+    prefix = f"import_{secrets.token_hex(4)}_"
+    staged: list[str] = []
+    chords_payload = None
+    collections = None
+    try:
+        for key in reader.iter_object():
+            if key == "chords":
+                chords_payload = reader.value()
+                if not isinstance(chords_payload, list):
+                    raise imports.InvalidImport("chords must be a list of groups")
+                progress.groups += len(chords_payload)
+            elif key == "collections":
+                collections = _stage_settings_collections(reader, progress, prefix, staged)
+            else:
+                reader.skip()
+        reader.end()
+        if chords_payload is not None and not save_chord_library(chords_payload):
+            raise imports.SaveFailed("Could not save chords")
+        if collections is not None:
+            groups, batch = collections
+            final = {cid[len(prefix):]: coll_groups for cid, coll_groups in batch.items()}
+            renames = {cid: cid[len(prefix):] for cid in dict.fromkeys(staged)}
+            if not save_collections_and_libraries(groups, final, renames):
+                raise imports.SaveFailed("Could not save collections")
+            progress.libraries_written += len(batch)
+    except BaseException:
+        _discard_libraries(staged)
+        raise
     return ("", 204)
 
 
+def _stage_settings_collections(reader, progress, prefix: str, staged: list):
+    """``(groups, last batch)``; full batches are written under ``prefix`` + id."""
+    if reader.peek_type() != "object":
+        raise imports.InvalidImport("collections must be an object with groups and libraries")
+    groups = []
+    batch = {}
+    for key in reader.iter_object():
+        if key == "groups":
+            groups = reader.value()
+            if not isinstance(groups, list):
+                raise imports.InvalidImport("collections.groups must be a list")
+        elif key == "libraries":
+            if reader.peek_type() != "object":
+                raise imports.InvalidImport("collections.libraries must be an object")
+            for coll_id in reader.iter_object():
+                coll_groups = reader.value()
+                if not isinstance(coll_groups, list):
+                    raise imports.InvalidImport(f"collections.libraries['{coll_id}'] must be a list of groups")
+                safe_id = _sanitize_collection_id(coll_id)
+                if not safe_id:
+                    continue
+                batch[prefix + safe_id] = coll_groups
+                progress.collections += 1
+                if len(batch) >= imports.BATCH_SIZE:
+                    _write_library_batch(batch, progress, staged)
+        else:
+            reader.skip()
+    return groups, batch
+
+
+@app.route("/advanced/import-settings", methods=["POST"])
+def import_settings():
+    return _run_import(_import_settings)
+
+
+@app.route("/import-progress/<import_id>")
+def import_progress(import_id):
+    progress = imports.tracker.get(import_id)
+    if progress is None:
+        return {"error": "Unknown import"}, 404
+    resp = make_response(progress.as_dict())
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
 @app.route("/my-chords")
 def my_chords():
     collection_id = _resolve_collection_id(request.args.get("collection_id"))
@@ -501,22 +699,30 @@ def _active_collection_id():
 @app.route("/my-chords/export", methods=["GET"])
 def my_chords_export():
     collection_id = _active_collection_id()
+    fmt = _export_format()
+    if fmt is None:
+        return {"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, 400
+    validators = _collection_validators("chords-export", fmt, collection_id, library=collection_id)
+    if not_modified(*validators):
+        return not_modified_response(*validators)
     groups = load_chord_library(collection_id)
     payload = build_chord_library_export_payload(groups)
     date_str = datetime.now().strftime("%Y-%m-%d")
     filename = f"freetar-chord-library-export-{date_str}.json"
-    resp = app.response_class(
-        response=json.dumps(payload, ensure_ascii=False, indent=2),
-        status=200,
-        mimetype="application/json",
-    )
-    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
-    return resp
+    resp = _export_response(payload, filename, fmt)
+    return set_validators(resp, *validators)
 
 
 @app.route("/my-chords/export-group/<int:group_index>", methods=["GET"])
 def my_chords_export_group(group_index: int):
     collection_id = _active_collection_id()
+    fmt = _export_format()
+    if fmt is None:
+        return {"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, 400
+    validators = _collection_validators("chords-export-group", fmt, collection_id, group_index,
+                                        library=collection_id)
+    if not_modified(*validators):
+        return not_modified_response(*validators)
     groups = load_chord_library(collection_id) or []
     if group_index < 0 or group_index >= len(groups):
         return {"error": "Group not found"}, 404
@@ -525,99 +731,100 @@ def my_chords_export_group(group_index: int):
     date_str = datetime.now().strftime("%Y-%m-%d")
     slug = slugify_name(target.get("group", "group"))
     filename = f"freetar-chord-group-{slug}-export-{date_str}.json"
-    resp = app.response_class(
-        response=json.dumps(payload, ensure_ascii=False, indent=2),
-        status=200,
-        mimetype="application/json",
-    )
-    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
-    return resp
+    resp = _export_response(payload, filename, fmt)
+    return set_validators(resp, *validators)
 
 
-@app.route("/my-chords/import", methods=["POST"])
-def my_chords_import():
-    try:
-        payload = request.get_json(force=True)
-    except Exception as exc:
-        return {"error": "Invalid JSON", "detail": str(exc)}, 400
-
-    if not isinstance(payload, dict):
-        return {"error": "Payload must be an object"}, 400
+def _import_chord_group(grp: dict, final_name: str) -> dict:
+    rows_payload: list[dict] = []
+    for row in grp.get("rows", []):
+        if not isinstance(row, dict):
+            continue
+        chords_payload: list[dict] = []
+        for chord in row.get("chords", []):
+            if not isinstance(chord, dict):
+                continue
+            chords_payload.append(dict(chord))
+        rows_payload.append({"chords": chords_payload})
+    if not rows_payload:
+        rows_payload.append({"chords": []})
+    return {"group": final_name, "rows": rows_payload}
 
-    groups_payload = payload.get("groups")
-    if not isinstance(groups_payload, list):
-        return {"error": "Payload.groups must be a list"}, 400
 
+def _import_chords(reader, progress):
     collection_id = _active_collection_id()
     existing_groups = load_chord_library(collection_id) or []
-    seen_names = {
+    next_group_name = _group_namer(
         grp.get("group", "") for grp in existing_groups if isinstance(grp, dict)
-    }
-
-    def next_group_name(base_name: str) -> str:
-        base = (base_name or "").strip() or "\u00a0"
-        if base not in seen_names:
-            seen_names.add(base)
-            return base
-        suffix = 2
-        while True:
-            candidate = f"{base}-{suffix:02d}"
-            if candidate not in seen_names:
-                seen_names.add(candidate)
-                return candidate
-            suffix += 1
+    )
 
-    new_groups: list[dict] = []
-    for grp in groups_payload:
-        if not isinstance(grp, dict):
+    new_groups: list[dict] | None = None
+    for key in reader.iter_object():
+        if key != "groups":
+            reader.skip()
             continue
-        final_name = next_group_name(grp.get("group", ""))
-        rows_payload: list[dict] = []
-        for row in grp.get("rows", []):
-            if not isinstance(row, dict):
+        if reader.peek_type() != "array":
+            raise imports.InvalidImport("Payload.groups must be a list")
+        new_groups = []
+        for _ in reader.iter_array():
+            grp = reader.value()
+            if not isinstance(grp, dict):
                 continue
-            chords_payload: list[dict] = []
-            for chord in row.get("chords", []):
-                if not isinstance(chord, dict):
-                    continue
-                chords_payload.append(dict(chord))
-            rows_payload.append({"chords": chords_payload})
-        if not rows_payload:
-            rows_payload.append({"chords": []})
-        new_groups.append({"group": final_name, "rows": rows_payload})
+            new_groups.append(_import_chord_group(grp, next_group_name(grp.get("group", ""))))
+            progress.groups += 1
+    reader.end()
+    if new_groups is None:
+        raise imports.InvalidImport("Payload.groups must be a list")
 
     merged_groups = new_groups + existing_groups
-    save_chord_library(merged_groups, collection_id)
+    if not save_chord_library(merged_groups, collection_id):
+        raise imports.SaveFailed("Could not save chords")
     return ("", 204)
 
 
+@app.route("/my-chords/import", methods=["POST"])
+def my_chords_import():
+    return _run_import(_import_chords)
+
+
 @app.route("/my-collections")
 def my_collections():
+    validators = _collection_validators("collections")
+    if not_modified(*validators):
+        return not_modified_response(*validators)
     groups = load_collections()
-    return render_template(
+    body = render_template(
         "my_collections.html",
         groups=groups,
         title="Collections",
     )
+    return set_validators(make_response(body), *validators)
 
 
 @app.route("/my-collections/export", methods=["GET"])
 def my_collections_export():
+    fmt = _export_format()
+    if fmt is None:
+        return {"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, 400
+    validators = _collection_validators("collections-export", fmt, all_libraries=True)
+    if not_modified(*validators):
+        return not_modified_response(*validators)
     groups = load_collections()
     payload = build_collections_export_payload(groups)
     date_str = datetime.now().strftime("%Y-%m-%d")
     filename = f"freetar-chord-collections-export-{date_str}.json"
-    resp = app.response_class(
-        response=json.dumps(payload, ensure_ascii=False, indent=2),
-        status=200,
-        mimetype="application/json",
-    )
-    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
-    return resp
+    resp = _export_response(payload, filename, fmt)
+    return set_validators(resp, *validators)
 
 
 @app.route("/my-collections/export-group/<int:group_index>", methods=["GET"])
 def my_collections_export_group(group_index: int):
+    fmt = _export_format()
+    if fmt is None:
+        return {"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, 400
+    validators = _collection_validators("collections-export-group", fmt, group_index, all_libraries=True)
+    if not_modified(*validators):
+        return not_modified_response(*validators)
     groups = load_collections() or []
     if group_index < 0 or group_index >= len(groups):
         return {"error": "Group not found"}, 404
@@ -626,78 +833,72 @@ def my_collections_export_group(group_index: int):
     date_str = datetime.now().strftime("%Y-%m-%d")
     slug = slugify_name(target.get("group", "group"))
     filename = f"freetar-chord-collection-group-{slug}-export-{date_str}.json"
-    resp = app.response_class(
-        response=json.dumps(payload, ensure_ascii=False, indent=2),
-        status=200,
-        mimetype="application/json",
-    )
-    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
-    return resp
-
-
-@app.route("/my-collections/import", methods=["POST"])
-def my_collections_import():
-    try:
-        payload = request.get_json(force=True)
-    except Exception as exc:
-        return {"error": "Invalid JSON", "detail": str(exc)}, 400
-
-    if not isinstance(payload, dict):
-        return {"error": "Payload must be an object"}, 400
+    resp = _export_response(payload, filename, fmt)
+    return set_validators(resp, *validators)
+
+
+def _import_collection_group(reader, progress, seen_ids: set, batch: dict, written: list):
+    """Read one exported group, queueing each collection's library as it arrives."""
+    name = ""
+    new_collections: list[dict] = []
+    for key in reader.iter_object():
+        if key == "group":
+            name = reader.value()
+            if not isinstance(name, str):
+                name = ""
+        elif key == "collections" and reader.peek_type() == "array":
+            for _ in reader.iter_array():
+                coll = reader.value()
+                if not isinstance(coll, dict):
+                    continue
+                new_id = generate_collection_id(seen_ids)
+                seen_ids.add(new_id)
+                library = coll.get("library")
+                batch[new_id] = library if isinstance(library, list) else []
+                new_collections.append({"id": new_id, "name": coll.get("name", "")})
+                progress.collections += 1
+                if len(batch) >= imports.BATCH_SIZE:
+                    _write_library_batch(batch, progress, written)
+        else:
+            reader.skip()
+    return name, new_collections
 
-    groups_payload = payload.get("groups")
-    if not isinstance(groups_payload, list):
-        return {"error": "Payload.groups must be a list"}, 400
 
+def _import_collections(reader, progress):
     existing_groups = load_collections() or []
-    seen_names = set()
-    for grp in existing_groups:
-        seen_names.add(grp.get("group", ""))
-    seen_ids = {
-        coll.get("id")
-        for grp in existing_groups
-        for coll in grp.get("collections", [])
-        if isinstance(coll, dict) and coll.get("id")
-    }
-
-    def next_group_name(base_name: str) -> str:
-        base = (base_name or "").strip() or "\u00a0"
-        if base not in seen_names:
-            seen_names.add(base)
-            return base
-        suffix = 2
-        while True:
-            candidate = f"{base}-{suffix:02d}"
-            if candidate not in seen_names:
-                seen_names.add(candidate)
-                return candidate
-            suffix += 1
+    next_group_name = _group_namer(grp.get("group", "") for grp in existing_groups)
+    seen_ids = collections_index.ids()
 
-    new_groups: list[dict] = []
-    for grp in groups_payload:
-        if not isinstance(grp, dict):
-            continue
-        final_name = next_group_name(grp.get("group", ""))
-        new_collections: list[dict] = []
-        for coll in grp.get("collections", []):
-            if not isinstance(coll, dict):
+    batch: dict[str, list] = {}
+    written: list[str] = []
+    new_groups: list[dict] | None = None
+    try:
+        for key in reader.iter_object():
+            if key != "groups":
+                reader.skip()
                 continue
-            new_id = generate_collection_id(seen_ids)
-            seen_ids.add(new_id)
-            library = coll.get("library")
-            if not isinstance(library, list):
-                library = []
-            save_chord_library(library, new_id)
-            new_collections.append(
-                {
-                    "id": new_id,
-                    "name": coll.get("name", ""),
-                }
-            )
-        new_groups.append({"group": final_name, "collections": new_collections})
-
-    merged_groups = new_groups + existing_groups
-    save_collections(merged_groups)
+            if reader.peek_type() != "array":
+                raise imports.InvalidImport("Payload.groups must be a list")
+            new_groups = []
+            for _ in reader.iter_array():
+                if reader.peek_type() != "object":
+                    reader.skip()
+                    continue
+                name, new_collections = _import_collection_group(reader, progress, seen_ids, batch, written)
+                new_groups.append({"group": next_group_name(name), "collections": new_collections})
+                progress.groups += 1
+        reader.end()
+        if new_groups is None:
+            raise imports.InvalidImport("Payload.groups must be a list")
+
+        merged_groups = new_groups + existing_groups
+        if not save_collections_and_libraries(merged_groups, batch):
+            raise imports.SaveFailed("Could not save collections")
+    except BaseException:
+        # Earlier batches went in under fresh ids that nothing references yet.
+        _discard_libraries(written)
+        raise
+    progress.libraries_written += len(batch)
     return render_template(
         "my_collections.html",
         groups=merged_groups,
@@ -705,6 +906,11 @@ def my_collections_import():
     )
 
 
+@app.route("/my-collections/import", methods=["POST"])
+def my_collections_import():
+    return _run_import(_import_collections)
+
+
 @app.route("/my-collections/edit", methods=["POST"])
 def my_collections_edit():
     try:
@@ -714,12 +920,7 @@ def my_collections_edit():
     except Exception as exc:
         return {"error": "Invalid JSON", "detail": str(exc)}, 400
 
-    existing_ids = set()
-    for grp in load_collections() or []:
-        for coll in grp.get("collections", []):
-            cid = coll.get("id")
-            if cid:
-                existing_ids.add(cid)
+    existing_ids = collections_index.ids()
 
     incoming_ids = set()
     for grp in payload:
@@ -733,34 +934,29 @@ def my_collections_edit():
                 incoming_ids.add(cid)
 
     new_ids = incoming_ids - existing_ids
-    save_collections(payload)
-    for cid in new_ids:
-        path = chord_lib_path_for(cid)
-        if path.exists():
-            continue
-        save_chord_library(DEFAULT_COLLECTION_LIBRARY, cid)
+    new_libraries = {
+        cid: DEFAULT_COLLECTION_LIBRARY
+        for cid in new_ids
+        if _sanitize_collection_id(cid) and not collections_store.has_library(_sanitize_collection_id(cid))
+    }
+    if not save_collections_and_libraries(payload, new_libraries):
+        return {"error": "Could not save collections"}, 500
     return ("", 204)
 
 
 @app.route("/my-collections/<collection_id>")
 def collection_chords(collection_id):
-    groups = load_collections()
-    found_group = None
-    found_collection = None
-    for grp in groups:
-        for coll in grp.get("collections", []):
-            if coll.get("id") == collection_id:
-                found_group = grp
-                found_collection = coll
-                break
-        if found_collection:
-            break
-    if not found_collection:
+    validators = _collection_validators("collection", collection_id, library=collection_id)
+    if not_modified(*validators):
+        return not_modified_response(*validators)
+    found = collections_index.get(collection_id)
+    if not found:
         return ("", 404)
+    found_group, found_collection = found
 
     raw_groups = load_chord_library(collection_id)
     display_groups = build_chord_view_groups(raw_groups)
-    return render_template(
+    body = render_template(
         "my_chords.html",
         groups=display_groups,
         collection_id=collection_id,
@@ -768,6 +964,7 @@ def collection_chords(collection_id):
         collection_group=found_group.get("group", "") if found_group else "",
         title=found_collection.get("name", ""),
     )
+    return set_validators(make_response(body), *validators)
 
 
 @app.route("/my-collections/<collection_id>/edit", methods=["POST"])
@@ -779,8 +976,67 @@ def collection_chords_edit(collection_id):
     except Exception as exc:
         return {"error": "Invalid JSON", "detail": str(exc)}, 400
 
-    save_chord_library(payload, collection_id)
-    return ("", 204)
+    safe_id = _resolve_collection_id(collection_id)
+    if not safe_id:
+        return {"error": "Could not save chords"}, 500
+    try:
+        revision = collections_store.update_library(safe_id, None, lambda _current: payload)
+    except Exception:
+        logger.exception("Failed to save chord library %s", safe_id)
+        return {"error": "Could not save chords"}, 500
+    response = make_response("", 204)
+    response.headers["X-Library-Revision"] = revision
+    return response
+
+
+@app.route("/my-collections/<collection_id>/patch", methods=["POST"])
+def collection_chords_patch(collection_id):
+    """
+    Apply edit operations (see ``freetar.library_patch``) to the library
+    at revision ``base``. 409 with the current revision if it has moved
+    on; the client then falls back to a full save.
+    """
+    try:
+        payload = request.get_json(force=True)
+    except Exception as exc:
+        return {"error": "Invalid JSON", "detail": str(exc)}, 400
+    if not isinstance(payload, dict) or not isinstance(payload.get("base"), str):
+        return {"error": "Payload must be an object with base and ops"}, 400
+    safe_id = _sanitize_collection_id(collection_id)
+    if not safe_id or collections_index.get(collection_id) is None:
+        return ("", 404)
+
+    ops = payload.get("ops")
+    try:
+        revision = collections_store.update_library(
+            safe_id, payload["base"], lambda current: apply_patch(current, ops)
+        )
+    except RevisionConflict as exc:
+        return {"error": "conflict", "revision": exc.revision}, 409
+    except PatchError as exc:
+        return {"error": "Invalid patch", "detail": str(exc)}, 400
+    except Exception:
+        logger.exception("Failed to patch chord library %s", safe_id)
+        return {"error": "Could not save chords"}, 500
+    return {"revision": revision}
+
+
+@app.route("/metrics")
+def metrics():
+    return {
+        "upstream": upstream.stats(),
+        "data_cache": data_cache.stats(),
+        "negative_cache": negative_cache.stats(),
+        "singleflight": flights.stats(),
+        "page_cache": page_cache.stats(),
+        "chord_memo": chord_memo_stats(),
+        "parse_pool": parsepool.stats(),
+        "prefetch": prefetcher.stats(),
+        "collections_index": collections_index.stats(),
+        "imports": imports.tracker.stats(),
+        "write_behind": (collections_store.stats()
+                         if isinstance(collections_store, writebehind.WriteBehindStore) else None),
+    }
 
 
 @app.errorhandler(403)
@@ -800,6 +1056,21 @@ def main(host=None, port=None):
     host = host or os.environ.get("FREETAR_HOST", "127.0.0.1")
     port = int(port or os.environ.get("FREETAR_PORT", "22000"))
     threads = int(os.environ.get("THREADS", "4"))
+    upstream.configure(pool_maxsize=int(os.environ.get("FREETAR_UPSTREAM_POOL_SIZE", threads)))
+    warmed = data_cache.warm(int(os.environ.get("FREETAR_CACHE_WARM", "500")))
+    if warmed:
+        print(f"Warmed {warmed} cached tabs/searches from disk")
+
+    workers = int(os.environ.get("FREETAR_WORKERS", "1"))
+    if workers > 1 and prefork.supported():
+        if data_cache.store is None:
+            logger.warning("FREETAR_CACHE_DB is disabled, workers will not share cached tabs")
+        if isinstance(collections_store, writebehind.WriteBehindStore):
+            # The journal is per process; workers write straight to storage.
+            collections_store.close()
+        print(f"Running backend on {host}:{port} with {workers} workers x {threads} threads")
+        prefork.serve(app, host=host, port=port, workers=workers, threads=threads)
+        return
 
     print(f"Running backend on {host}:{port} with {threads} threads")
     waitress.serve(app, host=host, port=port, threads=threads)
@@ -0,0 +1,92 @@
+"""
+Process-wide index of the collections metadata.
+
+The parsed metadata and an id -> (group, collection) map are kept in memory
+and only rebuilt when the stored metadata changes: either through
+``replace`` after this process writes it, or when the storage version
+token no longer matches (another process or a manual edit). A lookup costs
+a version check (a ``stat`` or one indexed row) instead of a read and a
+full JSON parse.
+"""
+import re
+import threading
+
+
+def _sanitize(collection_id) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]+", "", str(collection_id or ""))
+
+
+class CollectionsIndex:
+    def __init__(self, loader, version):
+        """
+        ``loader()`` reads and validates the metadata, returning the group
+        list; ``version()`` returns a token that changes on every write.
+        """
+        self.loader = loader
+        self.version = version
+        self._lock = threading.RLock()
+        self._version = None
+        # (groups, id -> (group, collection), first id), swapped as a whole
+        self._state: tuple[list, dict, str | None] = ([], {}, None)
+        self._reloads = 0
+
+    def _build(self, groups: list):
+        by_id = {}
+        first_id = None
+        for grp in groups:
+            if not isinstance(grp, dict):
+                continue
+            for coll in grp.get("collections", []):
+                if not isinstance(coll, dict):
+                    continue
+                cid = coll.get("id")
+                if cid and cid not in by_id:
+                    by_id[cid] = (grp, coll)
+                    if first_id is None and _sanitize(cid):
+                        first_id = _sanitize(cid)
+        self._state = (groups, by_id, first_id)
+
+    def _ensure(self):
+        version = self.version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            groups = self.loader()
+            self._reloads += 1
+            self._build(groups)
+            # Version as seen before reading: a write racing the load only
+            # costs one more reload.
+            self._version = version
+
+    def replace(self, groups: list):
+        """Record metadata this process has just written to the file."""
+        with self._lock:
+            self._build(groups)
+            self._version = self.version()
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+
+    def groups(self) -> list:
+        """All groups. Shared with other requests: treat as read-only."""
+        self._ensure()
+        return self._state[0]
+
+    def get(self, collection_id) -> tuple[dict, dict] | None:
+        """``(group, collection)`` for an id, or None."""
+        self._ensure()
+        return self._state[1].get(collection_id)
+
+    def ids(self) -> set[str]:
+        self._ensure()
+        return set(self._state[1])
+
+    def first_id(self) -> str | None:
+        self._ensure()
+        return self._state[2]
+
+    def stats(self) -> dict:
+        return {"reloads": self._reloads, "collections": len(self._state[1])}
@@ -0,0 +1,411 @@
+"""
+Storage engines for collections metadata and per-collection chord libraries.
+
+``FREETAR_COLLECTIONS_STORE`` picks the engine:
+
+* ``json`` (default) - ``my_chord_collections.json`` plus one
+  ``collections/<id>.json`` per collection, as before
+* ``sqlite`` - one WAL-mode database (``FREETAR_COLLECTIONS_DB``) with a row
+  per collection, so writes that touch several collections are a single
+  transaction and readers never block on the writer. An empty database is
+  filled from the JSON files on first open; the files are left in place.
+
+Both engines raise on write errors; callers decide how to report them.
+Every document has a cheap version token for conditional GETs and the
+collections index; ``update_library`` uses the library's token as the
+revision for optimistic concurrency.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .conditional import file_version
+
+logger = logging.getLogger(__name__)
+
+STORE_KIND = os.environ.get("FREETAR_COLLECTIONS_STORE", "json")
+DEFAULT_DB_PATH = Path(__file__).with_name("collections.sqlite3")
+
+
+def fsync_dir(path: Path):
+    """Make a rename or unlink in ``path`` durable (no-op where unsupported)."""
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _stat_key(st: os.stat_result) -> tuple:
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=12).hexdigest()
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+class RevisionConflict(Exception):
+    """The stored library is no longer at the revision an edit was based on."""
+
+    def __init__(self, revision: str):
+        super().__init__(f"Library is at revision {revision}")
+        self.revision = revision
+
+
+class JSONCollectionsStore:
+    kind = "json"
+
+    def __init__(self, metadata_path: Path, chords_dir: Path):
+        self.metadata_path = metadata_path
+        self.chords_dir = chords_dir
+        self._update_lock = threading.Lock()
+        # path -> (stat key, content hash), so revisions only re-read changed files
+        self._hashes: dict[Path, tuple[tuple, str]] = {}
+
+    def _library_path(self, collection_id: str) -> Path:
+        return self.chords_dir / f"{collection_id}.json"
+
+    @staticmethod
+    def _read(path: Path):
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def _write(self, path: Path, data):
+        # Write a temporary file and rename it over the old one, so a crash
+        # leaves either the old or the new document, never a torn one.
+        raw = json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with tmp.open("wb") as fh:
+                fh.write(raw)
+                fh.flush()
+                os.fsync(fh.fileno())
+                key = _stat_key(os.fstat(fh.fileno()))
+            os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        self._hashes[path] = (key, _content_hash(raw))
+        fsync_dir(path.parent)
+
+    def _revision(self, path: Path, fresh: bool = False) -> str:
+        """
+        Content hash of a document, or "-" if it is missing. Remembered per
+        (mtime, size, inode), so an unchanged file is only stat'ed; ``fresh``
+        always reads it.
+        """
+        try:
+            key = _stat_key(path.stat())
+            known = self._hashes.get(path)
+            if not fresh and known is not None and known[0] == key:
+                return known[1]
+            data = path.read_bytes()
+        except OSError:
+            return "-"
+        revision = _content_hash(data)
+        self._hashes[path] = (key, revision)
+        return revision
+
+    def read_metadata(self):
+        """Parsed metadata, or None if there is none yet."""
+        return self._read(self.metadata_path)
+
+    def write_metadata(self, groups: list):
+        self._write(self.metadata_path, groups)
+
+    def read_library(self, collection_id: str):
+        return self._read(self._library_path(collection_id))
+
+    def read_libraries(self, collection_ids) -> dict:
+        """``{id: library}`` for the ids that have a library."""
+        libraries = {}
+        for cid in collection_ids:
+            try:
+                data = self.read_library(cid)
+            except (OSError, ValueError) as exc:
+                logger.warning("Failed to load chord library %s: %s", cid, exc)
+                continue
+            if data is not None:
+                libraries[cid] = data
+        return libraries
+
+    def write_library(self, collection_id: str, groups: list):
+        self.chords_dir.mkdir(exist_ok=True)
+        self._write(self._library_path(collection_id), groups)
+
+    def write_many(self, metadata: list | None = None, libraries: dict | None = None,
+                   renames: dict | None = None):
+        """
+        Move libraries (``{from id: to id}``), write libraries, then metadata
+        (not atomic for this engine).
+        """
+        if renames:
+            for source, target in renames.items():
+                os.replace(self._library_path(source), self._library_path(target))
+            fsync_dir(self.chords_dir)
+        for cid, groups in (libraries or {}).items():
+            self.write_library(cid, groups)
+        if metadata is not None:
+            self.write_metadata(metadata)
+
+    def delete_libraries(self, collection_ids):
+        for cid in collection_ids:
+            self._library_path(cid).unlink(missing_ok=True)
+        fsync_dir(self.chords_dir)
+
+    def update_library(self, collection_id: str, base: str | None, update) -> str:
+        """
+        Replace the library with ``update(current)`` if it is still at
+        revision ``base`` (None skips the check); return the new revision.
+        Only serialised within this process.
+        """
+        path = self._library_path(collection_id)
+        with self._update_lock:
+            # Hash what is on disk now: another process may have rewritten
+            # the file in place with the same mtime and size.
+            revision = self._revision(path, fresh=True)
+            if base is not None and base != revision:
+                raise RevisionConflict(revision)
+            self.write_library(collection_id, update(self.read_library(collection_id) or []))
+            return self._revision(path)
+
+    def has_library(self, collection_id: str) -> bool:
+        return self._library_path(collection_id).exists()
+
+    def library_ids(self) -> list[str]:
+        try:
+            return sorted(p.stem for p in self.chords_dir.iterdir() if p.suffix == ".json")
+        except OSError:
+            return []
+
+    def metadata_version(self) -> tuple[str, float]:
+        """
+        ``(token, modified timestamp)``. The token is a cheap stat-based check
+        (mtime and size) for the collections index and conditional GETs.
+        """
+        return file_version(self.metadata_path), _mtime(self.metadata_path)
+
+    def library_version(self, collection_id: str) -> tuple[str, float]:
+        """
+        ``(revision, modified timestamp)``. The revision is a content hash, as
+        it guards ``update_library``: two quick or same-sized writes must never
+        share one. It is only recomputed when the file's stat changes.
+        """
+        path = self._library_path(collection_id)
+        return self._revision(path), _mtime(path)
+
+    def libraries_version(self) -> tuple[str, float]:
+        """Stat-based, like ``metadata_version``: a validator, not a revision."""
+        paths = [self._library_path(cid) for cid in self.library_ids()]
+        token = ",".join(f"{p.stem}={file_version(p)}" for p in paths)
+        return token, max((_mtime(p) for p in paths), default=0.0)
+
+
+class SQLiteCollectionsStore:
+    """
+    Collections in SQLite. One connection per thread; WAL mode so readers
+    do not block the writer. Documents are stored as compact JSON with a
+    revision drawn from a single counter, so versions never repeat.
+    """
+
+    kind = "sqlite"
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._inherited = []
+        self._connect()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # Never use a parent's connection in a forked child.
+        self._inherited.append(self._local)
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " kind TEXT NOT NULL,"
+                " id TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " revision INTEGER NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (kind, id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS documents_revision ON documents (kind, revision)")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _dumps(data) -> str:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+    def _get(self, kind: str, doc_id: str):
+        row = self._connect().execute(
+            "SELECT data FROM documents WHERE kind = ? AND id = ?", (kind, doc_id)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _put(self, conn, kind: str, doc_id: str, data):
+        conn.execute(
+            "INSERT OR REPLACE INTO documents (kind, id, data, revision, updated_at)"
+            " VALUES (?, ?, ?, (SELECT COALESCE(MAX(revision), 0) + 1 FROM documents), ?)",
+            (kind, doc_id, self._dumps(data), time.time()),
+        )
+
+    def read_metadata(self):
+        return self._get("metadata", "")
+
+    def write_metadata(self, groups: list):
+        self.write_many(metadata=groups)
+
+    def read_library(self, collection_id: str):
+        return self._get("library", collection_id)
+
+    def read_libraries(self, collection_ids) -> dict:
+        ids = list(dict.fromkeys(collection_ids))
+        libraries = {}
+        # Stay below SQLite's bound-parameter limit.
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = self._connect().execute(
+                "SELECT id, data FROM documents WHERE kind = 'library'"
+                f" AND id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            libraries.update((cid, json.loads(data)) for cid, data in rows)
+        return libraries
+
+    def write_library(self, collection_id: str, groups: list):
+        self.write_many(libraries={collection_id: groups})
+
+    def write_many(self, metadata: list | None = None, libraries: dict | None = None,
+                   renames: dict | None = None):
+        """Move libraries, write metadata and any number of libraries in one transaction."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for source, target in (renames or {}).items():
+                conn.execute("DELETE FROM documents WHERE kind = 'library' AND id = ?", (target,))
+                conn.execute(
+                    "UPDATE documents SET id = ?, updated_at = ?,"
+                    " revision = (SELECT COALESCE(MAX(revision), 0) + 1 FROM documents)"
+                    " WHERE kind = 'library' AND id = ?",
+                    (target, time.time(), source),
+                )
+            for cid, groups in (libraries or {}).items():
+                self._put(conn, "library", cid, groups)
+            if metadata is not None:
+                self._put(conn, "metadata", "", metadata)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def delete_libraries(self, collection_ids):
+        ids = list(collection_ids)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("DELETE FROM documents WHERE kind = 'library' AND id = ?", ((cid,) for cid in ids))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def update_library(self, collection_id: str, base: str | None, update) -> str:
+        """Read-check-write of one library in a single write transaction."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            revision = self.library_version(collection_id)[0]
+            if base is not None and base != revision:
+                raise RevisionConflict(revision)
+            self._put(conn, "library", collection_id, update(self.read_library(collection_id) or []))
+            revision = self.library_version(collection_id)[0]
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return revision
+
+    def has_library(self, collection_id: str) -> bool:
+        return self._connect().execute(
+            "SELECT 1 FROM documents WHERE kind = 'library' AND id = ?", (collection_id,)
+        ).fetchone() is not None
+
+    def library_ids(self) -> list[str]:
+        rows = self._connect().execute("SELECT id FROM documents WHERE kind = 'library' ORDER BY id")
+        return [row[0] for row in rows]
+
+    def _version(self, where: str, params=()) -> tuple[str, float]:
+        count, revision, updated_at = self._connect().execute(
+            f"SELECT COUNT(*), MAX(revision), MAX(updated_at) FROM documents WHERE {where}", params
+        ).fetchone()
+        return f"{count}.{revision or 0}", updated_at or 0.0
+
+    def metadata_version(self) -> tuple[str, float]:
+        return self._version("kind = 'metadata'")
+
+    def library_version(self, collection_id: str) -> tuple[str, float]:
+        return self._version("kind = 'library' AND id = ?", (collection_id,))
+
+    def libraries_version(self) -> tuple[str, float]:
+        return self._version("kind = 'library'")
+
+    def is_empty(self) -> bool:
+        return self._connect().execute("SELECT 1 FROM documents LIMIT 1").fetchone() is None
+
+
+def migrate(source: JSONCollectionsStore, target) -> int:
+    """Copy all metadata and libraries from ``source`` into ``target`` in one write."""
+    metadata = source.read_metadata()
+    libraries = {}
+    for cid in source.library_ids():
+        try:
+            data = source.read_library(cid)
+        except (OSError, ValueError) as exc:
+            logger.warning("Skipping unreadable chord library %s: %s", cid, exc)
+            continue
+        if isinstance(data, list):
+            libraries[cid] = data
+    target.write_many(metadata=metadata if isinstance(metadata, list) else None, libraries=libraries)
+    return len(libraries)
+
+
+def open_store(metadata_path: Path, chords_dir: Path, kind: str = STORE_KIND):
+    json_store = JSONCollectionsStore(metadata_path, chords_dir)
+    if kind == "json":
+        return json_store
+    if kind != "sqlite":
+        raise ValueError(f"Unsupported FREETAR_COLLECTIONS_STORE value: {kind!r}")
+    store = SQLiteCollectionsStore(os.environ.get("FREETAR_COLLECTIONS_DB", str(DEFAULT_DB_PATH)))
+    if store.is_empty() and metadata_path.exists():
+        count = migrate(json_store, store)
+        logger.warning("Migrated collections metadata and %d chord libraries from JSON to %s",
+                       count, store.path)
+    return store
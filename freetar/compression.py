@@ -0,0 +1,126 @@
+"""
+gzip/brotli compression of dynamic responses.
+
+Runs as the last after_request hook, i.e. after flask-minify. Pages served
+from the page cache keep each encoded body next to their cache entry, so a
+page is compressed once per version instead of on every hit. Streamed
+responses (exports) are compressed chunk by chunk as they are sent.
+"""
+import gzip
+import os
+import zlib
+
+from flask import g, request
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+ENABLED = os.environ.get("FREETAR_COMPRESS", "1") == "1"
+GZIP_LEVEL = int(os.environ.get("FREETAR_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("FREETAR_BROTLI_QUALITY", "5"))
+MIN_SIZE = int(os.environ.get("FREETAR_COMPRESS_MIN_SIZE", "1024"))
+
+COMPRESSIBLE = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/csv",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+}
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """The ETag of ``etag``'s representation in ``encoding``."""
+    return f"{etag}-{encoding}"
+
+
+def choose_encoding() -> str | None:
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(chunks, encoding: str):
+    """Compress an iterable of bytes incrementally, flushing after each chunk."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _mark_encoded(response, encoding: str):
+    response.headers["Content-Encoding"] = encoding
+    if response.headers.get("ETag"):
+        # Each encoding is a different representation.
+        etag, weak = response.get_etag()
+        response.set_etag(encoded_etag(etag, encoding), weak=weak)
+
+
+def init_app(app, page_cache):
+    """Register the hook; call before any other after_request extension."""
+    if not ENABLED:
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE
+            or "no-transform" in response.headers.get("Cache-Control", "")
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = choose_encoding()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+            _mark_encoded(response, encoding)
+            return response
+
+        cached = g.get("page_cache_entry")
+        data = None
+        if cached is not None:
+            data = cached[1].get("variants", {}).get(encoding)
+        if data is None:
+            body = response.get_data()
+            if len(body) < MIN_SIZE:
+                return response
+            data = compress(body, encoding)
+            if len(data) >= len(body):
+                return response
+            if cached is not None:
+                key, entry = cached
+                page_cache.add_variant(key, entry["stored_at"], encoding, data)
+
+        response.set_data(data)
+        _mark_encoded(response, encoding)
+        return response
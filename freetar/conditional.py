@@ -0,0 +1,66 @@
+"""
+Conditional GET helpers.
+
+Views compute a cheap validator (an ETag from file versions or cache entry
+timestamps, optionally a Last-Modified date) and call ``not_modified``
+before doing any rendering or serialization, so a revalidating client gets
+a 304 without the server building the body.
+"""
+import hashlib
+from datetime import datetime, timezone
+
+from flask import make_response, request
+from werkzeug.http import is_resource_modified
+
+from .compression import encoded_etag
+
+ENCODINGS = ("gzip", "br")
+
+
+def make_etag(*parts) -> str:
+    return hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:24]
+
+
+def file_version(path) -> str:
+    """Cheap version string for a file: mtime and size, or "-" if missing."""
+    try:
+        st = path.stat()
+    except OSError:
+        return "-"
+    return f"{st.st_mtime_ns:x}.{st.st_size:x}"
+
+
+def mtime(path) -> datetime | None:
+    try:
+        return datetime.fromtimestamp(int(path.stat().st_mtime), tz=timezone.utc)
+    except OSError:
+        return None
+
+
+def _representations(etag: str):
+    # A client may hold any encoded representation of the resource.
+    return (etag, *(encoded_etag(etag, enc) for enc in ENCODINGS))
+
+
+def not_modified(etag: str, last_modified: datetime | None = None) -> bool:
+    return any(not is_resource_modified(request.environ, etag=tag, last_modified=last_modified)
+               for tag in _representations(etag))
+
+
+def set_validators(response, etag: str, last_modified: datetime | None = None,
+                   cache_control: str = "private, no-cache"):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    if cache_control:
+        response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def not_modified_response(etag: str, last_modified: datetime | None = None,
+                          cache_control: str = "private, no-cache"):
+    response = make_response("", 304)
+    response.vary.add("Accept-Encoding")
+    # Echo the representation the client revalidated.
+    held = next((tag for tag in _representations(etag) if tag in request.if_none_match), etag)
+    return set_validators(response, held, last_modified, cache_control)
@@ -0,0 +1,252 @@
+"""
+Cache for parsed upstream data (``TabEntry`` and ``Search`` objects).
+
+An in-memory ``SimpleCache`` is the hot layer. Behind it sits an optional
+SQLite store so parsed tabs and searches survive restarts and deploys; a
+fresh process can be warmed from it without talking to Ultimate Guitar.
+"""
+import contextlib
+import contextvars
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import requests
+from cachelib import SimpleCache
+
+from .singleflight import SingleFlight
+from .store import SQLiteStore
+from .ug import Search, TabEntry, tab_url_path, ug_tab
+from .utils import FreetarError
+
+logger = logging.getLogger(__name__)
+
+# Bump when the pickled classes change shape so old rows are ignored.
+KEY_PREFIX = "v3:"
+TAB_TTL = int(os.environ.get("FREETAR_TAB_TTL", str(30 * 24 * 3600)))
+SEARCH_TTL = int(os.environ.get("FREETAR_SEARCH_TTL", str(24 * 3600)))
+MEMORY_THRESHOLD = int(os.environ.get("FREETAR_DATA_CACHE_SIZE", "2000"))
+NEGATIVE_TTL = int(os.environ.get("FREETAR_NEGATIVE_TTL", "300"))
+NEGATIVE_THRESHOLD = int(os.environ.get("FREETAR_NEGATIVE_CACHE_SIZE", "5000"))
+DEFAULT_DB_PATH = Path(__file__).with_name("ug_cache.sqlite3")
+STORE_MAX_ENTRIES = int(os.environ.get("FREETAR_CACHE_DB_MAX_ENTRIES", "50000"))
+STORE_MAX_BYTES = int(os.environ.get("FREETAR_CACHE_DB_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+class TieredCache:
+    def __init__(self, store: SQLiteStore | None = None, threshold: int = MEMORY_THRESHOLD):
+        self.memory = SimpleCache(threshold=threshold, default_timeout=0)
+        self.store = store
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "store_hits": 0, "misses": 0, "sets": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key: str):
+        key = KEY_PREFIX + key
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.store is not None:
+            value, expires_at = self.store.get_with_expiry(key)
+            if value is not None:
+                self._count("store_hits")
+                self._promote(key, value, expires_at)
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value, timeout: int = 0):
+        key = KEY_PREFIX + key
+        self._count("sets")
+        self.memory.set(key, value, timeout=timeout)
+        if self.store is not None:
+            self.store.set(key, value, timeout)
+
+    def delete(self, key: str):
+        key = KEY_PREFIX + key
+        self.memory.delete(key)
+        if self.store is not None:
+            self.store.delete(key)
+
+    def _promote(self, key: str, value, expires_at: float):
+        remaining = 0
+        if expires_at:
+            remaining = max(1, int(expires_at - time.time()))
+        self.memory.set(key, value, timeout=remaining)
+
+    def warm(self, limit: int) -> int:
+        """Load up to ``limit`` of the newest stored entries into memory."""
+        if self.store is None or limit <= 0:
+            return 0
+        loaded = 0
+        for key, value, expires_at in self.store.recent(limit):
+            if not key.startswith(KEY_PREFIX):
+                continue
+            self._promote(key, value, expires_at)
+            loaded += 1
+        return loaded
+
+    def stats(self) -> dict:
+        with self._lock:
+            values = dict(self._stats)
+        values["persistent"] = self.store is not None
+        if self.store is not None:
+            values["store_evicted"] = self.store.evicted
+        return values
+
+
+class NegativeCache:
+    """
+    Short-lived record of lookups that failed for good (404, no results,
+    unparsable page). Kept apart from the positive entries so a crawler
+    hammering bad URLs can never evict real tabs.
+    """
+
+    def __init__(self, ttl: int = NEGATIVE_TTL, threshold: int = NEGATIVE_THRESHOLD):
+        self.ttl = ttl
+        self.memory = SimpleCache(threshold=threshold, default_timeout=ttl)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "stores": 0}
+
+    def check(self, key: str):
+        """Raise the remembered FreetarError for ``key``, if any."""
+        if self.ttl <= 0:
+            return
+        message = self.memory.get(key)
+        if message is not None:
+            with self._lock:
+                self._stats["hits"] += 1
+            raise FreetarError(message)
+
+    def remember(self, key: str, exc: FreetarError):
+        if self.ttl <= 0 or not is_permanent_failure(exc):
+            return
+        self.memory.set(key, str(exc))
+        with self._lock:
+            self._stats["stores"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            values = dict(self._stats)
+        values["ttl"] = self.ttl
+        return values
+
+
+def is_permanent_failure(exc: FreetarError) -> bool:
+    """
+    A 404/410 from UG or a page we could not parse. Timeouts, 5xx and an
+    open circuit breaker are transient and are not remembered.
+    """
+    cause = exc.__cause__ or exc.__context__
+    if isinstance(cause, requests.exceptions.HTTPError):
+        return cause.response is not None and cause.response.status_code in (404, 410)
+    return isinstance(cause, (KeyError, ValueError, AttributeError)) and not isinstance(
+        cause, requests.exceptions.RequestException)
+
+
+def _open_store() -> SQLiteStore | None:
+    path = os.environ.get("FREETAR_CACHE_DB", str(DEFAULT_DB_PATH))
+    if not path:
+        return None
+    try:
+        store = SQLiteStore(path, max_entries=STORE_MAX_ENTRIES, max_bytes=STORE_MAX_BYTES)
+        store.purge_expired()
+        return store
+    except Exception as exc:
+        logger.warning("Persistent cache at %s unavailable, using memory only: %s", path, exc)
+        return None
+
+
+data_cache = TieredCache(_open_store())
+negative_cache = NegativeCache()
+# Concurrent misses for the same tab or search share one upstream fetch.
+flights = SingleFlight()
+_bypass = contextvars.ContextVar("freetar_bypass_data_cache", default=False)
+
+
+@contextlib.contextmanager
+def bypass_data_cache():
+    """Fetch from upstream (and overwrite the cached copy) inside this block."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def _remembering_failures(key: str, fetch):
+    try:
+        return fetch()
+    except FreetarError as exc:
+        negative_cache.remember(key, exc)
+        raise
+
+
+def _cached_fetch(key: str, ttl: int, fetch):
+    refresh = _bypass.get()
+    value = None if refresh else data_cache.get(key)
+    if value is not None:
+        return value
+    if not refresh:
+        negative_cache.check(key)
+
+    def fill():
+        # Another flight may have finished between our miss and now.
+        value = None if refresh else data_cache.get(key)
+        if value is None:
+            value = _remembering_failures(key, fetch)
+            data_cache.set(key, value, ttl)
+        return value
+
+    return flights.do(key, fill)
+
+
+def get_tab(url_path: str) -> TabEntry:
+    """
+    Return the parsed tab for either URL form. Entries are stored once under
+    the canonical UG tab id; each requested path is an alias pointing at it.
+    """
+    url_path = str(url_path)
+    key = f"tab:{url_path}"
+    refresh = _bypass.get()
+    entry = None if refresh else _cached_tab(url_path)
+    if entry is not None:
+        return entry
+    if not refresh:
+        negative_cache.check(key)
+
+    def fill():
+        entry = None if refresh else _cached_tab(url_path)
+        if entry is None:
+            entry = _remembering_failures(key, lambda: _fetch_tab(url_path))
+        return entry
+
+    return flights.do(key, fill)
+
+
+def _cached_tab(url_path: str) -> TabEntry | None:
+    canonical = data_cache.get(f"tab-alias:{url_path}")
+    if canonical is None:
+        return None
+    return data_cache.get(f"tab:{canonical}")
+
+
+def _fetch_tab(url_path: str) -> TabEntry:
+    entry = ug_tab(url_path)
+    canonical = entry.canonical_key
+    data_cache.set(f"tab:{canonical}", entry, TAB_TTL)
+    aliases = {url_path, canonical, tab_url_path(entry.tab_url)}
+    for alias in aliases:
+        if alias:
+            data_cache.set(f"tab-alias:{alias}", canonical, TAB_TTL)
+    return entry
+
+
+def get_search(value: str, page: int):
+    return _cached_fetch(f"search:{page}:{value}", SEARCH_TTL, lambda: Search(value, page))
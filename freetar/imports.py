@@ -0,0 +1,116 @@
+"""
+Limits and progress for streaming imports.
+
+Uploads are read through ``jsonstream.StreamReader`` with a size limit
+(``FREETAR_IMPORT_MAX_BYTES``) and libraries are written in batches of
+``FREETAR_IMPORT_BATCH``. A client that sends an ``X-Import-Id`` header can
+poll ``/import-progress/<id>`` while the upload is processed; progress lives
+in the process that handles the import.
+"""
+import logging
+import os
+import re
+import threading
+import time
+
+from .jsonstream import PayloadTooLarge, StreamReader
+
+logger = logging.getLogger(__name__)
+
+MAX_BYTES = int(os.environ.get("FREETAR_IMPORT_MAX_BYTES", str(64 * 1024 * 1024)))
+BATCH_SIZE = int(os.environ.get("FREETAR_IMPORT_BATCH", "50"))
+# Finished imports stay visible to pollers for this long.
+KEEP_SECONDS = 300
+
+
+class InvalidImport(ValueError):
+    """The payload is well-formed JSON but not a valid import (HTTP 400)."""
+
+
+class SaveFailed(Exception):
+    """Storage rejected a write during an import (HTTP 500)."""
+
+
+class ImportProgress:
+    def __init__(self, import_id: str | None, total_bytes: int | None):
+        self.import_id = import_id
+        self.total_bytes = total_bytes
+        self.bytes_read = 0
+        self.groups = 0
+        self.collections = 0
+        self.libraries_written = 0
+        self.state = "running"
+        self.error = None
+        self.finished_at = None
+
+    def as_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "bytes_read": self.bytes_read,
+            "total_bytes": self.total_bytes,
+            "groups": self.groups,
+            "collections": self.collections,
+            "libraries_written": self.libraries_written,
+            "error": self.error,
+        }
+
+
+class ImportTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._imports: dict[str, ImportProgress] = {}
+        self._stats = {"started": 0, "completed": 0, "failed": 0, "too_large": 0}
+
+    def start(self, import_id: str | None, total_bytes: int | None) -> ImportProgress:
+        import_id = re.sub(r"[^A-Za-z0-9_-]+", "", import_id or "")[:64] or None
+        progress = ImportProgress(import_id, total_bytes)
+        with self._lock:
+            self._stats["started"] += 1
+            self._expire()
+            if import_id:
+                self._imports[import_id] = progress
+        return progress
+
+    def finish(self, progress: ImportProgress, error: str | None = None, too_large: bool = False):
+        progress.state = "failed" if error else "done"
+        progress.error = error
+        progress.finished_at = time.monotonic()
+        with self._lock:
+            self._stats["failed" if error else "completed"] += 1
+            if too_large:
+                self._stats["too_large"] += 1
+        logger.info("Import %s %s: %d groups, %d collections, %d bytes", progress.import_id or "-",
+                    progress.state, progress.groups, progress.collections, progress.bytes_read)
+
+    def _expire(self):
+        now = time.monotonic()
+        for key, progress in list(self._imports.items()):
+            if progress.finished_at is not None and now - progress.finished_at > KEEP_SECONDS:
+                del self._imports[key]
+
+    def get(self, import_id: str) -> ImportProgress | None:
+        with self._lock:
+            return self._imports.get(import_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            running = sum(1 for p in self._imports.values() if p.state == "running")
+        return {**self._stats, "running": running}
+
+
+tracker = ImportTracker()
+
+
+def open_reader(request, progress: ImportProgress, limit: int | None = None) -> StreamReader:
+    """
+    A reader over the request body, or ``PayloadTooLarge`` if it declares more
+    than ``limit`` (``MAX_BYTES`` by default).
+    """
+    limit = MAX_BYTES if limit is None else limit
+    if request.content_length is not None and request.content_length > limit:
+        raise PayloadTooLarge(f"Payload exceeds {limit} bytes")
+
+    def on_read(count):
+        progress.bytes_read = count
+
+    return StreamReader(request.stream, limit=limit, on_read=on_read)
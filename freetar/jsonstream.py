@@ -0,0 +1,264 @@
+"""
+Incremental JSON encoding for large exports.
+
+``iterencode`` walks dicts and lists itself and yields text as it goes, so
+a payload can hold lazy parts that are only produced while the response
+is being sent:
+
+* a callable is called and its result encoded in one go (e.g. a chord
+  library loaded from storage)
+* an iterator is encoded as a list, one item at a time
+
+With ``indent=2`` the output is identical to ``json.dumps(..., indent=2)``
+of the fully built payload; with ``indent=None`` it is compact.
+``sort_keys`` and ``ensure_ascii`` work as for ``json.dumps``.
+
+``StreamReader`` is the other direction: it pulls a large upload apart one
+member or item at a time, so only the value being handled is in memory.
+"""
+import codecs
+import json
+import time
+import zipfile
+from collections.abc import Iterator
+
+CHUNK_SIZE = 64 * 1024
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+
+
+def _dumps(value, indent: int | None, level: int, sort_keys: bool, ensure_ascii: bool) -> str:
+    if indent is None:
+        return json.dumps(value, ensure_ascii=ensure_ascii, sort_keys=sort_keys, separators=(",", ":"))
+    text = json.dumps(value, ensure_ascii=ensure_ascii, sort_keys=sort_keys, indent=indent)
+    # Encoded strings never contain a raw newline, so this only re-indents structure.
+    return text.replace("\n", "\n" + " " * (indent * level)) if level else text
+
+
+def iterencode(value, indent: int | None = None, sort_keys: bool = False, ensure_ascii: bool = False,
+               _level: int = 0):
+    if callable(value):
+        yield _dumps(value(), indent, _level, sort_keys, ensure_ascii)
+        return
+    if isinstance(value, dict):
+        items, opening, closing = value.items(), "{", "}"
+        if sort_keys:
+            items = sorted(items)
+    elif isinstance(value, (list, tuple, Iterator)):
+        items, opening, closing = ((None, item) for item in value), "[", "]"
+    else:
+        yield _dumps(value, indent, _level, sort_keys, ensure_ascii)
+        return
+
+    inner = "" if indent is None else "\n" + " " * (indent * (_level + 1))
+    colon = ":" if indent is None else ": "
+    empty = True
+    for key, item in items:
+        prefix = opening if empty else ","
+        empty = False
+        yield prefix + inner + ("" if key is None else json.dumps(str(key), ensure_ascii=ensure_ascii) + colon)
+        yield from iterencode(item, indent, sort_keys, ensure_ascii, _level + 1)
+    if empty:
+        yield opening + closing
+    else:
+        yield ("" if indent is None else "\n" + " " * (indent * _level)) + closing
+
+
+def chunked(parts, size: int = CHUNK_SIZE):
+    """Join small text parts into UTF-8 chunks of about ``size`` bytes."""
+    buffer = []
+    buffered = 0
+    for part in parts:
+        data = part.encode("utf-8")
+        buffer.append(data)
+        buffered += len(data)
+        if buffered >= size:
+            yield b"".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+class _Sink:
+    """Write-only file object collecting what ``zipfile`` writes."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def zipped(member_name: str, chunks, compresslevel: int = 6):
+    """Stream a zip archive holding one member made of ``chunks`` (bytes)."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as archive:
+        info = zipfile.ZipInfo(member_name, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with archive.open(info, "w") as member:
+            for chunk in chunks:
+                member.write(chunk)
+                data = sink.take()
+                if data:
+                    yield data
+    yield sink.take()
+
+
+class PayloadTooLarge(ValueError):
+    pass
+
+
+class StreamReader:
+    """
+    Pull parser over a binary stream. Containers are walked with
+    ``iter_object``/``iter_array``; each key or item they yield must be
+    consumed (``value``, ``skip`` or a nested iteration) before advancing.
+
+        for key in reader.iter_object():
+            if key == "groups":
+                for _ in reader.iter_array():
+                    handle(reader.value())
+            else:
+                reader.skip()
+
+    Raises ``json.JSONDecodeError`` on malformed input and ``PayloadTooLarge``
+    once more than ``limit`` bytes have been read.
+    """
+
+    def __init__(self, stream, limit: int | None = None, chunk_size: int = CHUNK_SIZE, on_read=None):
+        self.stream = stream
+        self.limit = limit
+        self.chunk_size = chunk_size
+        self.on_read = on_read
+        self.bytes_read = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._json = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, at_least: int = 0) -> bool:
+        """Read at least ``at_least`` more characters (one chunk if 0); False at EOF."""
+        if self._eof:
+            return False
+        if self._pos:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        wanted = len(self._buf) + max(at_least, 1)
+        while len(self._buf) < wanted:
+            data = self.stream.read(max(self.chunk_size, at_least))
+            if data:
+                self.bytes_read += len(data)
+                if self.limit is not None and self.bytes_read > self.limit:
+                    raise PayloadTooLarge(f"Payload exceeds {self.limit} bytes")
+                if self.on_read is not None:
+                    self.on_read(self.bytes_read)
+            self._buf += self._decoder.decode(data or b"", final=not data)
+            if not data:
+                self._eof = True
+                break
+        return True
+
+    def _error(self, message: str):
+        raise json.JSONDecodeError(message, self._buf, self._pos)
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            self._error(f"Expecting {char!r}")
+        self._pos += 1
+
+    def value(self):
+        """Parse and return the next complete value."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                # Probably cut off mid-value; read as much again as we hold,
+                # so a large value is re-parsed O(log n) times.
+                if not self._fill(len(self._buf) - self._pos):
+                    raise
+                continue
+            # A number or literal running to the end of the buffer might
+            # continue ("3." parses as 3, "1e" as 1).
+            if not isinstance(value, (str, list, dict)):
+                tail = end
+                while tail < len(self._buf) and self._buf[tail] in _NUMBER_CHARS:
+                    tail += 1
+                if tail == len(self._buf) and self._fill():
+                    continue
+            self._pos = end
+            return value
+
+    def skip(self):
+        """Consume the next value without keeping it."""
+        char = self._peek()
+        if char == "{":
+            for _ in self.iter_object():
+                self.skip()
+        elif char == "[":
+            for _ in self.iter_array():
+                self.skip()
+        else:
+            self.value()
+
+    def peek_type(self) -> str:
+        """``"object"``, ``"array"`` or ``"scalar"`` for the next value."""
+        char = self._peek()
+        return {"{": "object", "[": "array"}.get(char, "scalar")
+
+    def iter_object(self):
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                self._error("Expecting property name")
+            self._expect(":")
+            yield key
+            char = self._peek()
+            self._pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                self._pos -= 1
+                self._error("Expecting ',' or '}'")
+
+    def iter_array(self):
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield
+            char = self._peek()
+            self._pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                self._pos -= 1
+                self._error("Expecting ',' or ']'")
+
+    def end(self):
+        """Check that nothing but whitespace follows the document."""
+        if self._peek():
+            self._error("Extra data")
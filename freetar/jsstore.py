@@ -0,0 +1,161 @@
+"""
+Pull the ``div.js-store`` ``data-content`` payload out of an Ultimate Guitar page.
+
+UG embeds the whole page state as HTML-escaped JSON in a single attribute.
+Building a BeautifulSoup tree over the full page just to read that attribute
+is the most expensive part of a cache miss, so the fast path below scans for
+the element and unescapes only the attribute value. It works on a complete
+string or on a streamed body and stops reading once the closing quote shows
+up. BeautifulSoup stays as the fallback for markup the scanner does not
+recognise.
+"""
+import codecs
+import html
+import os
+import re
+
+from bs4 import BeautifulSoup
+
+MARKER = "js-store"
+CHUNK_SIZE = 64 * 1024
+# After the payload is found, read at most this many extra bytes so the
+# connection can go back to the keep-alive pool; beyond that, drop it.
+DRAIN_LIMIT = int(os.environ.get("FREETAR_UPSTREAM_DRAIN_LIMIT", str(256 * 1024)))
+# How much text to keep before the marker while streaming. The opening
+# ``<div`` of the js-store element has to be inside this window.
+_LOOKBEHIND = 2048
+
+_ATTR_RE = re.compile(r"""\sdata-content\s*=\s*(["'])""")
+_OPEN_TAG_RE = re.compile(r"""<div\b[^<>]*\sclass\s*=\s*(["'])(?:[^"'<>]*\s)?$""")
+
+
+def _find_payload(text: str, start: int = 0):
+    """
+    Scan ``text`` for the js-store element.
+
+    Returns ``(payload, pos)``: the unescaped attribute value once it is
+    complete, ``None`` if more text is needed (``pos`` is where the scan has
+    to resume), or ``False`` if the element has no data-content attribute.
+    """
+    pos = start
+    while True:
+        idx = text.find(MARKER, pos)
+        if idx < 0:
+            return None, max(pos, len(text) - len(MARKER))
+        after = idx + len(MARKER)
+        tag_start = text.rfind("<", 0, idx)
+        if (tag_start < 0
+                or after >= len(text)
+                or text[after] not in "\"' \t\r\n"
+                or not _OPEN_TAG_RE.match(text, tag_start, idx)):
+            if after >= len(text):
+                return None, idx
+            pos = after
+            continue
+
+        attr = _ATTR_RE.search(text, tag_start)
+        tag_end = text.find(">", after)
+        if attr is None or (tag_end >= 0 and attr.start() > tag_end):
+            if tag_end < 0:
+                return None, tag_start
+            return False, tag_end + 1
+        quote = attr.group(1)
+        value_end = text.find(quote, attr.end())
+        if value_end < 0:
+            return None, tag_start
+        return html.unescape(text[attr.end():value_end]), value_end + 1
+
+
+def extract_js_store(text: str) -> str | None:
+    """Return the unescaped js-store data-content of a page, or None."""
+    payload, _ = _find_payload(text)
+    return payload if isinstance(payload, str) else None
+
+
+def extract_js_store_bs(text: str) -> str:
+    """BeautifulSoup version of :func:`extract_js_store`; raises like the old code did."""
+    bs = BeautifulSoup(text, "html.parser")  # data can be None
+    data = bs.find("div", {"class": "js-store"})  # KeyError
+    return data.attrs["data-content"]
+
+
+class StreamExtractor:
+    """Incrementally feed decoded text until the js-store payload is complete."""
+
+    def __init__(self, keep_text: bool = True):
+        self.payload = None
+        self._buffer = ""
+        self._keep_text = keep_text
+        self._seen = []
+
+    @property
+    def done(self) -> bool:
+        return self.payload is not None
+
+    def feed(self, chunk: str) -> bool:
+        if self.done:
+            return True
+        if self._keep_text:
+            self._seen.append(chunk)
+        self._buffer += chunk
+        payload, pos = _find_payload(self._buffer)
+        if payload is not None and payload is not False:
+            self.payload = payload
+            self._buffer = ""
+            self._seen = []
+            return True
+        # Drop text that can no longer be part of the js-store element.
+        cut = pos if payload is False else max(0, min(pos, len(self._buffer) - _LOOKBEHIND))
+        if cut:
+            self._buffer = self._buffer[cut:]
+        return False
+
+    def text(self) -> str:
+        """Everything fed so far; only available while nothing was found."""
+        return "".join(self._seen)
+
+
+def stream_js_store(resp) -> tuple[str | None, str | None]:
+    """
+    Stream a ``requests`` response (opened with ``stream=True``) through the
+    fast extractor. Returns ``(payload, None)`` on success, or
+    ``(None, full_text)`` so the caller can fall back to BeautifulSoup.
+    """
+    encoding = resp.encoding or "utf-8"
+    try:
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    extractor = StreamExtractor()
+    deadline = getattr(resp, "deadline", None)
+    chunks = resp.iter_content(chunk_size=CHUNK_SIZE)
+    for chunk in chunks:
+        if extractor.feed(decoder.decode(chunk)):
+            break
+        if deadline is not None:
+            deadline.check()
+    else:
+        extractor.feed(decoder.decode(b"", final=True))
+
+    if extractor.done:
+        _drain(resp, chunks)
+        return extractor.payload, None
+    return None, extractor.text()
+
+
+def read_js_store(resp) -> str:
+    """Like :func:`stream_js_store`, falling back to BeautifulSoup on the full body."""
+    payload, text = stream_js_store(resp)
+    if payload is None:
+        payload = extract_js_store_bs(text)
+    return payload
+
+
+def _drain(resp, chunks):
+    """Finish a small remainder so urllib3 can reuse the connection."""
+    drained = 0
+    for chunk in chunks:
+        drained += len(chunk)
+        if drained > DRAIN_LIMIT:
+            resp.close()
+            return
@@ -0,0 +1,102 @@
+"""
+Edit operations on a chord library (a list of ``{"group", "rows"}`` dicts).
+
+A patch is a list of operations applied in order; any invalid operation
+rejects the whole patch. Paths address ``[group, row, chord]`` indexes.
+
+    {"op": "add_group", "index": 0, "group": {...}}
+    {"op": "delete_group", "index": 2}
+    {"op": "move_group", "from": 2, "to": 0}
+    {"op": "rename_group", "index": 1, "name": "Verse"}
+    {"op": "replace_group", "index": 1, "group": {...}}
+    {"op": "add_chord", "path": [0, 0, 3], "chord": {"name": "Am", "shape": "x02210"}}
+    {"op": "delete_chord", "path": [0, 0, 3]}
+    {"op": "update_chord", "path": [0, 0, 3], "chord": {...}}
+    {"op": "move_chord", "from": [0, 0, 3], "to": [0, 1, 0]}
+
+``move_*`` destinations are indexes after the item has been removed.
+"""
+import copy
+
+
+class PatchError(ValueError):
+    pass
+
+
+def _index(value, size: int, allow_end: bool = False) -> int:
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise PatchError(f"Index must be an integer, got {value!r}")
+    if value < 0 or value > size or (value == size and not allow_end):
+        raise PatchError(f"Index {value} out of range")
+    return value
+
+
+def _group(value) -> dict:
+    if not isinstance(value, dict) or not isinstance(value.get("rows", []), list):
+        raise PatchError("Group must be an object with a rows list")
+    return value
+
+
+def _chord(value) -> dict:
+    if not isinstance(value, dict):
+        raise PatchError("Chord must be an object")
+    return value
+
+
+def _chords(groups: list, path, allow_end: bool = False):
+    """``(chord list, index)`` for a ``[group, row, chord]`` path."""
+    if not isinstance(path, list) or len(path) != 3:
+        raise PatchError(f"Chord path must be [group, row, chord], got {path!r}")
+    group = groups[_index(path[0], len(groups))]
+    rows = group.setdefault("rows", [])
+    row = rows[_index(path[1], len(rows))]
+    if not isinstance(row, dict) or not isinstance(row.setdefault("chords", []), list):
+        raise PatchError("Row must be an object with a chords list")
+    chords = row["chords"]
+    return chords, _index(path[2], len(chords), allow_end)
+
+
+def apply_op(groups: list, op: dict):
+    if not isinstance(op, dict):
+        raise PatchError("Operation must be an object")
+    kind = op.get("op")
+    if kind == "add_group":
+        groups.insert(_index(op.get("index"), len(groups), allow_end=True), _group(op.get("group")))
+    elif kind == "delete_group":
+        del groups[_index(op.get("index"), len(groups))]
+    elif kind == "move_group":
+        group = groups.pop(_index(op.get("from"), len(groups)))
+        groups.insert(_index(op.get("to"), len(groups), allow_end=True), group)
+    elif kind == "rename_group":
+        name = op.get("name")
+        if not isinstance(name, str):
+            raise PatchError("Group name must be a string")
+        groups[_index(op.get("index"), len(groups))]["group"] = name
+    elif kind == "replace_group":
+        groups[_index(op.get("index"), len(groups))] = _group(op.get("group"))
+    elif kind == "add_chord":
+        chords, index = _chords(groups, op.get("path"), allow_end=True)
+        chords.insert(index, _chord(op.get("chord")))
+    elif kind == "delete_chord":
+        chords, index = _chords(groups, op.get("path"))
+        del chords[index]
+    elif kind == "update_chord":
+        chords, index = _chords(groups, op.get("path"))
+        chords[index] = _chord(op.get("chord"))
+    elif kind == "move_chord":
+        chords, index = _chords(groups, op.get("from"))
+        chord = chords.pop(index)
+        chords, index = _chords(groups, op.get("to"), allow_end=True)
+        chords.insert(index, chord)
+    else:
+        raise PatchError(f"Unknown operation {kind!r}")
+
+
+def apply_patch(groups: list, ops: list) -> list:
+    """Return a new library with ``ops`` applied; ``groups`` is not modified."""
+    if not isinstance(ops, list):
+        raise PatchError("ops must be a list")
+    result = copy.deepcopy(groups) if isinstance(groups, list) else []
+    for op in ops:
+        apply_op(result, op)
+    return result
@@ -0,0 +1,228 @@
+"""
+Rendered-page cache with a soft/hard TTL (stale-while-revalidate).
+
+Entries younger than the soft TTL are served as they are. Older entries are
+still served immediately, but a bounded background pool re-runs the view to
+refresh them from Ultimate Guitar. After the hard TTL the backend cache drops
+the entry and the next request renders it in the foreground again.
+
+When the backend is shared between processes (see ``sharedcache``), entries
+are stored as compact bytes (timestamp + zlib-compressed body) and a small
+per-process ``SimpleCache`` sits in front of it for ``FREETAR_PAGE_LOCAL_TTL``
+seconds, so hot pages do not cost a round trip on every hit.
+
+The entry of the current request is left in ``g.page_cache_entry`` so the
+response compression hook can serve, or store, an encoded copy with it.
+Responses carry an ETag derived from the entry, and a matching
+If-None-Match is answered with 304 straight from the cache lookup.
+"""
+import functools
+import logging
+import os
+import threading
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from cachelib import SimpleCache
+
+from flask import current_app, g, make_response, request
+
+from . import upstream
+from .conditional import make_etag, not_modified, not_modified_response, set_validators
+from .datacache import bypass_data_cache
+
+logger = logging.getLogger(__name__)
+
+SOFT_TTL = int(os.environ.get("FREETAR_PAGE_SOFT_TTL", str(24 * 3600)))
+HARD_TTL = int(os.environ.get("FREETAR_PAGE_HARD_TTL", "0"))
+REFRESH_WORKERS = int(os.environ.get("FREETAR_REFRESH_WORKERS", "2"))
+REFRESH_QUEUE = int(os.environ.get("FREETAR_REFRESH_QUEUE", "32"))
+LOCAL_TTL = int(os.environ.get("FREETAR_PAGE_LOCAL_TTL", "60"))
+LOCAL_THRESHOLD = int(os.environ.get("FREETAR_PAGE_LOCAL_THRESHOLD", "500"))
+
+_HEADER = struct.Struct("!dBI")
+_NAME = struct.Struct("!B")
+_SIZE = struct.Struct("!I")
+
+
+def encode_entry(entry: dict) -> bytes:
+    """stored_at, zlib-compressed body and any compressed variants, packed."""
+    variants = entry.get("variants", {})
+    body = zlib.compress(entry["body"].encode("utf-8"))
+    parts = [_HEADER.pack(entry["stored_at"], len(variants), len(body)), body]
+    for name, data in variants.items():
+        raw = name.encode("ascii")
+        parts += [_NAME.pack(len(raw)), raw, _SIZE.pack(len(data)), data]
+    return b"".join(parts)
+
+
+def decode_entry(blob: bytes) -> dict:
+    stored_at, count, size = _HEADER.unpack_from(blob)
+    offset = _HEADER.size
+    body = zlib.decompress(blob[offset:offset + size]).decode("utf-8")
+    offset += size
+    variants = {}
+    for _ in range(count):
+        (length,) = _NAME.unpack_from(blob, offset)
+        offset += _NAME.size
+        name = blob[offset:offset + length].decode("ascii")
+        offset += length
+        (length,) = _SIZE.unpack_from(blob, offset)
+        offset += _SIZE.size
+        variants[name] = blob[offset:offset + length]
+        offset += length
+    return {"body": body, "stored_at": stored_at, "variants": variants}
+
+
+class PageCache:
+    def __init__(self, cache, soft_ttl: int = SOFT_TTL, hard_ttl: int = HARD_TTL,
+                 workers: int = REFRESH_WORKERS, max_pending: int = REFRESH_QUEUE,
+                 shared: bool = False, local_ttl: int = LOCAL_TTL):
+        self.cache = cache
+        self.shared = shared
+        self.local_ttl = local_ttl
+        self.local = SimpleCache(threshold=LOCAL_THRESHOLD) if shared else None
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers),
+                                            thread_name_prefix="freetar-refresh")
+        self._lock = threading.Lock()
+        self._refreshing: set[str] = set()
+        self._stats = {
+            "hits": 0,
+            "local_hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "refresh_skipped": 0,
+            "variants_stored": 0,
+            "not_modified": 0,
+        }
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    @staticmethod
+    def make_key(query_string: bool) -> str:
+        key = "page:" + request.path
+        if query_string:
+            # Re-encoded, so "&" or "=" inside a value cannot forge another query.
+            key += "?" + urlencode(sorted(request.args.items(multi=True)))
+        return key
+
+    def lookup(self, key: str):
+        if self.local is None:
+            return self.cache.get(key)
+        entry = self.local.get(key)
+        if entry is not None:
+            self._count("local_hits")
+            return entry
+        blob = self.cache.get(key)
+        if blob is None:
+            return None
+        try:
+            entry = decode_entry(blob)
+        except (struct.error, zlib.error, UnicodeDecodeError, TypeError) as exc:
+            logger.warning("Dropping unreadable shared page entry %s: %s", key, exc)
+            return None
+        self.local.set(key, entry, timeout=self.local_ttl)
+        return entry
+
+    def store(self, key: str, body, stored_at: float | None = None, variants: dict | None = None) -> dict:
+        entry = {"body": body, "stored_at": stored_at or time.time(), "variants": variants or {}}
+        if self.local is None:
+            self.cache.set(key, entry, timeout=self.hard_ttl)
+            return entry
+        self.local.set(key, entry, timeout=self.local_ttl)
+        self.cache.set(key, encode_entry(entry), timeout=self.hard_ttl)
+        return entry
+
+    def add_variant(self, key: str, stored_at: float, encoding: str, data: bytes):
+        """
+        Keep an encoded copy of the final response next to the entry, unless
+        the entry has been replaced since that response was rendered.
+        """
+        entry = self.lookup(key)
+        if entry is None or entry["stored_at"] != stored_at or encoding in entry.get("variants", {}):
+            return
+        variants = dict(entry.get("variants", {}))
+        variants[encoding] = data
+        self.store(key, entry["body"], stored_at, variants)
+        self._count("variants_stored")
+
+    def cached(self, query_string: bool = False):
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                key = self.make_key(query_string)
+                entry = self.lookup(key)
+                if entry is not None:
+                    age = time.time() - entry["stored_at"]
+                    if self.soft_ttl and age > self.soft_ttl:
+                        self._count("stale_hits")
+                        self._schedule_refresh(key, view, kwargs)
+                    else:
+                        self._count("hits")
+                    etag = make_etag(key, entry["stored_at"])
+                    if not_modified(etag):
+                        self._count("not_modified")
+                        return not_modified_response(etag, cache_control=None)
+                    g.page_cache_entry = (key, entry)
+                    return set_validators(make_response(entry["body"]), etag, cache_control=None)
+
+                self._count("misses")
+                body = view(*args, **kwargs)
+                if not isinstance(body, str):
+                    # Responses and (body, status) tuples, e.g. errors, are not cached.
+                    return body
+                entry = self.store(key, body)
+                g.page_cache_entry = (key, entry)
+                etag = make_etag(key, entry["stored_at"])
+                return set_validators(make_response(body), etag, cache_control=None)
+
+            return wrapper
+
+        return decorator
+
+    def _schedule_refresh(self, key: str, view, view_kwargs: dict):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            # While UG is failing, keep serving the stale page without retrying.
+            if upstream.breaker.is_open or len(self._refreshing) >= self.max_pending:
+                self._stats["refresh_skipped"] += 1
+                return
+            self._refreshing.add(key)
+        app = current_app._get_current_object()
+        path = request.path
+        query = request.query_string
+        self._executor.submit(self._refresh, app, key, view, view_kwargs, path, query)
+
+    def _refresh(self, app, key, view, view_kwargs, path, query):
+        try:
+            with app.test_request_context(path, query_string=query), bypass_data_cache():
+                body = view(**view_kwargs)
+                if isinstance(body, str):
+                    self.store(key, body)
+            self._count("refreshes")
+        except Exception as exc:
+            self._count("refresh_failures")
+            logger.warning("Background refresh of %s failed: %s", path, exc)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            values = dict(self._stats)
+            values["refreshing"] = len(self._refreshing)
+        values["soft_ttl"] = self.soft_ttl
+        values["hard_ttl"] = self.hard_ttl
+        values["backend"] = type(self.cache.cache).__name__
+        return values
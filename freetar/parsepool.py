@@ -0,0 +1,108 @@
+"""
+Optional process pool for parsing upstream pages.
+
+Turning a UG page into a ``TabEntry``/``Search`` (JSON decoding, SongDetail
+construction, tab markup, chord diagrams) is pure CPU work that holds the
+GIL, so one big tab slows every other waitress thread. With
+``FREETAR_PARSE_WORKERS`` > 0 the parse functions run in worker processes
+and only the compact result is sent back. With 0 (the default), or if the
+pool breaks, parsing happens in the calling thread as before.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+PARSE_WORKERS = int(os.environ.get("FREETAR_PARSE_WORKERS", "0"))
+PARSE_TIMEOUT = float(os.environ.get("FREETAR_PARSE_TIMEOUT", "30"))
+
+_lock = threading.Lock()
+_executor = None
+_workers = PARSE_WORKERS
+_stats = {"in_process": 0, "in_thread": 0, "fallbacks": 0}
+
+
+def configure(workers: int):
+    """Set the pool size (0 disables the pool). Call before serving."""
+    global _workers
+    with _lock:
+        _workers = max(0, int(workers))
+    shutdown()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None and _workers > 0:
+            # spawn: never fork a process that already runs waitress threads
+            _executor = ProcessPoolExecutor(
+                max_workers=_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _count(name: str):
+    with _lock:
+        _stats[name] += 1
+
+
+def _fallback(exc: BaseException):
+    logger.warning("Parse pool unavailable, parsing in-thread: %s", exc or type(exc).__name__)
+    _count("fallbacks")
+
+
+def run(fn, *args):
+    """
+    Call ``fn(*args)`` in the pool if there is one, else in this thread.
+    ``fn`` must be a module-level function; exceptions it raises are
+    re-raised here unchanged. Raises the builtin ``TimeoutError`` if the
+    pool takes longer than ``FREETAR_PARSE_TIMEOUT``.
+    """
+    executor = _get_executor()
+    if executor is not None:
+        try:
+            future = executor.submit(fn, *args)
+        except RuntimeError as exc:
+            # configure()/shutdown() closed this pool after we picked it up
+            _fallback(exc)
+        else:
+            try:
+                result = future.result(timeout=PARSE_TIMEOUT)
+            except FutureTimeoutError as exc:
+                if future.done():
+                    raise  # a TimeoutError raised by fn itself (3.11+)
+                # Not the builtin TimeoutError before Python 3.11.
+                future.cancel()
+                raise TimeoutError(f"Parsing took longer than {PARSE_TIMEOUT:g}s") from exc
+            except CancelledError as exc:
+                # Pending work cancelled by a shutdown.
+                _fallback(exc)
+            except BrokenProcessPool as exc:
+                _fallback(exc)
+                shutdown()
+            else:
+                _count("in_process")
+                return result
+    _count("in_thread")
+    return fn(*args)
+
+
+def stats() -> dict:
+    with _lock:
+        values = dict(_stats)
+        values["workers"] = _workers
+    return values
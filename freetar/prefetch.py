@@ -0,0 +1,123 @@
+"""
+Opt-in background prefetch of the pages a visitor is likely to open next:
+the following search results page and a tab's alternative versions.
+
+Prefetched data lands in the parsed-data cache, so the follow-up click only
+has to render. Work runs on a small, bounded pool and is skipped whenever
+the instance is busy serving real requests, the circuit breaker is not
+closed, or the upstream token bucket is running low.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import upstream
+from .datacache import get_search, get_tab
+from .ug import tab_url_path
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("FREETAR_PREFETCH", "0") == "1"
+WORKERS = int(os.environ.get("FREETAR_PREFETCH_WORKERS", "1"))
+MAX_PENDING = int(os.environ.get("FREETAR_PREFETCH_QUEUE", "16"))
+# Skip prefetching while this many requests are being served.
+BUSY_REQUESTS = int(os.environ.get("FREETAR_PREFETCH_BUSY", str(max(1, int(os.environ.get("THREADS", "4")) // 2))))
+MAX_ALTERNATIVES = int(os.environ.get("FREETAR_PREFETCH_ALTERNATIVES", "3"))
+
+
+class Prefetcher:
+    def __init__(self, enabled: bool = ENABLED, workers: int = WORKERS, max_pending: int = MAX_PENDING,
+                 busy_requests: int = BUSY_REQUESTS):
+        self.enabled = enabled
+        self.max_pending = max_pending
+        self.busy_requests = busy_requests
+        self._workers = max(1, workers)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending: set[str] = set()
+        self._active_requests = 0
+        self._stats = {
+            "scheduled": 0,
+            "completed": 0,
+            "failed": 0,
+            "skipped_busy": 0,
+            "skipped_upstream": 0,
+            "skipped_queue": 0,
+        }
+
+    def request_started(self):
+        with self._lock:
+            self._active_requests += 1
+
+    def request_finished(self):
+        with self._lock:
+            self._active_requests -= 1
+
+    def _upstream_has_room(self) -> bool:
+        # Leave at least half of the bucket to visitors.
+        return (upstream.breaker.state == upstream.CircuitBreaker.CLOSED
+                and upstream.limiter.available() >= upstream.limiter.burst / 2)
+
+    def schedule(self, key: str, fn):
+        if not self.enabled:
+            return
+        with self._lock:
+            if key in self._pending:
+                return
+            # The request scheduling this is still counted as active.
+            if self._active_requests > self.busy_requests:
+                self._stats["skipped_busy"] += 1
+                return
+            if len(self._pending) >= self.max_pending:
+                self._stats["skipped_queue"] += 1
+                return
+            if not self._upstream_has_room():
+                self._stats["skipped_upstream"] += 1
+                return
+            self._pending.add(key)
+            self._stats["scheduled"] += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers,
+                                                    thread_name_prefix="freetar-prefetch")
+            executor = self._executor
+        executor.submit(self._run, key, fn)
+
+    def _run(self, key: str, fn):
+        try:
+            # Conditions may have changed while this was queued.
+            if not self._upstream_has_room():
+                with self._lock:
+                    self._stats["skipped_upstream"] += 1
+                return
+            fn()
+            with self._lock:
+                self._stats["completed"] += 1
+        except Exception as exc:
+            with self._lock:
+                self._stats["failed"] += 1
+            logger.debug("Prefetch of %s failed: %s", key, exc)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def search_page(self, value: str, page: int, total_pages: int):
+        if page < total_pages:
+            self.schedule(f"search:{page + 1}:{value}", lambda: get_search(value, page + 1))
+
+    def alternatives(self, tab):
+        for alt in list(tab.alternatives or ())[:MAX_ALTERNATIVES]:
+            path = tab_url_path(alt.tab_url)
+            if path:
+                self.schedule(f"tab:{path}", lambda path=path: get_tab(path))
+
+    def stats(self) -> dict:
+        with self._lock:
+            values = dict(self._stats)
+            values["pending"] = len(self._pending)
+            values["active_requests"] = self._active_requests
+        values["enabled"] = self.enabled
+        return values
+
+
+prefetcher = Prefetcher()
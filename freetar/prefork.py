@@ -0,0 +1,147 @@
+"""
+Pre-fork serving for Linux/Unix: one master process binds the listening
+socket and forks ``workers`` waitress processes that all accept on it.
+
+The master only supervises: it re-spawns workers that die, replaces them
+one by one on SIGHUP (graceful restart, the socket never stops accepting)
+and stops them on SIGTERM/SIGINT. Workers share parsed UG data through the
+SQLite store, so adding processes does not split the data cache.
+"""
+import logging
+import os
+import signal
+import socket
+import time
+
+import waitress
+
+logger = logging.getLogger(__name__)
+
+# Seconds a stopping worker gets to finish in-flight requests before SIGKILL.
+GRACEFUL_TIMEOUT = float(os.environ.get("FREETAR_GRACEFUL_TIMEOUT", "10"))
+# Minimum delay between re-spawns, so a worker that crashes on start-up
+# does not turn the master into a fork loop.
+RESPAWN_DELAY = float(os.environ.get("FREETAR_RESPAWN_DELAY", "1"))
+
+
+def supported() -> bool:
+    return hasattr(os, "fork")
+
+
+def _stop_worker(signum, frame):
+    # waitress turns SystemExit into a task dispatcher shutdown, which
+    # waits for running requests before returning.
+    raise SystemExit(0)
+
+
+class Master:
+    def __init__(self, app, sock: socket.socket, workers: int, threads: int):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.threads = threads
+        self.children: dict[int, float] = {}
+        self._signals: list[int] = []
+        self._last_spawn = 0.0
+
+    def spawn(self) -> int:
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            self._last_spawn = time.monotonic()
+            return pid
+
+        # Worker process
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, _stop_worker)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            waitress.serve(self.app, sockets=[self.sock], threads=self.threads, _quiet=True)
+        except BaseException:
+            logger.exception("Worker %d crashed", os.getpid())
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _on_signal(self, signum, frame):
+        self._signals.append(signum)
+
+    def _reap(self) -> list[int]:
+        dead = []
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if not pid:
+                break
+            if self.children.pop(pid, None) is not None:
+                dead.append(pid)
+                if os.WIFSIGNALED(status) or os.WEXITSTATUS(status):
+                    logger.warning("Worker %d exited unexpectedly (status %d)", pid, status)
+        return dead
+
+    def _terminate(self, pids, timeout: float = GRACEFUL_TIMEOUT):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + timeout
+        pids = set(pids)
+        while pids and time.monotonic() < deadline:
+            for pid in list(pids):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    pids.discard(pid)
+                    self.children.pop(pid, None)
+            time.sleep(0.05)
+        for pid in pids:
+            logger.warning("Worker %d did not stop in time, killing it", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.children.pop(pid, None)
+
+    def restart(self):
+        """Replace every worker with a fresh one, one at a time."""
+        for pid in list(self.children):
+            self.spawn()
+            self._terminate([pid])
+
+    def run(self):
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, self._on_signal)
+        for _ in range(self.workers):
+            self.spawn()
+        print(f"Pre-fork master {os.getpid()} started {self.workers} workers")
+
+        while True:
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum == signal.SIGHUP:
+                    logger.info("SIGHUP received, restarting workers")
+                    self.restart()
+                else:
+                    self._terminate(list(self.children))
+                    self.sock.close()
+                    return
+            self._reap()
+            if len(self.children) < self.workers:
+                if time.monotonic() - self._last_spawn >= RESPAWN_DELAY:
+                    self.spawn()
+            time.sleep(0.2)
+
+
+def serve(app, host: str, port: int, workers: int, threads: int):
+    """Bind ``host:port`` and serve ``app`` from ``workers`` forked processes."""
+    sock = socket.create_server((host, port), backlog=1024)
+    sock.setblocking(False)
+    Master(app, sock, workers, threads).run()
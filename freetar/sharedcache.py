@@ -0,0 +1,318 @@
+"""
+Shared backends for the rendered-page cache.
+
+``FREETAR_PAGE_CACHE`` selects where cached views live:
+
+* empty / ``memory`` - a per-process ``SimpleCache`` (the default)
+* ``filesystem:<dir>`` - one directory shared by every process on the host
+* ``redis://host:port/db`` - any Redis-protocol server, shared by every host
+
+The Redis backend speaks RESP directly over a small socket pool, so no
+client library is needed. ``StandInServer`` implements the handful of
+commands it uses in-process, for tests and single-box setups
+(``python -m freetar.sharedcache`` runs it standalone).
+"""
+import logging
+import os
+import pickle
+import socket
+import socketserver
+import threading
+import time
+from urllib.parse import urlparse
+
+from flask_caching.backends.base import BaseCache
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE = os.environ.get("FREETAR_PAGE_CACHE", "")
+PAGE_CACHE_THRESHOLD = int(os.environ.get("FREETAR_PAGE_CACHE_THRESHOLD", "10000"))
+RESP_TIMEOUT = float(os.environ.get("FREETAR_PAGE_CACHE_TIMEOUT", "0.5"))
+RESP_POOL_SIZE = int(os.environ.get("FREETAR_PAGE_CACHE_POOL", "8"))
+
+
+def cache_config(spec: str = PAGE_CACHE) -> dict:
+    """Flask-Caching config for a ``FREETAR_PAGE_CACHE`` value."""
+    config = {
+        "CACHE_TYPE": "SimpleCache",
+        "CACHE_DEFAULT_TIMEOUT": 0,
+        "CACHE_THRESHOLD": PAGE_CACHE_THRESHOLD,
+    }
+    if not spec or spec == "memory":
+        return config
+    if spec.startswith("filesystem:"):
+        config["CACHE_TYPE"] = "FileSystemCache"
+        config["CACHE_DIR"] = spec[len("filesystem:"):]
+        return config
+    if spec.startswith("redis://"):
+        config["CACHE_TYPE"] = "freetar.sharedcache.RespCache"
+        config["CACHE_REDIS_URL"] = spec
+        config["CACHE_KEY_PREFIX"] = "freetar:"
+        return config
+    raise ValueError(f"Unsupported FREETAR_PAGE_CACHE value: {spec!r}")
+
+
+def is_shared(config: dict) -> bool:
+    return config["CACHE_TYPE"] != "SimpleCache"
+
+
+class RespError(Exception):
+    pass
+
+
+def _read_reply(fp):
+    """Read one RESP reply (or request) from a binary file object."""
+    line = fp.readline()
+    if not line:
+        raise ConnectionError("Connection closed by peer")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        raise RespError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        return fp.read(size + 2)[:-2]
+    if kind == b"*":
+        size = int(rest)
+        return None if size < 0 else [_read_reply(fp) for _ in range(size)]
+    raise ConnectionError(f"Unexpected reply {line!r}")
+
+
+class RespClient:
+    """Minimal blocking RESP2 client with a pool of persistent connections."""
+
+    def __init__(self, host: str, port: int, db: int = 0, timeout: float = RESP_TIMEOUT,
+                 pool_size: int = RESP_POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._idle: list = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile("rb"))
+        if self.db:
+            self._send(conn, ("SELECT", self.db))
+            _read_reply(conn[1])
+        return conn
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode()
+
+    def _send(self, conn, args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = self._encode(arg)
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        conn[0].sendall(b"".join(parts))
+
+    def execute(self, *args):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+        try:
+            self._send(conn, args)
+            reply = _read_reply(conn[1])
+        except RespError:
+            self._release(conn)
+            raise
+        except BaseException:
+            conn[0].close()
+            raise
+        self._release(conn)
+        return reply
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn[0].close()
+
+
+class RespCache(BaseCache):
+    """
+    Cache backend on a Redis-protocol server. Errors are logged and treated
+    as misses: a shared cache that is down must not take the site down.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0,
+                 default_timeout: int = 300, key_prefix: str = "", **kwargs):
+        super().__init__(default_timeout=default_timeout)
+        self.key_prefix = key_prefix
+        self.client = RespClient(host, port, db)
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        url = urlparse(config["CACHE_REDIS_URL"])
+        kwargs.update(
+            host=url.hostname or "127.0.0.1",
+            port=url.port or 6379,
+            db=int(url.path.lstrip("/") or 0),
+            key_prefix=config.get("CACHE_KEY_PREFIX") or "",
+        )
+        return cls(*args, **kwargs)
+
+    def _call(self, *args, default=None):
+        try:
+            return self.client.execute(*args)
+        except (OSError, RespError) as exc:
+            logger.warning("Shared page cache unavailable: %s", exc)
+            return default
+
+    def get(self, key):
+        blob = self._call("GET", self.key_prefix + key)
+        if blob is None:
+            return None
+        return pickle.loads(blob)
+
+    def set(self, key, value, timeout=None):
+        timeout = self._normalize_timeout(timeout)
+        args = ["SET", self.key_prefix + key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)]
+        if timeout:
+            args += ["EX", timeout]
+        return self._call(*args) == "OK"
+
+    def add(self, key, value, timeout=None):
+        timeout = self._normalize_timeout(timeout)
+        args = ["SET", self.key_prefix + key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), "NX"]
+        if timeout:
+            args += ["EX", timeout]
+        return self._call(*args) == "OK"
+
+    def delete(self, key):
+        return bool(self._call("DEL", self.key_prefix + key, default=0))
+
+    def has(self, key):
+        return bool(self._call("EXISTS", self.key_prefix + key, default=0))
+
+    def clear(self):
+        # Only ever drop our own keys; the server may be shared.
+        return False
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class StandInServer:
+    """
+    In-process Redis-protocol server implementing PING, SELECT, GET, SET
+    (with EX/PX/NX), DEL, EXISTS and FLUSHDB. Not durable, single database.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self._data: dict[bytes, tuple[bytes, float]] = {}
+        self._lock = threading.Lock()
+        self._connections = set()
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server._connections.add(self.connection)
+
+            def finish(self):
+                with server._lock:
+                    server._connections.discard(self.connection)
+                try:
+                    super().finish()
+                except OSError:  # the client or stop() already closed it
+                    pass
+
+            def handle(self):
+                while True:
+                    try:
+                        args = _read_reply(self.rfile)
+                    except (ConnectionError, OSError, ValueError):
+                        return
+                    try:
+                        self.wfile.write(server.command(args))
+                    except OSError:  # BrokenPipeError, ConnectionResetError, ...
+                        return
+
+        self._server = _Server((host, port), Handler)
+        self.host, self.port = self._server.server_address[:2]
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}/0"
+
+    def start(self) -> "StandInServer":
+        threading.Thread(target=self._server.serve_forever, name="freetar-resp-standin",
+                         daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        """Stop listening and drop open client connections, like a server going away."""
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _live(self, key: bytes):
+        item = self._data.get(key)
+        if item is not None and item[1] and item[1] <= time.time():
+            del self._data[key]
+            return None
+        return item
+
+    def command(self, args) -> bytes:
+        name = args[0].decode().upper()
+        with self._lock:
+            if name == "PING":
+                return b"+PONG\r\n"
+            if name == "SELECT":
+                return b"+OK\r\n"
+            if name == "GET":
+                item = self._live(args[1])
+                if item is None:
+                    return b"$-1\r\n"
+                return b"$%d\r\n%s\r\n" % (len(item[0]), item[0])
+            if name == "SET":
+                key, value, expires_at = args[1], args[2], 0.0
+                options = [a.decode().upper() for a in args[3:]]
+                if "NX" in options and self._live(key) is not None:
+                    return b"$-1\r\n"
+                for unit, scale in (("EX", 1.0), ("PX", 0.001)):
+                    if unit in options:
+                        expires_at = time.time() + int(options[options.index(unit) + 1]) * scale
+                self._data[key] = (value, expires_at)
+                return b"+OK\r\n"
+            if name == "DEL":
+                return b":%d\r\n" % sum(self._data.pop(k, None) is not None for k in args[1:])
+            if name == "EXISTS":
+                return b":%d\r\n" % sum(self._live(k) is not None for k in args[1:])
+            if name == "FLUSHDB":
+                self._data.clear()
+                return b"+OK\r\n"
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+
+if __name__ == "__main__":
+    standin = StandInServer(port=int(os.environ.get("FREETAR_STANDIN_PORT", "6379")))
+    print(f"Redis-protocol stand-in listening on {standin.url}")
+    standin.serve_forever()
@@ -1,7 +1,7 @@
 (function () {
   'use strict';
 
-  const SELECTOR = 'div.tab.font-monospace';
+  const SELECTOR = '.tab.font-monospace'; // div (classic) or pre.tab-compact
   const STORAGE_KEY_PREFIX = 'ftColumns:';
   const GLOBAL_ENABLE_KEY = 'ftEnabled';
   const EXTRA_CH = 3; // extra width beyond the longest line
@@ -189,6 +189,14 @@
 
     Array.from(container.childNodes).forEach(node => {
       if (node.nodeName === 'BR') flush();
+      else if (node.nodeType === Node.TEXT_NODE && node.nodeValue.includes('\n')) {
+        // Compact tabs keep raw newlines inside a <pre>
+        const parts = node.nodeValue.split('\n');
+        parts.forEach((part, i) => {
+          if (i > 0) flush();
+          if (part) buffer.push(document.createTextNode(part));
+        });
+      }
       else buffer.push(node.cloneNode(true));
     });
     if (buffer.length) flush();
@@ -2,6 +2,7 @@
    Page-specific UI for My Chord Library.
    Expects:
    - window.MY_CHORDS_EDIT_URL (set in template)
+   - window.MY_CHORDS_PATCH_URL (optional; set in template)
    - SortableJS available as global Sortable
    - renderCardDiagram(card) global function
 */
@@ -1354,7 +1355,7 @@ function centerTitleForCard(card) {
   async function refreshGroupsFromServer() {
     try {
       const res = await fetch(window.location.href, {
-        cache: 'no-store',
+        cache: 'no-cache',
         headers: { 'X-Requested-With': 'fetch' },
       });
       if (!res.ok) throw new Error('fetch failed');
@@ -1989,23 +1990,146 @@ function centerTitleForCard(card) {
     pendingEditSnapshots.push(snapshot);
   }
 
-  async function persist(reason) {
+  // Last state the server confirmed, so later saves can send only the
+  // operations since then. Null until the first full save of this page.
+  let persistedState = null; // { revision, data }
+  let persistQueue = Promise.resolve();
+
+  function sameJSON(a, b) {
+    return JSON.stringify(a) === JSON.stringify(b);
+  }
+
+  // Describe how `next` differs from `prev` as one insert, delete or move,
+  // 'same', or null if it is anything else.
+  function listEdit(prev, next) {
+    const keys = (list) => list.map((item) => JSON.stringify(item));
+    const a = keys(prev);
+    const b = keys(next);
+    let i = 0;
+    while (i < a.length && i < b.length && a[i] === b[i]) i += 1;
+    if (a.length === b.length && i === a.length) return { type: 'same' };
+    const tailEquals = (x, xi, y, yi) =>
+      x.length - xi === y.length - yi && x.slice(xi).every((key, k) => key === y[yi + k]);
+    if (b.length === a.length + 1 && tailEquals(a, i, b, i + 1)) return { type: 'insert', index: i };
+    if (a.length === b.length + 1 && tailEquals(a, i + 1, b, i)) return { type: 'delete', index: i };
+    if (a.length !== b.length) return null;
+    let j = a.length - 1;
+    while (j > i && a[j] === b[j]) j -= 1;
+    // a[i] moved forward to j, or a[j] moved back to i.
+    if (a[i] === b[j] && a.slice(i + 1, j + 1).every((key, k) => key === b[i + k])) {
+      return { type: 'move', from: i, to: j };
+    }
+    if (a[j] === b[i] && a.slice(i, j).every((key, k) => key === b[i + 1 + k])) {
+      return { type: 'move', from: j, to: i };
+    }
+    return null;
+  }
+
+  function groupOps(prev, next, g) {
+    if (sameJSON(prev, next)) return [];
+    const prevRows = prev.rows || [];
+    const nextRows = next.rows || [];
+    const replace = [{ op: 'replace_group', index: g, group: next }];
+    if (prev.group !== next.group) {
+      if (!sameJSON(prevRows, nextRows)) return replace;
+      return [{ op: 'rename_group', index: g, name: next.group }];
+    }
+    if (prevRows.length !== nextRows.length) return replace;
+    const ops = [];
+    for (let r = 0; r < nextRows.length; r += 1) {
+      const a = prevRows[r].chords || [];
+      const b = nextRows[r].chords || [];
+      const edit = listEdit(a, b);
+      if (!edit) {
+        if (a.length !== b.length) return replace;
+        a.forEach((chord, c) => {
+          if (!sameJSON(chord, b[c])) ops.push({ op: 'update_chord', path: [g, r, c], chord: b[c] });
+        });
+      } else if (edit.type === 'insert') {
+        ops.push({ op: 'add_chord', path: [g, r, edit.index], chord: b[edit.index] });
+      } else if (edit.type === 'delete') {
+        ops.push({ op: 'delete_chord', path: [g, r, edit.index] });
+      } else if (edit.type === 'move') {
+        ops.push({ op: 'move_chord', from: [g, r, edit.from], to: [g, r, edit.to] });
+      }
+    }
+    return ops;
+  }
+
+  // Operations turning `prev` into `next`, or null when a full save is simpler.
+  function diffLibrary(prev, next) {
+    const edit = listEdit(prev, next);
+    let ops;
+    if (edit && edit.type === 'insert') {
+      ops = [{ op: 'add_group', index: edit.index, group: next[edit.index] }];
+    } else if (edit && edit.type === 'delete') {
+      ops = [{ op: 'delete_group', index: edit.index }];
+    } else if (edit && edit.type === 'move') {
+      ops = [{ op: 'move_group', from: edit.from, to: edit.to }];
+    } else if (prev.length === next.length) {
+      ops = [];
+      next.forEach((group, g) => ops.push(...groupOps(prev[g], group, g)));
+    } else {
+      return null;
+    }
+    return ops;
+  }
+
+  async function saveFull(url, data) {
+    const res = await fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(data),
+    });
+    const revision = res.headers.get('X-Library-Revision');
+    persistedState = res.ok && revision ? { revision, data } : null;
+  }
+
+  async function savePatch(url, data) {
+    const prev = persistedState;
+    const ops = prev ? diffLibrary(prev.data, data) : null;
+    if (!ops) return false;
+    if (!ops.length) return true;
+    const body = JSON.stringify({ base: prev.revision, ops });
+    if (body.length >= JSON.stringify(data).length) return false;
+    const res = await fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body,
+    });
+    if (!res.ok) return false; // conflict or rejected: resend everything
+    const result = await res.json();
+    persistedState = { revision: result.revision, data };
+    return true;
+  }
+
+  async function persistNow(reason) {
     const url = EDIT_URL();
     if (!url) {
       console.warn('Persist skipped: MY_CHORDS_EDIT_URL not set.', reason);
       return;
     }
+    const data = buildDataFromDOM();
+    const patchUrl = window.MY_CHORDS_PATCH_URL;
     try {
-      await fetch(url, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(buildDataFromDOM()),
-      });
+      if (patchUrl && (await savePatch(patchUrl, data))) return;
     } catch (e) {
+      console.warn('Patch save failed, saving full library:', reason, e);
+    }
+    try {
+      await saveFull(url, data);
+    } catch (e) {
+      persistedState = null;
       console.warn('Auto-save failed:', reason, e);
     }
   }
 
+  // Saves run one at a time so each patch is based on the previous one.
+  function persist(reason) {
+    persistQueue = persistQueue.then(() => persistNow(reason));
+    return persistQueue;
+  }
+
   function beginEditing(sourceCard) {
     const resolvedSource = sourceCard && sourceCard.__sourceCard ? sourceCard.__sourceCard : sourceCard;
     if (!resolvedSource) return;
@@ -10,6 +10,7 @@
     const genId = () => `c_${Date.now()}_${Math.random().toString(16).slice(2, 6)}`;
     const COLLECTIONS_EXPORT_URL = '/my-collections/export';
     const COLLECTIONS_IMPORT_URL = '/my-collections/import';
+    const IMPORT_PROGRESS_BASE = '/import-progress/';
     const COLLECTIONS_EXPORT_GROUP_BASE = '/my-collections/export-group/';
     const CONTROL_TOOLTIP_TEXT = {
         undo: 'Undo (Ctrl+Z)',
@@ -95,7 +96,7 @@
     async function hydrateCollectionsFromPage(reason = '') {
         try {
             const res = await fetch(window.location.href, {
-                cache: 'no-store',
+                cache: 'no-cache',
                 headers: { 'X-Requested-With': 'fetch' },
             });
             if (!res.ok) throw new Error('fetch failed');
@@ -107,25 +108,46 @@
         }
     }
 
-    async function handleImportText(text) {
-        let parsed;
-        try {
-            parsed = JSON.parse(text);
-        } catch (e) {
-            window.alert('Import failed: invalid JSON file.');
-            return;
-        }
-        if (!parsed || typeof parsed !== 'object' || !Array.isArray(parsed.groups)) {
-            window.alert('Import failed: file is not a collections export.');
-            return;
+    async function pollImportProgress(importId, button, isDone) {
+        const label = button ? button.getAttribute('title') : null;
+        while (!isDone()) {
+            await new Promise((resolve) => setTimeout(resolve, 500));
+            if (isDone()) break;
+            try {
+                const res = await fetch(`${IMPORT_PROGRESS_BASE}${encodeURIComponent(importId)}`, { cache: 'no-store' });
+                if (!res.ok) continue;
+                const progress = await res.json();
+                if (button && progress.total_bytes) {
+                    const pct = Math.min(100, Math.round((progress.bytes_read / progress.total_bytes) * 100));
+                    button.setAttribute('title', `Importing… ${pct}% (${progress.collections} collections)`);
+                }
+            } catch (e) {
+                // Progress is best effort.
+            }
         }
+        if (button && label !== null) button.setAttribute('title', label);
+    }
 
+    async function handleImportFile(file, button) {
+        // The file is sent as-is; the server parses it incrementally.
+        const importId = `imp_${Date.now()}_${Math.random().toString(16).slice(2, 8)}`;
+        let done = false;
+        if (button) button.setAttribute('aria-busy', 'true');
+        const polling = pollImportProgress(importId, button, () => done);
         try {
             const res = await fetch(COLLECTIONS_IMPORT_URL, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(parsed),
+                headers: { 'Content-Type': 'application/json', 'X-Import-Id': importId },
+                body: file,
             });
+            if (res.status === 400) {
+                window.alert('Import failed: file is not a collections export.');
+                return;
+            }
+            if (res.status === 413) {
+                window.alert('Import failed: file is too large.');
+                return;
+            }
             if (!res.ok) throw new Error(`Import failed: ${res.status}`);
             const contentType = res.headers.get('Content-Type') || '';
             if (contentType.includes('html')) {
@@ -137,6 +159,10 @@
         } catch (e) {
             console.warn('[collections] import failed', e);
             window.alert('Import failed. Please try again.');
+        } finally {
+            done = true;
+            await polling;
+            if (button) button.removeAttribute('aria-busy');
         }
     }
 
@@ -171,13 +197,7 @@
             fileInput._wired = true;
             fileInput.addEventListener('change', () => {
                 if (!fileInput.files || !fileInput.files.length) return;
-                const file = fileInput.files[0];
-                const reader = new FileReader();
-                reader.onload = (e) => {
-                    const text = e?.target?.result;
-                    if (typeof text === 'string') handleImportText(text);
-                };
-                reader.readAsText(file);
+                handleImportFile(fileInput.files[0], importBtn);
             });
         }
 
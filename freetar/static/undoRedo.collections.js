@@ -113,7 +113,7 @@
 
   async function refreshFromCurrentPage(reason = '', { pushHistory = false } = {}) {
     const res = await fetch(window.location.href, {
-      cache: 'no-store',
+      cache: 'no-cache',
       headers: { 'X-Requested-With': 'fetch' },
     });
     if (!res.ok) throw new Error('fetch failed: ' + res.status);
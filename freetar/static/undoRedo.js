@@ -142,9 +142,9 @@
         body: JSON.stringify(targetState),
       });
 
-      // 2) Fetch fresh HTML (no cache)
+      // 2) Fetch fresh HTML (revalidated with the server's ETag)
       const res = await fetch(window.location.href, {
-        cache: 'no-store',
+        cache: 'no-cache',
         headers: { 'X-Requested-With': 'fetch' },
       });
       if (!res.ok) throw new Error(`fetch failed: ${res.status}`);
@@ -0,0 +1,197 @@
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStore:
+    """
+    Small persistent key/value store for parsed upstream data.
+
+    Values are pickled and zlib compressed. Every entry has an absolute
+    expiry (0 = never). Each thread gets its own connection; the database
+    runs in WAL mode so readers do not block the writer.
+
+    With ``max_entries`` and/or ``max_bytes`` (of stored values) set, writes
+    periodically evict expired entries and then the least recently used
+    ones until the store is back under 90% of the limits.
+    """
+
+    # Reads refresh an entry's last-use time at most this often (seconds).
+    TOUCH_INTERVAL = 60
+    # Limits are checked every this many writes, per process.
+    EVICT_EVERY = 64
+
+    def __init__(self, path: str | Path, max_entries: int = 0, max_bytes: int = 0):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._inherited = []
+        self._writes = 0
+        self._evict_lock = threading.Lock()
+        self.evicted = 0
+        self._connect()
+        self.evict()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A SQLite connection must not be used across fork(); open fresh ones
+        # in the child, but keep the parent's alive so they are never closed here.
+        self._inherited.append(self._local)
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " value BLOB NOT NULL,"
+                " stored_at REAL NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+            if "accessed_at" not in columns:
+                # Databases from before LRU eviction: treat stored_at as the last use.
+                try:
+                    conn.execute("ALTER TABLE entries ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0")
+                    conn.execute("UPDATE entries SET accessed_at = stored_at")
+                except sqlite3.OperationalError:
+                    pass  # added by another process meanwhile
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_stored_at ON entries (stored_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _dumps(value) -> bytes:
+        return zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _loads(blob: bytes):
+        return pickle.loads(zlib.decompress(blob))
+
+    def get(self, key: str):
+        return self.get_with_expiry(key)[0]
+
+    def get_with_expiry(self, key: str):
+        """Return ``(value, expires_at)`` or ``(None, 0)`` if missing or expired."""
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, expires_at, accessed_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None, 0
+            blob, expires_at, accessed_at = row
+            now = time.time()
+            if expires_at and expires_at <= now:
+                self.delete(key)
+                return None, 0
+            if now - accessed_at > self.TOUCH_INTERVAL:
+                conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            return self._loads(blob), expires_at
+        except Exception as exc:
+            logger.warning("Cache store read failed for %s: %s", key, exc)
+            return None, 0
+
+    def set(self, key: str, value, timeout: int = 0) -> bool:
+        now = time.time()
+        expires_at = now + timeout if timeout else 0
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO entries (key, value, stored_at, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, self._dumps(value), now, expires_at, now),
+            )
+        except Exception as exc:
+            logger.warning("Cache store write failed for %s: %s", key, exc)
+            return False
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self.evict()
+        return True
+
+    def delete(self, key: str):
+        try:
+            self._connect().execute("DELETE FROM entries WHERE key = ?", (key,))
+        except Exception as exc:
+            logger.warning("Cache store delete failed for %s: %s", key, exc)
+
+    def recent(self, limit: int):
+        """Yield ``(key, value, expires_at)`` for the newest live entries."""
+        rows = self._connect().execute(
+            "SELECT key, value, expires_at FROM entries"
+            " WHERE expires_at = 0 OR expires_at > ?"
+            " ORDER BY stored_at DESC LIMIT ?",
+            (time.time(), limit),
+        ).fetchall()
+        for key, blob, expires_at in rows:
+            try:
+                yield key, self._loads(blob), expires_at
+            except Exception as exc:
+                logger.warning("Skipping unreadable cache entry %s: %s", key, exc)
+
+    def purge_expired(self) -> int:
+        cur = self._connect().execute(
+            "DELETE FROM entries WHERE expires_at != 0 AND expires_at <= ?", (time.time(),)
+        )
+        return cur.rowcount
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def size_bytes(self) -> int:
+        return self._connect().execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM entries").fetchone()[0]
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones, if over a limit."""
+        if not (self.max_entries or self.max_bytes):
+            return 0
+        if not self._evict_lock.acquire(blocking=False):
+            return 0  # another thread is already at it
+        try:
+            removed = self.purge_expired()
+            conn = self._connect()
+            if self.max_entries:
+                excess = self.count() - self.max_entries
+                if excess > 0:
+                    target = excess + self.max_entries // 10
+                    removed += conn.execute(
+                        "DELETE FROM entries WHERE key IN"
+                        " (SELECT key FROM entries ORDER BY accessed_at LIMIT ?)",
+                        (target,),
+                    ).rowcount
+            if self.max_bytes:
+                excess = self.size_bytes() - self.max_bytes
+                if excess > 0:
+                    excess += self.max_bytes // 10
+                    doomed = []
+                    cursor = conn.execute("SELECT key, LENGTH(value) FROM entries ORDER BY accessed_at")
+                    for key, size in cursor:
+                        if excess <= 0:
+                            break
+                        doomed.append((key,))
+                        excess -= size
+                    cursor.close()
+                    conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+                    removed += len(doomed)
+        except Exception as exc:
+            logger.warning("Cache store eviction failed: %s", exc)
+            return 0
+        finally:
+            self._evict_lock.release()
+        self.evicted += removed
+        return removed
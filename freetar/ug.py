@@ -1,13 +1,18 @@
 import requests
-from bs4 import BeautifulSoup
 from urllib.parse import quote, urlparse
+import functools
 import json
-import re
+import os
 
 from dataclasses import dataclass, field
+from . import parsepool, tabmarkup, upstream
+from .jsstore import extract_js_store_bs, stream_js_store
 from .utils import FreetarError
 
-USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.3"
+# "classic" renders tabs with &nbsp;/<br/>, "compact" keeps the raw
+# whitespace and renders them in a <pre> block.
+TAB_RENDER_MODE = os.environ.get("FREETAR_TAB_RENDER", "classic")
+CHORD_MEMO_SIZE = int(os.environ.get("FREETAR_CHORD_MEMO_SIZE", "2048"))
 
 
 @dataclass
@@ -63,6 +68,7 @@ class SongDetail:
             _tuning = data["store"]["page"]["data"]["tab_view"]["meta"].get("tuning")
             self.tuning = f"{_tuning['value']} ({_tuning['name']})" if _tuning else None
         self.tab_url = data["store"]["page"]["data"]["tab"]["tab_url"]
+        self.tab_id = data["store"]["page"]["data"]["tab"].get("id")
         self.alternatives = []
         for alternative in data["store"]["page"]["data"]["tab_view"]["versions"]:
             if alternative.get("type", "") != "Official":
@@ -73,29 +79,48 @@ class SongDetail:
         return f"{self.artist_name} - {self.song_name}"
 
     def fix_tab(self):
-        tab = self.tab
-        tab = tab.replace("\r\n", "<br/>")
-        tab = tab.replace("\n", "<br/>")
-        tab = tab.replace(" ", "&nbsp;")
-        tab = tab.replace("[tab]", "")
-        tab = tab.replace("[/tab]", "")
-
-        # (?P<root>[A-Ha-h](#|b)?) : Chord root is any letter A - H with an optional sharp or flat at the end
-        # (?P<quality>[^[/]+)?  : Chord quality is anything after the root, but before the `/` for the base note
-        # (?P<bass>/[A-Ha-h](#|b)?)? :  Chord quality is anything after the root, including parens in the case of 'm(maj7)'
-        # tab = re.sub(r'\[ch\](?P<root>[A-Ga-g](#|b)?)(?P<quality>[#\w()]+)?(?P<bass>/[A-Ga-g](#|b)?)?\[\/ch\]', self.parse_chord, tab)
-        tab = re.sub(r'\[ch\](?P<root>[A-Ha-h](#|b)?)(?P<quality>[^[/]+)?(?P<bass>/[A-Ha-h](#|b)?)?\[\/ch\]', self.parse_chord, tab)
-        self.tab = tab
-
-    def parse_chord(self, chord):
-        root = '<span class="chord-root">%s</span>' % chord.group('root')
-        quality = ''
-        bass = ''
-        if chord.group('quality') is not None:
-            quality = '<span class="chord-quality">%s</span>' % chord.group('quality')
-        if chord.group('bass') is not None:
-            bass = '/<span class="chord-bass">%s</span>' % chord.group('bass')[1:]
-        return '<span class="chord fw-bold">%s</span>' % (root + quality + bass)
+        tokens = tabmarkup.tokenize(self.tab)
+        self.compact = TAB_RENDER_MODE == "compact"
+        if self.compact:
+            self.tab = tabmarkup.to_compact_html(tokens)
+        else:
+            self.tab = tabmarkup.to_html(tokens)
+
+
+class TabEntry:
+    """
+    Compact, render-ready form of a SongDetail (with chords and fingerings).
+
+    This is what the tab cache stores, once per canonical UG tab, no matter
+    which URL form (/tab/<artist>/<song> or /tab/<tabid>) was requested.
+    """
+
+    __slots__ = ("tab", "artist_name", "song_name", "version", "_type", "rating",
+                 "difficulty", "capo", "tuning", "tab_url", "tab_id", "alternatives",
+                 "chords", "fingers_for_strings", "compact")
+
+    @classmethod
+    def from_song(cls, s: SongDetail) -> "TabEntry":
+        entry = cls()
+        for name in cls.__slots__:
+            setattr(entry, name, getattr(s, name, None))
+        entry.alternatives = tuple(s.alternatives)
+        return entry
+
+    @property
+    def canonical_key(self) -> str:
+        if self.tab_id is not None:
+            return str(self.tab_id)
+        return tab_url_path(self.tab_url)
+
+    def __repr__(self):
+        return f"{self.artist_name} - {self.song_name}"
+
+
+def tab_url_path(tab_url: str) -> str:
+    """'https://tabs.ultimate-guitar.com/tab/a/b-123' -> 'a/b-123' (the ug_tab argument)."""
+    path = urlparse(tab_url or "").path
+    return path.removeprefix("/tab/").strip("/")
 
 
 @dataclass
@@ -104,25 +129,23 @@ class Search:
     total_pages: int
     current_page: int
 
-    def __init__(self, value: str, page: int):
+    def __init__(self, value: str, page: int, budget: float | None = None):
         try:
-            resp = requests.get(f"https://www.ultimate-guitar.com/search.php?page={page}&search_type=title&value={quote(value)}",
-                                headers={'User-Agent': USER_AGENT})
-            resp.raise_for_status()
-            bs = BeautifulSoup(resp.text, 'html.parser') # data can be None
-            data = bs.find("div", {"class": "js-store"}) # KeyError
-            data = json.loads(data.attrs['data-content'])
-            self.results = self.get_results(data)
-            self.total_pages = data['store']['page']['data']['pagination']['total']
-            self.current_page = data['store']['page']['data']['pagination']['current']
-            #print(json.dumps(data, indent=4))
+            payload, page_html = upstream.fetch(
+                f"https://www.ultimate-guitar.com/search.php?page={page}&search_type=title&value={quote(value)}",
+                _read_page, budget)
+            self.results, self.total_pages, self.current_page = parsepool.run(
+                parse_search_page, payload, page_html)
+        except upstream.UpstreamUnavailable as e:
+            raise FreetarError(str(e)) from e
         except requests.exceptions.RequestException:
             # don't print full URL here, in case of 404
             raise FreetarError(f"Could not find any chords for '{value}'.")
-        except (KeyError, ValueError, AttributeError) as e:
+        except (KeyError, ValueError, AttributeError, TimeoutError) as e:
             raise FreetarError(f"Could not search for chords: {e}") from e
 
-    def get_results(self, data: object):
+    @staticmethod
+    def get_results(data: object):
         results = data['store']['page']['data']['results']
         ug_results = []
         for result in results:
@@ -133,6 +156,81 @@ class Search:
         return ug_results
 
 
+def parse_search_page(payload: str | None, page_html: str | None = None):
+    """js-store payload (or the whole page) -> (results, total_pages, current_page)."""
+    if payload is None:
+        payload = extract_js_store_bs(page_html)
+    data = json.loads(payload)
+    #print(json.dumps(data, indent=4))
+    pagination = data['store']['page']['data']['pagination']
+    return Search.get_results(data), pagination['total'], pagination['current']
+
+
+class FrozenDict(dict):
+    """Read-only dict for memoized chord diagrams shared between tabs."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("FrozenDict is read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+@functools.lru_cache(maxsize=CHORD_MEMO_SIZE)
+def chord_variant(frets: tuple, fingers: tuple):
+    """
+    Diagram rows ({fret: (0/1 per string)}) and per-string fingering for one
+    applicature variant, or None if nothing is fretted. The same voicings show
+    up in almost every song, so results are memoized and immutable.
+    """
+    min_fret = min(frets)
+    max_fret = max(frets)
+    possible_frets = list(range(min_fret, max_fret+1))
+    variants_temp = {
+        possible_fret: tuple([1 if b == possible_fret else 0 for b in frets][::-1])
+        for possible_fret
+        in possible_frets
+        if possible_fret > 0
+    }
+
+    variants = dict()
+    found = False
+    for fret, strings in variants_temp.items():
+        if not found and 1 in strings:
+            found = True
+
+        if found:
+            variants[fret] = strings
+
+    if not len(variants):
+        return None
+    while len(variants) < 6:
+        variants[max(variants) + 1] = (0,) * 6
+
+    variant_strings_pressed = [sum(x) for x in zip(*variants.values())]
+    unstrummed_strings = [int(not bool(y)) for y in variant_strings_pressed]
+
+    fingering_for_variant = tuple(
+        "x" if x else finger
+        for finger, x in zip(fingers[::-1], unstrummed_strings)
+    )
+    return FrozenDict(variants), fingering_for_variant
+
+
+def chord_memo_stats() -> dict:
+    info = chord_variant.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "hit_rate": round(info.hits / lookups, 3) if lookups else 0.0,
+    }
+
+
 def get_chords(s: SongDetail) -> SongDetail:
     if s.appliciture is None:
         return dict(), dict()
@@ -141,43 +239,12 @@ def get_chords(s: SongDetail) -> SongDetail:
     fingerings = {}
 
     for chord in s.appliciture:
-        for chord_variant in s.appliciture[chord]:
-            frets = chord_variant["frets"]
-            min_fret = min(frets)
-            max_fret = max(frets)
-            possible_frets = list(range(min_fret, max_fret+1))
-            variants_temp = {
-                possible_fret: [1 if b == possible_fret else 0 for b in frets][::-1]
-                for possible_fret
-                in possible_frets
-                if possible_fret > 0
-            }
-
-            variants = dict()
-            found = False
-            for fret, fingers in variants_temp.items():
-                try:
-                    if not found and fingers.index(1) >= 0:
-                        found = True
-                except ValueError:
-                    ...
-
-                if found:
-                    variants[fret] = fingers
-
-            if not len(variants):
+        for chord_variant_data in s.appliciture[chord]:
+            variant = chord_variant(tuple(chord_variant_data["frets"]),
+                                    tuple(chord_variant_data["fingers"]))
+            if variant is None:
                 continue
-            while len(variants) < 6:
-                variants[max(variants) + 1] = [0] * 6
-
-            variant_strings_pressed = [*variants.values()]
-            variant_strings_pressed = [sum(x) for x in zip(*variant_strings_pressed)]
-            unstrummed_strings = [int(not bool(y)) for y in variant_strings_pressed]
-
-            fingering_for_variant = []
-            for finger, x in zip(chord_variant["fingers"][::-1], unstrummed_strings):
-                fingering_for_variant.append("x" if x else finger)
-            fingering_for_variant = fingering_for_variant
+            variants, fingering_for_variant = variant
 
             if chord not in chords:
                 chords[chord] = []
@@ -188,17 +255,24 @@ def get_chords(s: SongDetail) -> SongDetail:
     return chords, fingerings
 
 
-def ug_tab(url_path: str):
+def parse_tab_page(payload: str | None, page_html: str | None = None) -> TabEntry:
+    """js-store payload (or the whole page) -> render-ready TabEntry."""
+    if payload is None:
+        payload = extract_js_store_bs(page_html)
+    s = SongDetail(json.loads(payload))
+    s.chords, s.fingers_for_strings = get_chords(s)
+    return TabEntry.from_song(s)
+
+
+def _read_page(resp):
+    resp.raise_for_status()
+    return stream_js_store(resp)
+
+
+def ug_tab(url_path: str, budget: float | None = None) -> TabEntry:
     try:
-        resp = requests.get("https://tabs.ultimate-guitar.com/tab/" + url_path,
-                            headers={'User-Agent': USER_AGENT})
-        resp.raise_for_status()
-        bs = BeautifulSoup(resp.text, 'html.parser')
-        data = bs.find("div", {"class": "js-store"})
-        data = data.attrs['data-content']
-        data = json.loads(data)
-        s = SongDetail(data)
-        s.chords, s.fingers_for_strings = get_chords(s)
-        return s
-    except (KeyError, ValueError, AttributeError, requests.exceptions.RequestException) as e:
+        payload, page_html = upstream.fetch("https://tabs.ultimate-guitar.com/tab/" + url_path,
+                                            _read_page, budget)
+        return parsepool.run(parse_tab_page, payload, page_html)
+    except (KeyError, ValueError, AttributeError, TimeoutError, requests.exceptions.RequestException) as e:
         raise FreetarError(f"Could not parse chord: {e}") from e
@@ -0,0 +1,459 @@
+import collections
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.3"
+
+# One pool per upstream host (www. and tabs.ultimate-guitar.com), sized to the
+# waitress thread count so every worker thread can hold a warm connection.
+DEFAULT_POOL_CONNECTIONS = int(os.environ.get("FREETAR_UPSTREAM_POOLS", "4"))
+DEFAULT_POOL_MAXSIZE = int(
+    os.environ.get("FREETAR_UPSTREAM_POOL_SIZE", os.environ.get("THREADS", "4"))
+)
+DEFAULT_POOL_BLOCK = os.environ.get("FREETAR_UPSTREAM_POOL_BLOCK", "0") == "1"
+
+# Total time one page fetch may take, retries and hedges included.
+DEFAULT_BUDGET = float(os.environ.get("FREETAR_UPSTREAM_BUDGET", "10"))
+CONNECT_TIMEOUT = float(os.environ.get("FREETAR_UPSTREAM_CONNECT_TIMEOUT", "3.05"))
+MAX_RETRIES = int(os.environ.get("FREETAR_UPSTREAM_RETRIES", "2"))
+RETRY_BACKOFF = float(os.environ.get("FREETAR_UPSTREAM_BACKOFF", "0.2"))
+# Fire a second request when the first has not answered after the observed p95.
+HEDGE = os.environ.get("FREETAR_UPSTREAM_HEDGE", "0") == "1"
+HEDGE_MIN_SAMPLES = 20
+# Statuses that count against UG's health (circuit breaker); a 429 is UG
+# pacing us, not failing, so it is only retried.
+FAILURE_STATUSES = {500, 502, 503, 504}
+RETRY_STATUSES = FAILURE_STATUSES | {429}
+# Circuit breaker: open after this many consecutive failures, probe again
+# after the reset timeout.
+BREAKER_FAILURES = int(os.environ.get("FREETAR_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.environ.get("FREETAR_BREAKER_RESET", "30"))
+# Token bucket for requests to UG (0 = unlimited) and how long a request may
+# wait for a token.
+RATE_LIMIT = float(os.environ.get("FREETAR_UPSTREAM_RATE", "10"))
+RATE_BURST = int(os.environ.get("FREETAR_UPSTREAM_BURST", "20"))
+RATE_WAIT = float(os.environ.get("FREETAR_UPSTREAM_RATE_WAIT", "1"))
+
+
+class UpstreamUnavailable(requests.exceptions.ConnectionError):
+    """Raised without contacting UG while the breaker is open or we are over our rate."""
+
+
+class _Counters:
+    """Thread-safe counters for upstream connection usage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {
+            "requests": 0,
+            "new_connections": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "budget_exhausted": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+        }
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+
+counters = _Counters()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        counters.incr("new_connections")
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        counters.incr("new_connections")
+        return super()._new_conn()
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools count every freshly opened connection."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+_session = None
+_session_lock = threading.Lock()
+_pool_config = {
+    "pool_connections": DEFAULT_POOL_CONNECTIONS,
+    "pool_maxsize": DEFAULT_POOL_MAXSIZE,
+    "pool_block": DEFAULT_POOL_BLOCK,
+}
+
+
+def _count_response(resp, *args, **kwargs):
+    counters.incr("requests")
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    session.headers.update({"User-Agent": USER_AGENT, "Connection": "keep-alive"})
+    adapter = PooledAdapter(
+        pool_connections=_pool_config["pool_connections"],
+        pool_maxsize=_pool_config["pool_maxsize"],
+        pool_block=_pool_config["pool_block"],
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.hooks["response"].append(_count_response)
+    return session
+
+
+def configure(pool_connections: int | None = None,
+              pool_maxsize: int | None = None,
+              pool_block: bool | None = None):
+    """
+    Adjust the pool limits. Call before serving; an existing session is
+    replaced so the new limits take effect.
+    """
+    global _session
+    with _session_lock:
+        if pool_connections is not None:
+            _pool_config["pool_connections"] = max(1, int(pool_connections))
+        if pool_maxsize is not None:
+            _pool_config["pool_maxsize"] = max(1, int(pool_maxsize))
+        if pool_block is not None:
+            _pool_config["pool_block"] = bool(pool_block)
+        old, _session = _session, None
+    if old is not None:
+        old.close()
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide keep-alive session, creating it on first use."""
+    global _session
+    session = _session
+    if session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+            session = _session
+    return session
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return get_session().get(url, **kwargs)
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open single probe -> closed."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self._stats["rejected"] += 1
+                    return False
+                self._state = self.HALF_OPEN
+                self._probing = False
+            if self._state == self.HALF_OPEN:
+                if self._probing:
+                    self._stats["rejected"] += 1
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def release_probe(self):
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._stats["opened"] += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self) -> dict:
+        state = self.state
+        with self._lock:
+            values = dict(self._stats)
+            values["consecutive_failures"] = self._failures
+        values["state"] = state
+        return values
+
+
+class TokenBucket:
+    """Classic token bucket; ``rate`` tokens per second up to ``burst``."""
+
+    def __init__(self, rate: float = RATE_LIMIT, burst: int = RATE_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {"granted": 0, "throttled": 0, "rejected": 0}
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self._stats["granted"] += 1
+                return True
+            return False
+
+    def available(self) -> float:
+        """Tokens currently in the bucket (``burst`` when unlimited)."""
+        if self.rate <= 0:
+            return float(self.burst)
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def acquire(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for a token."""
+        if self.try_acquire():
+            return True
+        with self._lock:
+            self._stats["throttled"] += 1
+        end = time.monotonic() + max(0.0, timeout)
+        while True:
+            with self._lock:
+                wait_for = (1 - self._tokens) / self.rate
+            if time.monotonic() + wait_for > end:
+                with self._lock:
+                    self._stats["rejected"] += 1
+                return False
+            time.sleep(wait_for)
+            if self.try_acquire():
+                return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refill()
+            values = dict(self._stats)
+            values["tokens"] = round(self._tokens, 2)
+        values["rate"] = self.rate
+        values["burst"] = self.burst
+        return values
+
+
+breaker = CircuitBreaker()
+limiter = TokenBucket()
+
+
+class Deadline:
+    """Absolute point in time by which an upstream fetch has to be done."""
+
+    def __init__(self, budget: float):
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def check(self):
+        if self.remaining() <= 0:
+            counters.incr("budget_exhausted")
+            raise requests.exceptions.Timeout("Upstream latency budget exhausted")
+
+
+class _Latencies:
+    """Rolling window of successful fetch durations, for the hedge threshold."""
+
+    def __init__(self, size: int = 200):
+        self._lock = threading.Lock()
+        self._samples = collections.deque(maxlen=size)
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self) -> float | None:
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+latencies = _Latencies()
+_hedge_executor = None
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _session_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=max(2, _pool_config["pool_maxsize"] * 2),
+                thread_name_prefix="freetar-hedge",
+            )
+        return _hedge_executor
+
+
+def _matches(exc: Exception, statuses: set[int]) -> bool:
+    """Connection errors, timeouts, and HTTP errors with one of ``statuses``."""
+    if isinstance(exc, UpstreamUnavailable):
+        return False
+    if isinstance(exc, requests.exceptions.HTTPError):
+        return exc.response is not None and exc.response.status_code in statuses
+    return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def _is_failure(exc: Exception) -> bool:
+    """Errors that say something about UG's health (a 404 or 429 does not)."""
+    return _matches(exc, FAILURE_STATUSES)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    return _matches(exc, RETRY_STATUSES)
+
+
+def _attempt(url: str, handler, deadline: Deadline):
+    deadline.check()
+    if not breaker.allow():
+        raise UpstreamUnavailable("Ultimate Guitar is not responding, try again later")
+    if not limiter.acquire(min(RATE_WAIT, deadline.remaining())):
+        breaker.release_probe()  # UG was not contacted, let another request probe
+        raise UpstreamUnavailable("Too many requests to Ultimate Guitar, try again later")
+    remaining = deadline.remaining()
+    started = time.monotonic()
+    try:
+        with get(url, stream=True, timeout=(min(CONNECT_TIMEOUT, remaining), remaining)) as resp:
+            resp.deadline = deadline
+            result = handler(resp)
+    except Exception as exc:
+        if isinstance(exc, requests.exceptions.Timeout):
+            counters.incr("timeouts")
+        if _is_failure(exc):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise
+    breaker.record_success()
+    latencies.add(time.monotonic() - started)
+    return result
+
+
+def _hedged_attempt(url: str, handler, deadline: Deadline):
+    threshold = latencies.p95() if HEDGE else None
+    if threshold is None or threshold >= deadline.remaining():
+        return _attempt(url, handler, deadline)
+
+    executor = _get_hedge_executor()
+    primary = executor.submit(_attempt, url, handler, deadline)
+    done, _ = wait([primary], timeout=threshold)
+    if done:
+        return primary.result()
+
+    counters.incr("hedges")
+    hedge = executor.submit(_attempt, url, handler, deadline)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0, deadline.remaining()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    counters.incr("hedge_wins")
+                return future.result()
+            error = error or future.exception()
+    if error is not None:
+        raise error
+    deadline.check()
+    raise requests.exceptions.Timeout("Upstream latency budget exhausted")
+
+
+def fetch(url: str, handler, budget: float | None = None):
+    """
+    GET ``url`` (streamed) and return ``handler(resp)``, all within
+    ``budget`` seconds. Connect/read timeouts are derived from what is left of
+    the budget; connection errors, timeouts and 429/5xx responses (raised by
+    the handler via ``raise_for_status``) are retried with jittered
+    exponential backoff while the budget allows. The response carries the
+    ``deadline`` so handlers can stop streaming once it has passed.
+    """
+    deadline = Deadline(DEFAULT_BUDGET if budget is None else budget)
+    retries = 0
+    while True:
+        try:
+            return _hedged_attempt(url, handler, deadline)
+        except requests.exceptions.RequestException as exc:
+            if not _is_retryable(exc) or retries >= MAX_RETRIES:
+                raise
+            backoff = random.uniform(0, RETRY_BACKOFF * (2 ** retries))
+            if backoff >= deadline.remaining():
+                raise
+            retries += 1
+            counters.incr("retries")
+            time.sleep(backoff)
+
+
+def stats() -> dict:
+    values = counters.snapshot()
+    values["reused_connections"] = max(0, values["requests"] - values["new_connections"])
+    values.update(_pool_config)
+    values["budget"] = DEFAULT_BUDGET
+    values["hedging"] = HEDGE
+    values["p95"] = latencies.p95()
+    values["breaker"] = breaker.stats()
+    values["limiter"] = limiter.stats()
+    return values
@@ -0,0 +1,332 @@
+"""
+Write-behind for chord library saves.
+
+Autosaves arrive in bursts (drag reorders, undo/redo replays), so a save
+is acknowledged as soon as it is appended to a journal and fsynced; the
+library itself is written by a background thread once the collection has
+been quiet for ``FREETAR_WRITE_BEHIND_DELAY`` seconds (at most
+``FREETAR_WRITE_BEHIND_MAX_DELAY`` after the first pending save), so a
+burst costs one storage write. Reads see pending saves.
+
+On start, saves left in the journal by a crash are replayed. Flushing
+rotates the journal to ``<journal>.flushing`` and deletes it once the
+libraries are stored, so a crash mid-flush replays them again.
+
+The journal belongs to one process: with several workers the wrapper is
+disabled and writes go straight to storage.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from .collections_store import RevisionConflict, fsync_dir
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("FREETAR_WRITE_BEHIND", "1") == "1"
+DELAY = float(os.environ.get("FREETAR_WRITE_BEHIND_DELAY", "0.5"))
+MAX_DELAY = float(os.environ.get("FREETAR_WRITE_BEHIND_MAX_DELAY", "5"))
+DEFAULT_JOURNAL_PATH = Path(__file__).with_name("collections.journal")
+
+
+def _read_journal(path: Path) -> dict:
+    entries = {}
+    try:
+        fh = path.open("rb")
+    except FileNotFoundError:
+        return entries
+    with fh:
+        for line in fh:
+            try:
+                record = json.loads(line)
+                entries[record["id"]] = record["data"]
+            except (ValueError, KeyError, TypeError):
+                # A torn last line from a crash mid-append was never acknowledged.
+                logger.warning("Ignoring unreadable journal record in %s", path)
+    return entries
+
+
+class WriteBehindStore:
+    """Wraps a collections store; everything but library writes is passed through."""
+
+    def __init__(self, store, journal_path: str | Path, delay: float = DELAY, max_delay: float = MAX_DELAY):
+        self.store = store
+        self.journal_path = Path(journal_path)
+        self.flushing_path = self.journal_path.with_name(self.journal_path.name + ".flushing")
+        self.delay = delay
+        self.max_delay = max_delay
+        self.enabled = True
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # id -> (groups, first pending at, last written at), monotonic times
+        self._pending: dict[str, tuple[list, float, float]] = {}
+        # id -> (groups, token) being written by the current flush
+        self._inflight: dict[str, tuple[list, str]] = {}
+        # id -> (storage token after our flush, token handed out for it)
+        self._flushed: dict[str, tuple[str, str]] = {}
+        self._written: dict[str, tuple[int, float]] = {}
+        self._seq = 0
+        self._epoch = f"{os.getpid():x}{time.time_ns():x}"
+        self._journal = None
+        self._thread = None
+        self._pid = os.getpid()
+        self._stats = {"writes": 0, "coalesced": 0, "flushes": 0, "flush_errors": 0, "recovered": 0}
+        self._recover()
+        atexit.register(self.close)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    # -- journal ---------------------------------------------------------
+
+    def _recover(self):
+        entries = _read_journal(self.flushing_path)
+        entries.update(_read_journal(self.journal_path))
+        if not entries:
+            return
+        logger.warning("Replaying %d unsaved chord libraries from %s", len(entries), self.journal_path)
+        # Consolidate both files into one journal before anything is flushed.
+        tmp = self.journal_path.with_name(self.journal_path.name + ".tmp")
+        with tmp.open("wb") as fh:
+            for cid, data in entries.items():
+                fh.write(self._record(cid, data))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.journal_path)
+        self.flushing_path.unlink(missing_ok=True)
+        fsync_dir(self.journal_path.parent)
+        now = time.monotonic()
+        for cid, data in entries.items():
+            self._pending[cid] = (data, now, now)
+            self._bump(cid)
+        self._stats["recovered"] = len(entries)
+        self._start()
+
+    @staticmethod
+    def _record(collection_id: str, groups: list) -> bytes:
+        line = json.dumps({"id": collection_id, "data": groups}, ensure_ascii=False, separators=(",", ":"))
+        return line.encode("utf-8") + b"\n"
+
+    def _append(self, collection_id: str, groups: list):
+        if self._journal is None:
+            self._journal = self.journal_path.open("ab")
+        self._journal.write(self._record(collection_id, groups))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _rotate(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self.journal_path.exists():
+            os.replace(self.journal_path, self.flushing_path)
+
+    # -- background flushing ---------------------------------------------
+
+    def _start(self):
+        if self._pid != os.getpid():
+            # Forked: the parent's thread and journal handle are not ours.
+            self._pid = os.getpid()
+            self._thread = None
+            self._journal = None
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="freetar-write-behind", daemon=True)
+            self._thread.start()
+
+    def _due_in(self, now: float) -> float | None:
+        if not self._pending:
+            return None
+        return min(min(last + self.delay, first + self.max_delay) for _, first, last in self._pending.values()) - now
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                wait = self._due_in(time.monotonic())
+                while wait is None or wait > 0:
+                    self._wakeup.wait(wait)
+                    wait = self._due_in(time.monotonic())
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed")
+                time.sleep(self.delay)
+
+    def flush(self):
+        """Write every pending library to storage now."""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            self._rotate()
+            batch = {cid: data for cid, (data, _, _) in self._pending.items()}
+            self._inflight = {cid: (data, self._token(cid)) for cid, data in batch.items()}
+            self._pending.clear()
+        # Saves keep being acknowledged (into a fresh journal) while storage is written.
+        try:
+            self.store.write_many(libraries=batch)
+            versions = {cid: self.store.library_version(cid)[0] for cid in batch}
+        except Exception:
+            logger.exception("Failed to write %d chord libraries; keeping them queued", len(batch))
+            with self._lock:
+                self._stats["flush_errors"] += 1
+                now = time.monotonic()
+                for cid, data in batch.items():
+                    # Newer saves made while we were writing win.
+                    if cid not in self._pending:
+                        self._pending[cid] = (data, now, now)
+                        self._append(cid, data)
+                self._inflight = {}
+            return
+        self.flushing_path.unlink(missing_ok=True)
+        fsync_dir(self.journal_path.parent)
+        with self._lock:
+            for cid, (_, token) in self._inflight.items():
+                self._flushed[cid] = (versions[cid], token)
+            self._inflight = {}
+            self._stats["flushes"] += 1
+
+    def close(self):
+        """Flush and write through from now on."""
+        with self._flush_lock:
+            self._flush()
+            with self._lock:
+                self.enabled = False
+                if self._journal is not None:
+                    self._journal.close()
+                    self._journal = None
+
+    # -- store interface -------------------------------------------------
+
+    def _bump(self, collection_id: str):
+        self._seq += 1
+        self._written[collection_id] = (self._seq, time.time())
+
+    def _token(self, collection_id: str) -> str:
+        return f"w{self._epoch}.{self._written.get(collection_id, (0,))[0]}"
+
+    def write_library(self, collection_id: str, groups: list):
+        with self._lock:
+            if not self.enabled:
+                self.store.write_library(collection_id, groups)
+                return
+            self._append(collection_id, groups)
+            now = time.monotonic()
+            pending = self._pending.get(collection_id)
+            if pending is not None:
+                self._stats["coalesced"] += 1
+            self._pending[collection_id] = (groups, pending[1] if pending else now, now)
+            self._bump(collection_id)
+            self._stats["writes"] += 1
+            self._start()
+            self._wakeup.notify()
+
+    def write_many(self, metadata: list | None = None, libraries: dict | None = None,
+                   renames: dict | None = None):
+        # Rare (imports, new collections) and may need to be atomic: write through.
+        with self._flush_lock:
+            self._flush()
+            with self._lock:
+                for cid in [*(libraries or {}), *(renames or {}).values()]:
+                    self._flushed.pop(cid, None)
+                self.store.write_many(metadata=metadata, libraries=libraries, renames=renames)
+
+    def delete_libraries(self, collection_ids):
+        ids = list(collection_ids)
+        with self._flush_lock:
+            self._flush()
+            with self._lock:
+                for cid in ids:
+                    self._flushed.pop(cid, None)
+                self.store.delete_libraries(ids)
+
+    def update_library(self, collection_id: str, base: str | None, update) -> str:
+        """
+        Like ``write_library``, after checking ``base`` against the revision
+        this wrapper hands out; the journal belongs to this process, so that
+        check is enough. Once disabled (pre-fork workers share storage),
+        pending saves are flushed and storage does the compare-and-set.
+        """
+        with self._lock:
+            if self.enabled:
+                revision = self.library_version(collection_id)[0]
+                if base is not None and base != revision:
+                    raise RevisionConflict(revision)
+                self.write_library(collection_id, update(self.read_library(collection_id) or []))
+                return self._token(collection_id)
+        with self._flush_lock:
+            self._flush()
+            with self._lock:
+                store_base = base
+                flushed = self._flushed.get(collection_id)
+                if base is not None and flushed is not None and base == flushed[1]:
+                    # A token we handed out before our flush; storage knows it by its own.
+                    store_base = flushed[0]
+                try:
+                    return self.store.update_library(collection_id, store_base, update)
+                except RevisionConflict:
+                    raise RevisionConflict(self.library_version(collection_id)[0]) from None
+
+    def _queued(self, collection_id: str):
+        """Pending or in-flight groups for an id, or None."""
+        pending = self._pending.get(collection_id)
+        if pending is not None:
+            return pending
+        return self._inflight.get(collection_id)
+
+    def read_library(self, collection_id: str):
+        queued = self._queued(collection_id)
+        return queued[0] if queued is not None else self.store.read_library(collection_id)
+
+    def read_libraries(self, collection_ids) -> dict:
+        ids = list(collection_ids)
+        with self._lock:
+            queued = {cid: self._queued(cid) for cid in ids}
+        queued = {cid: entry[0] for cid, entry in queued.items() if entry is not None}
+        libraries = self.store.read_libraries([cid for cid in ids if cid not in queued])
+        libraries.update(queued)
+        return libraries
+
+    def has_library(self, collection_id: str) -> bool:
+        return self._queued(collection_id) is not None or self.store.has_library(collection_id)
+
+    def library_ids(self) -> list[str]:
+        with self._lock:
+            queued = set(self._pending) | set(self._inflight)
+        return sorted(set(self.store.library_ids()) | queued)
+
+    def library_version(self, collection_id: str) -> tuple[str, float]:
+        with self._lock:
+            if self._queued(collection_id) is not None:
+                return self._token(collection_id), self._written[collection_id][1]
+            token, ts = self.store.library_version(collection_id)
+            flushed = self._flushed.get(collection_id)
+            # Keep handing out the token from before our own flush, so an
+            # editor's revision survives it; any other write changes it.
+            if flushed is not None and flushed[0] == token:
+                return flushed[1], ts
+            return token, ts
+
+    def libraries_version(self) -> tuple[str, float]:
+        with self._lock:
+            token, ts = self.store.libraries_version()
+            if self._pending or self._inflight:
+                return f"{token}+w{self._epoch}.{self._seq}", max(ts, time.time())
+            return token, ts
+
+    def stats(self) -> dict:
+        return {**self._stats, "enabled": self.enabled, "pending": len(self._pending)}
+
+
+def wrap(store, journal_path: str | Path | None = None, enabled: bool = ENABLED):
+    if not enabled:
+        return store
+    path = journal_path or os.environ.get("FREETAR_WRITE_BEHIND_JOURNAL", str(DEFAULT_JOURNAL_PATH))
+    return WriteBehindStore(store, path)
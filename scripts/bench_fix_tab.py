@@ -0,0 +1,62 @@
+"""
+Micro-benchmark for the tab markup tokenizer.
+
+Usage:
+    poetry run python scripts/bench_fix_tab.py [saved-tab-page.html ...]
+
+Times each saved UG tab page (see scripts/bench_js_store.py) through the
+previous replace/regex implementation of SongDetail.fix_tab (the reference
+kept in tests/test_tabmarkup.py, which checks both produce identical output)
+and through freetar.tabmarkup. Without arguments a large synthetic tab is used.
+"""
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from freetar import tabmarkup  # noqa: E402
+from freetar.jsstore import extract_js_store  # noqa: E402
+from tests.test_tabmarkup import legacy_fix_tab  # noqa: E402
+
+
+def new_fix_tab(tab: str) -> str:
+    return tabmarkup.to_html(tabmarkup.tokenize(tab))
+
+
+def synthetic_tab() -> str:
+    lines = ["[tab]"]
+    chords = ["Am", "C", "G/B", "F#m7b5", "Dsus4", "Cmaj7", "E7", "Bbm"]
+    for i in range(600):
+        lines.append("   ".join(f"[ch]{chords[(i + j) % len(chords)]}[/ch]" for j in range(4)))
+        lines.append(f"Some lyrics on line {i} with    a few   gaps")
+        if i % 10 == 0:
+            lines.append("e|-----0-----0---|\nB|---1---1-----1-|")
+    lines.append("[/tab]")
+    return "\r\n".join(lines)
+
+
+def load_tabs(paths: list[str]) -> list[tuple[str, str]]:
+    tabs = []
+    for p in paths:
+        payload = extract_js_store(Path(p).read_text(encoding="utf-8", errors="replace"))
+        data = json.loads(payload)
+        tabs.append((p, data["store"]["page"]["data"]["tab_view"]["wiki_tab"]["content"]))
+    return tabs
+
+
+def main(argv: list[str]):
+    tabs = load_tabs(argv) if argv else [("synthetic", synthetic_tab())]
+
+    print(f"{'tab':40} {'chars':>8} {'chords':>7} {'legacy ms':>10} {'new ms':>8} {'speedup':>8}")
+    for name, tab in tabs:
+        runs = 50
+        old_ms = timeit.timeit(lambda: legacy_fix_tab(tab), number=runs) / runs * 1000
+        new_ms = timeit.timeit(lambda: new_fix_tab(tab), number=runs) / runs * 1000
+        chords = tab.count("[ch]")
+        print(f"{name[-40:]:40} {len(tab):>8} {chords:>7} {old_ms:>10.3f} {new_ms:>8.3f} {old_ms / new_ms:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,77 @@
+"""
+Compare the fast js-store extractor against the BeautifulSoup path.
+
+Usage:
+    poetry run python scripts/bench_js_store.py saved-page.html [more.html ...]
+
+Save pages with e.g. ``curl -A "Mozilla/5.0" -o tab.html <ug tab url>``.
+Without arguments a synthetic page shaped like a UG tab page is used.
+"""
+import html
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from freetar.jsstore import StreamExtractor, extract_js_store, extract_js_store_bs  # noqa: E402
+
+
+def synthetic_page() -> str:
+    lines = []
+    for i in range(400):
+        lines.append("[ch]Am[/ch]      [ch]C[/ch]        [ch]G/B[/ch]   ")
+        lines.append(f"Line {i} of a tab with some \"quoted\" <words> & more")
+    data = {
+        "store": {
+            "page": {
+                "data": {
+                    "tab": {"artist_name": "Someone", "song_name": "Something"},
+                    "tab_view": {"wiki_tab": {"content": "\r\n".join(lines)}},
+                }
+            }
+        }
+    }
+    filler = "\n".join(
+        f'<div class="row"><a href="/x/{i}">item {i}</a><span>{i}</span></div>' for i in range(3000)
+    )
+    return (
+        "<!doctype html><html><head><title>x</title></head><body>"
+        f"{filler}"
+        f'<div class="js-store" data-content="{html.escape(json.dumps(data))}"></div>'
+        f"{filler}"
+        "</body></html>"
+    )
+
+
+def streamed(text: str, chunk_size: int = 64 * 1024) -> str:
+    extractor = StreamExtractor()
+    for i in range(0, len(text), chunk_size):
+        if extractor.feed(text[i:i + chunk_size]):
+            break
+    return extractor.payload
+
+
+def main(argv: list[str]):
+    if argv:
+        pages = [(p, Path(p).read_text(encoding="utf-8", errors="replace")) for p in argv]
+    else:
+        pages = [("synthetic", synthetic_page())]
+
+    print(f"{'page':40} {'size':>9} {'bs4 ms':>9} {'fast ms':>9} {'stream ms':>9} {'speedup':>8}")
+    for name, text in pages:
+        expected = extract_js_store_bs(text)
+        assert extract_js_store(text) == expected, f"{name}: fast extractor differs"
+        assert streamed(text) == expected, f"{name}: streaming extractor differs"
+
+        runs = 5
+        bs_ms = timeit.timeit(lambda: extract_js_store_bs(text), number=runs) / runs * 1000
+        runs = 50
+        fast_ms = timeit.timeit(lambda: extract_js_store(text), number=runs) / runs * 1000
+        stream_ms = timeit.timeit(lambda: streamed(text), number=runs) / runs * 1000
+        print(f"{name[-40:]:40} {len(text):>9} {bs_ms:>9.2f} {fast_ms:>9.2f} {stream_ms:>9.2f} {bs_ms / fast_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
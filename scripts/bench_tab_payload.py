@@ -0,0 +1,75 @@
+"""
+Report how much smaller the compact tab rendering is than the classic one.
+
+Usage:
+    poetry run python scripts/bench_tab_payload.py [saved-tab-page.html ...]
+
+For each saved UG tab page (see scripts/bench_js_store.py), or a synthetic
+tab without arguments, prints the size of the tab markup, of the rendered
+tab.html page and of the parsed cache entry (in memory and pickled for the
+on-disk store) in classic (&nbsp;/<br/>) and compact (<pre>) mode.
+"""
+import json
+import pickle
+import sys
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_fix_tab import synthetic_tab  # noqa: E402
+from freetar import ug  # noqa: E402
+from freetar.backend import app, render_tab  # noqa: E402
+from freetar.jsstore import extract_js_store  # noqa: E402
+
+
+def synthetic_data() -> dict:
+    return {
+        "store": {"page": {"data": {
+            "tab": {"id": 1, "artist_name": "Someone", "song_name": "Something", "version": 1,
+                    "type": "Chords", "rating": 4, "tab_url": "https://tabs.ultimate-guitar.com/tab/x/y-1"},
+            "tab_view": {"wiki_tab": {"content": synthetic_tab()}, "ug_difficulty": "novice",
+                         "applicature": None, "meta": [], "versions": []},
+        }}}
+    }
+
+
+def entry_for(data: dict, mode: str) -> ug.TabEntry:
+    ug.TAB_RENDER_MODE = mode
+    song = ug.SongDetail(data)
+    song.chords, song.fingers_for_strings = ug.get_chords(song)
+    return ug.TabEntry.from_song(song)
+
+
+def measure(data: dict, mode: str) -> dict:
+    entry = entry_for(data, mode)
+    with app.test_request_context("/tab/x/y-1"):
+        page = render_tab(entry)
+    return {
+        "markup": len(entry.tab.encode()),
+        "page": len(page.encode()),
+        "memory": sys.getsizeof(entry.tab),
+        "stored": len(zlib.compress(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))),
+    }
+
+
+def main(argv: list[str]):
+    if argv:
+        pages = [(p, json.loads(extract_js_store(Path(p).read_text(encoding="utf-8", errors="replace"))))
+                 for p in argv]
+    else:
+        pages = [("synthetic", synthetic_data())]
+
+    for name, data in pages:
+        classic = measure(data, "classic")
+        compact = measure(data, "compact")
+        print(name)
+        for key, label in (("markup", "tab markup"), ("page", "rendered page"),
+                           ("memory", "cache memory (tab str)"), ("stored", "on-disk entry")):
+            saved = classic[key] - compact[key]
+            print(f"  {label:24} classic {classic[key]:>9,} B  compact {compact[key]:>9,} B"
+                  f"  saved {saved:>9,} B ({saved / classic[key]:.0%})")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,25 @@
+import os
+
+# Keep the test process away from the repo's cache database and journal.
+os.environ.setdefault("FREETAR_CACHE_DB", "")
+os.environ.setdefault("FREETAR_WRITE_BEHIND", "0")
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    """``freetar.backend`` with its collections in a fresh JSON store under ``tmp_path``."""
+    from freetar import backend as module
+    from freetar.collections_store import open_store
+
+    store = open_store(tmp_path / "my_chord_collections.json", tmp_path / "collections", "json")
+    monkeypatch.setattr(module, "collections_store", store)
+    module.collections_index.invalidate()
+    yield module
+    module.collections_index.invalidate()
+
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+from freetar.collections_store import JSONCollectionsStore, RevisionConflict, SQLiteCollectionsStore
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "json":
+        return JSONCollectionsStore(tmp_path / "meta.json", tmp_path / "collections")
+    return SQLiteCollectionsStore(tmp_path / "collections.sqlite3")
+
+
+def _library(*names):
+    return [{"group": name, "rows": [{"chords": []}]} for name in names]
+
+
+def test_revision_changes_on_quick_same_size_writes(store):
+    store.write_library("a", _library("A", "B"))
+    for names in (("B", "A"), ("A", "B"), ("B", "A")):
+        before = store.library_version("a")[0]
+        after = store.update_library("a", before, lambda _current, names=names: _library(*names))
+        assert after != before
+        assert after == store.library_version("a")[0]
+
+
+def test_stale_base_is_a_conflict(store):
+    store.write_library("a", _library("A", "B"))
+    base = store.library_version("a")[0]
+    store.update_library("a", base, lambda current: current[::-1])
+    with pytest.raises(RevisionConflict) as info:
+        store.update_library("a", base, lambda current: current + _library("C"))
+    assert info.value.revision == store.library_version("a")[0]
+    assert [g["group"] for g in store.read_library("a")] == ["B", "A"]
+
+
+def test_write_many_moves_libraries_before_writing(store):
+    store.write_many(libraries={"a": _library("old"), "tmp_a": _library("staged"), "tmp_b": _library("B")})
+    before = store.library_version("a")[0]
+    store.write_many(metadata=[{"group": "g", "collections": []}], libraries={"b": _library("newer")},
+                     renames={"tmp_a": "a", "tmp_b": "b"})
+    assert store.library_ids() == ["a", "b"]
+    assert store.read_library("a") == _library("staged")
+    assert store.read_library("b") == _library("newer")
+    assert store.library_version("a")[0] != before
+    assert store.read_metadata() == [{"group": "g", "collections": []}]
+
+
+def test_delete_libraries(store):
+    store.write_many(libraries={"a": _library("A"), "b": _library("B")})
+    store.delete_libraries(["a", "missing"])
+    assert store.library_ids() == ["b"]
+
+
+def _json_store(tmp_path):
+    return JSONCollectionsStore(tmp_path / "meta.json", tmp_path / "collections")
+
+
+def test_json_versions_do_not_reread_unchanged_libraries(tmp_path, monkeypatch):
+    store = _json_store(tmp_path)
+    store.write_many(libraries={"a": _library("A"), "b": _library("B")})
+    other = _json_store(tmp_path)
+    revision = other.library_version("a")[0]
+    assert revision == store.library_version("a")[0]
+
+    reads = []
+    read_bytes = type(tmp_path).read_bytes
+    monkeypatch.setattr(type(tmp_path), "read_bytes", lambda self: reads.append(self) or read_bytes(self))
+    for _ in range(3):
+        assert other.library_version("a")[0] == revision
+        other.libraries_version()
+    assert reads == []
+    store.write_library("a", _library("C"))
+    assert other.library_version("a")[0] != revision
+    assert len(reads) == 1
+
+
+def test_json_in_place_rewrite_with_same_stat_conflicts(tmp_path):
+    store = _json_store(tmp_path)
+    store.write_library("a", _library("A", "B"))
+    path = tmp_path / "collections" / "a.json"
+    base = store.library_version("a")[0]
+    st = path.stat()
+    # Another process rewrites the file in place within the same mtime tick.
+    path.write_bytes(path.read_bytes().replace(b'"A"', b'"X"'))
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    with pytest.raises(RevisionConflict):
+        store.update_library("a", base, lambda current: current)
+    assert [g["group"] for g in store.read_library("a")] == ["X", "B"]
+
+
+def _setup_collection(backend, client):
+    cid = backend.collections_index.first_id()
+    resp = client.post(f"/my-collections/{cid}/edit", json=_library("A", "B"))
+    assert resp.status_code == 204
+    return cid, resp.headers["X-Library-Revision"]
+
+
+def test_patch_applies_and_detects_conflicts(backend, client):
+    cid, revision = _setup_collection(backend, client)
+    move = {"op": "move_group", "from": 1, "to": 0}
+    resp = client.post(f"/my-collections/{cid}/patch", json={"base": revision, "ops": [move]})
+    assert resp.status_code == 200
+    assert [g["group"] for g in backend.load_chord_library(cid)] == ["B", "A"]
+
+    # Same-sized document, written right away: the old base must still conflict.
+    resp = client.post(f"/my-collections/{cid}/patch", json={"base": revision, "ops": [move]})
+    assert resp.status_code == 409
+    assert resp.json["revision"] != revision
+
+
+def test_patch_rejects_bad_ops(backend, client):
+    cid, revision = _setup_collection(backend, client)
+    resp = client.post(f"/my-collections/{cid}/patch",
+                       json={"base": revision, "ops": [{"op": "delete_group", "index": 5}]})
+    assert resp.status_code == 400
+    assert [g["group"] for g in backend.load_chord_library(cid)] == ["A", "B"]
+
+
+def test_patch_unknown_collection_is_404(backend, client):
+    resp = client.post("/my-collections/nope/patch", json={"base": "-", "ops": []})
+    assert resp.status_code == 404
+    assert not backend.collections_store.has_library("nope")
@@ -0,0 +1,73 @@
+import io
+import json
+import zipfile
+
+from flask import jsonify
+
+
+def _library(name):
+    return [{"group": name, "rows": [{"chords": [{"name": "Am", "shape": "x02210"}]}]}]
+
+
+def _fill(backend):
+    cid = backend.collections_index.first_id()
+    backend.save_chord_library(_library("Verse ♯"), cid)
+    return cid
+
+
+def test_pretty_export_matches_json_dumps(backend, client):
+    cid = _fill(backend)
+    resp = client.get("/my-collections/export")
+    assert resp.status_code == 200
+    payload = json.loads(resp.data)
+    collection = payload["groups"][0]["collections"][0]
+    assert collection["id"] == cid
+    assert collection["library"] == _library("Verse ♯")
+    assert resp.data == json.dumps(payload, indent=2, ensure_ascii=False).encode("utf-8")
+
+
+def test_compact_export(backend, client):
+    _fill(backend)
+    resp = client.get("/my-collections/export?format=compact")
+    payload = json.loads(resp.data)
+    assert resp.data == json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    assert client.get("/my-collections/export?format=xml").status_code == 400
+
+
+def test_zip_export_opens_with_zipfile(backend, client):
+    _fill(backend)
+    pretty = client.get("/my-collections/export").data
+    resp = client.get("/my-collections/export?format=zip")
+    assert resp.status_code == 200
+    assert resp.mimetype == "application/zip"
+    disposition = resp.headers["Content-Disposition"]
+    assert disposition.startswith("attachment;") and disposition.endswith('.zip"')
+    with zipfile.ZipFile(io.BytesIO(resp.data)) as archive:
+        assert archive.testzip() is None
+        (name,) = archive.namelist()
+        assert name.endswith(".json")
+        assert archive.read(name) == pretty
+
+
+def test_settings_export_round_trips(backend, client):
+    cid = _fill(backend)
+    exported = client.get("/advanced/export-settings")
+    assert exported.status_code == 200
+    payload = json.loads(exported.data)
+    assert payload["collections"]["libraries"][cid] == _library("Verse ♯")
+
+    backend.save_chord_library(_library("changed"), cid)
+    resp = client.post("/advanced/import-settings", data=exported.data, content_type="application/json")
+    assert resp.status_code == 204
+    assert backend.load_chord_library(cid) == _library("Verse ♯")
+
+
+def test_compact_settings_export_is_byte_identical_to_jsonify(backend, client):
+    _fill(backend)
+    resp = client.get("/advanced/export-settings")
+    assert resp.mimetype == "application/json"
+    assert "Content-Disposition" not in resp.headers
+    with backend.app.app_context():
+        expected = jsonify(json.loads(resp.data)).get_data()
+    assert resp.data == expected
+    assert b"\\u266f" in resp.data  # the library's non-ASCII group name
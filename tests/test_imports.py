@@ -0,0 +1,105 @@
+import json
+import sqlite3
+
+from freetar import imports
+
+
+def _library(name):
+    return [{"group": name, "rows": [{"chords": []}]}]
+
+
+def _post(client, url, body, **kwargs):
+    data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+    return client.post(url, data=data, content_type="application/json", **kwargs)
+
+
+def test_declared_size_over_limit_is_413(client, monkeypatch):
+    monkeypatch.setattr(imports, "MAX_BYTES", 16)
+    resp = _post(client, "/my-collections/import", {"groups": [{"group": "g", "collections": []}]})
+    assert resp.status_code == 413
+    assert resp.json["error"] == "Payload too large"
+    assert imports.tracker.stats()["too_large"] >= 1
+
+
+def test_malformed_json_is_400(client):
+    resp = _post(client, "/my-collections/import", b'{"groups": [')
+    assert resp.status_code == 400
+    assert resp.json["error"] == "Invalid JSON"
+
+
+def test_invalid_import_is_400(client):
+    resp = _post(client, "/my-collections/import", [1, 2])
+    assert resp.status_code == 400
+    assert resp.json["error"] == "Payload must be an object"
+    resp = _post(client, "/my-collections/import", {"groups": {}})
+    assert resp.status_code == 400
+    assert resp.json["error"] == "Payload.groups must be a list"
+
+
+def test_progress_is_reported(client):
+    body = {"groups": [{"group": "g", "collections": [{"name": "one", "library": _library("A")}]}]}
+    resp = _post(client, "/my-collections/import", body, headers={"X-Import-Id": "abc"})
+    assert resp.status_code == 200
+    progress = client.get("/import-progress/abc").json
+    assert progress["state"] == "done"
+    assert progress["collections"] == 1
+    assert progress["libraries_written"] == 1
+
+
+def test_failed_collections_import_removes_written_libraries(backend, client, monkeypatch):
+    monkeypatch.setattr(imports, "BATCH_SIZE", 1)
+    backend.collections_index.first_id()  # creates the default collection
+    before = backend.collections_store.library_ids()
+    collections = [{"name": str(n), "library": _library(str(n))} for n in range(3)]
+    body = json.dumps({"groups": [{"group": "g", "collections": collections}]}).encode("utf-8")
+    # Batches are written before the trailing garbage is found.
+    resp = _post(client, "/my-collections/import", body + b" trailing")
+    assert resp.status_code == 400
+    assert backend.collections_store.library_ids() == before
+
+
+def _settings(libraries, groups):
+    return {"chords": [], "collections": {"groups": groups, "libraries": libraries}}
+
+
+def test_failed_settings_import_keeps_existing_libraries(backend, client, monkeypatch):
+    monkeypatch.setattr(imports, "BATCH_SIZE", 1)
+    cid = backend.collections_index.first_id()
+    backend.save_chord_library(_library("mine"), cid)
+    groups_before = backend.load_collections()
+    body = json.dumps(_settings({cid: _library("imported"), "other": _library("B")}, [])).encode("utf-8")
+    resp = _post(client, "/advanced/import-settings", body[:-1] + b", 5}")
+    assert resp.status_code == 400
+    assert backend.load_chord_library(cid) == _library("mine")
+    assert backend.load_collections() == groups_before
+    assert backend.collections_store.library_ids() == [cid]
+
+
+def test_settings_import_moves_staged_libraries_into_place(backend, client, monkeypatch):
+    monkeypatch.setattr(imports, "BATCH_SIZE", 2)
+    groups = [{"group": "g", "collections": [{"id": f"c{n}", "name": str(n)} for n in range(5)]}]
+    libraries = {f"c{n}": _library(str(n)) for n in range(5)}
+    resp = _post(client, "/advanced/import-settings", _settings(libraries, groups))
+    assert resp.status_code == 204
+    store = backend.collections_store
+    assert set(store.library_ids()) >= set(libraries)
+    assert not [cid for cid in store.library_ids() if cid.startswith("import_")]
+    assert store.read_libraries(libraries) == libraries
+    assert backend.load_collections() == groups
+
+
+def test_unexpected_store_error_finishes_the_import(backend, client, monkeypatch):
+    def locked():
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(backend.collections_store, "metadata_version", locked)
+    failed = imports.tracker.stats()["failed"]
+    body = {"groups": [{"group": "g", "collections": [{"name": "one", "library": _library("A")}]}]}
+    resp = _post(client, "/my-collections/import", body, headers={"X-Import-Id": "broken"})
+    # Rendered by the app's error handler.
+    assert b"Oops" in resp.data
+    progress = client.get("/import-progress/broken").json
+    assert progress["state"] == "failed"
+    assert progress["error"] == "Internal error"
+    assert imports.tracker.stats()["failed"] == failed + 1
+    assert imports.tracker.stats()["running"] == 0
@@ -0,0 +1,180 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+from freetar.jsonstream import PayloadTooLarge, StreamReader, chunked, iterencode, zipped
+
+
+ENCODED = [
+    {},
+    [],
+    "♯ \"quoted\"\n",
+    {"a": {}, "b": [], "c": [[], {}], "d": None},
+    {"version": 1, "groups": [{"group": "g", "collections": [{"id": "c1", "library": [{"rows": []}]}]}]},
+    [1, 2.5, True, None, {"nested": [{"deeper": ["x", {}]}]}],
+    {1: "int key", "é": "unicode key"},
+    ("tuple", "items"),
+]
+
+
+def _lazy(value):
+    """The same value with every container behind a callable or an iterator."""
+    if isinstance(value, dict):
+        return {key: _lazy(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return iter([_lazy(item) for item in value])
+    return value
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("value", ENCODED)
+def test_iterencode_matches_json_dumps(value, indent):
+    separators = (",", ":") if indent is None else None
+    expected = json.dumps(value, indent=indent, ensure_ascii=False, separators=separators)
+    assert "".join(iterencode(value, indent)) == expected
+    assert "".join(iterencode(_lazy(value), indent)) == expected
+    assert "".join(iterencode(lambda: value, indent)) == expected
+    wrapped = {"outer": [lambda: value, _lazy(value)]}
+    plain = {"outer": [value, value]}
+    expected = json.dumps(plain, indent=indent, ensure_ascii=False, separators=separators)
+    assert "".join(iterencode(wrapped, indent)) == expected
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("value", ENCODED[:6])
+def test_iterencode_sort_keys_and_ascii_match_json_dumps(value, indent):
+    separators = (",", ":") if indent is None else None
+    lazy = {"z": value, "é": [lambda: {"b": "♯", "a": value}], "a": _lazy(value)}
+    plain = {"z": value, "é": [{"b": "♯", "a": value}], "a": value}
+    expected = json.dumps(plain, indent=indent, sort_keys=True, separators=separators)
+    assert "".join(iterencode(lazy, indent, sort_keys=True, ensure_ascii=True)) == expected
+
+
+def test_callables_are_called_while_encoding():
+    calls = []
+
+    def library():
+        calls.append(1)
+        return [{"group": "g"}]
+
+    parts = iterencode({"a": "first", "b": library}, indent=2)
+    next(parts)
+    assert calls == []
+    "".join(parts)
+    assert calls == [1]
+
+
+def test_chunked_joins_parts_into_utf8_chunks():
+    parts = ["ab", "♯", "cd", "ef"]
+    chunks = list(chunked(parts, size=4))
+    assert b"".join(chunks) == "".join(parts).encode("utf-8")
+    assert all(len(chunk) >= 4 for chunk in chunks[:-1])
+
+
+def test_zipped_archive_holds_the_document():
+    text = json.dumps({"x": ["y" * 1000] * 50}, indent=2)
+    data = b"".join(zipped("export.json", chunked(iter(text), size=512)))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ["export.json"]
+        assert archive.read("export.json") == text.encode("utf-8")
+
+
+def _reader(text, chunk_size=4, **kwargs):
+    data = text.encode("utf-8") if isinstance(text, str) else text
+    return StreamReader(io.BytesIO(data), chunk_size=chunk_size, **kwargs)
+
+
+def _walk(reader):
+    """Rebuild a document through the pull interface."""
+    kind = reader.peek_type()
+    if kind == "object":
+        return {key: _walk(reader) for key in reader.iter_object()}
+    if kind == "array":
+        return [_walk(reader) for _ in reader.iter_array()]
+    return reader.value()
+
+
+DOCUMENT = {
+    "groups": [{"group": "Verse é♯", "rows": [{"chords": [{"name": "Am", "shape": "x02210"}]}]}],
+    "numbers": [0, -12, 3.25, 1e21, 123456789012345678],
+    "literals": [True, False, None],
+    "empty": {"object": {}, "array": []},
+    "escaped": "quote \" backslash \\ 🎸",
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_tokens_split_across_chunks(chunk_size, indent):
+    text = json.dumps(DOCUMENT, indent=indent, ensure_ascii=False)
+    reader = _reader(text, chunk_size)
+    assert _walk(reader) == DOCUMENT
+    reader.end()
+    assert reader.bytes_read == len(text.encode("utf-8"))
+
+
+@pytest.mark.parametrize("text", ["[12345,6]", "[12345]", "12345", "  -0.5e10  ", "[true,null]"])
+def test_numbers_and_literals_at_buffer_end(text):
+    for chunk_size in range(1, len(text) + 2):
+        reader = _reader(text, chunk_size)
+        assert _walk(reader) == json.loads(text)
+        reader.end()
+
+
+def test_number_is_not_cut_at_chunk_edge():
+    # The first chunk ends right after "12"; the rest of the number follows.
+    reader = _reader('{"a":12345}', chunk_size=7)
+    assert _walk(reader) == {"a": 12345}
+
+
+def test_byte_order_mark_is_skipped():
+    reader = _reader(b"\xef\xbb\xbf" + b'{"a": [1]}', chunk_size=2)
+    assert _walk(reader) == {"a": [1]}
+    reader.end()
+
+
+def test_multibyte_character_split_across_chunks():
+    reader = _reader('["♯♯"]'.encode("utf-8"), chunk_size=1)
+    assert _walk(reader) == ["♯♯"]
+
+
+def test_limit():
+    text = json.dumps({"a": "x" * 100})
+    seen = []
+    reader = _reader(text, chunk_size=16, limit=64, on_read=seen.append)
+    with pytest.raises(PayloadTooLarge):
+        _walk(reader)
+    assert seen and max(seen) <= 64
+    reader = _reader(text, chunk_size=16, limit=len(text))
+    assert _walk(reader) == {"a": "x" * 100}
+
+
+def test_end_rejects_trailing_data():
+    reader = _reader('{"a": 1} {"b": 2}')
+    assert _walk(reader) == {"a": 1}
+    with pytest.raises(json.JSONDecodeError):
+        reader.end()
+    reader = _reader('{"a": 1}  \n\t')
+    _walk(reader)
+    reader.end()
+
+
+def test_skip_consumes_nested_values():
+    reader = _reader('{"skip": {"x": [1, {"y": "]}"}]}, "keep": [1]}', chunk_size=3)
+    kept = {}
+    for key in reader.iter_object():
+        if key == "keep":
+            kept[key] = reader.value()
+        else:
+            reader.skip()
+    reader.end()
+    assert kept == {"keep": [1]}
+
+
+@pytest.mark.parametrize("text", ['{"a" 1}', '{"a": 1,}', "[1 2]", '{"a": 1', '{1: 2}', '"unterminated'])
+def test_malformed_input(text):
+    with pytest.raises(json.JSONDecodeError):
+        _walk(_reader(text))
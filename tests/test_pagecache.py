@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def searches(backend, monkeypatch):
+    calls = []
+
+    def get_search(term, page):
+        calls.append((term, page))
+        return SimpleNamespace(results=[], total_pages=1, current_page=page)
+
+    monkeypatch.setattr(backend, "get_search", get_search)
+    monkeypatch.setattr(backend.prefetcher, "search_page", lambda *args: None)
+    backend.cache.clear()
+    yield calls
+    backend.cache.clear()
+
+
+def test_key_keeps_encoded_separators_apart(backend):
+    keys = set()
+    for query in ("page=1%26search_term%3Dfoo", "page=1&search_term=foo", "search_term=foo&page=1"):
+        with backend.app.test_request_context("/search", query_string=query):
+            keys.add(backend.page_cache.make_key(True))
+    assert len(keys) == 2
+
+
+def test_encoded_query_does_not_poison_the_real_search(client, searches):
+    resp = client.get("/search?page=1%26search_term%3Dfoo")
+    assert resp.status_code == 400
+    assert b"Invalid page requested" in resp.data
+
+    resp = client.get("/search?page=1&search_term=foo")
+    assert resp.status_code == 200
+    assert b"Invalid page requested" not in resp.data
+    assert searches == [("foo", 1)]
+
+
+def test_invalid_page_is_not_cached(backend, client, searches):
+    misses = backend.page_cache.stats()["misses"]
+    for _ in range(2):
+        assert client.get("/search?page=x").status_code == 400
+    assert backend.page_cache.stats()["misses"] == misses + 2
+
+    client.get("/search?search_term=foo&page=2")
+    client.get("/search?page=2&search_term=foo")
+    assert searches == [("foo", 2)]
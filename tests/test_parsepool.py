@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+from freetar import parsepool
+
+
+def _fail(message):
+    raise RuntimeError(message)
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+@pytest.fixture
+def pool():
+    parsepool.configure(1)
+    yield parsepool
+    parsepool.configure(0)
+
+
+def test_parser_runtime_error_is_not_a_pool_fallback(pool):
+    before = pool.stats()
+    with pytest.raises(RuntimeError, match="parser bug"):
+        pool.run(_fail, "parser bug")
+    after = pool.stats()
+    assert after["fallbacks"] == before["fallbacks"]
+    assert after["in_thread"] == before["in_thread"]
+
+
+def test_timeout_is_builtin_timeout_error(pool, monkeypatch):
+    assert pool.run(_sleep, 0) == 0  # start the worker
+    monkeypatch.setattr(parsepool, "PARSE_TIMEOUT", 0.05)
+    with pytest.raises(TimeoutError):
+        pool.run(_sleep, 2)
+
+
+def test_shut_down_pool_falls_back_in_thread(pool, monkeypatch):
+    executor = pool._get_executor()
+    executor.shutdown(wait=True)
+    monkeypatch.setattr(parsepool, "_get_executor", lambda: executor)
+    before = pool.stats()["fallbacks"]
+    assert pool.run(_sleep, 0) == 0
+    assert pool.stats()["fallbacks"] == before + 1
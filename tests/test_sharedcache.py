@@ -0,0 +1,107 @@
+import socket
+import socketserver
+import struct
+import time
+
+import pytest
+
+from freetar.pagecache import PageCache, decode_entry, encode_entry
+from freetar.sharedcache import RespCache, StandInServer
+
+
+@pytest.fixture
+def server():
+    standin = StandInServer().start()
+    yield standin
+    standin.stop()
+
+
+@pytest.fixture
+def cache(server):
+    return RespCache(host=server.host, port=server.port, key_prefix="test:")
+
+
+def test_get_set_delete(cache):
+    assert cache.get("missing") is None
+    assert cache.set("key", {"a": [1, 2]})
+    assert cache.get("key") == {"a": [1, 2]}
+    assert cache.has("key")
+    assert not cache.add("key", "other")
+    assert cache.delete("key")
+    assert cache.get("key") is None
+    assert not cache.delete("key")
+
+
+def test_key_prefix_is_applied(server, cache):
+    cache.set("key", "value")
+    other = RespCache(host=server.host, port=server.port, key_prefix="other:")
+    assert other.get("key") is None
+
+
+def test_ttl_expiry(cache):
+    cache.set("short", "value", timeout=1)
+    cache.set("forever", "value", timeout=0)
+    assert cache.get("short") == "value"
+    time.sleep(1.1)
+    assert cache.get("short") is None
+    assert cache.get("forever") == "value"
+
+
+def test_compact_entry_round_trip():
+    entry = {"body": "<p>héllo</p>" * 50, "stored_at": 1712345678.25,
+             "variants": {"gzip": b"\x1f\x8b\x00", "br": b""}}
+    blob = encode_entry(entry)
+    assert isinstance(blob, bytes)
+    assert len(blob) < len(entry["body"].encode("utf-8"))
+    assert decode_entry(blob) == entry
+
+
+def test_page_cache_entries_round_trip_through_server(server, cache):
+    writer = PageCache(cache, shared=True)
+    entry = writer.store("page:/tab", "<html>tab</html>", variants={"gzip": b"zz"})
+    # A second process has an empty local front and reads the shared copy.
+    reader = PageCache(cache, shared=True)
+    assert reader.lookup("page:/tab") == entry
+    assert isinstance(cache.get("page:/tab"), bytes)
+
+
+def _closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_unreachable_server_is_a_miss():
+    cache = RespCache(host="127.0.0.1", port=_closed_port())
+    assert cache.get("key") is None
+    assert not cache.set("key", "value")
+    assert not cache.delete("key")
+    assert not cache.has("key")
+    page_cache = PageCache(cache, shared=True)
+    page_cache.store("page:/x", "body")
+    # Still served from the local front while the shared tier is down.
+    assert page_cache.lookup("page:/x")["body"] == "body"
+
+
+def test_server_going_away_falls_back(server, cache):
+    cache.set("key", "value")
+    server.stop()
+    assert cache.get("key") is None
+
+
+def test_standin_does_not_change_stdlib_server_defaults(server):
+    assert socketserver.ThreadingTCPServer.allow_reuse_address is False
+    assert socketserver.ThreadingTCPServer.daemon_threads is False
+
+
+def test_client_hanging_up_mid_reply_is_quiet(server, cache, capsys):
+    value = b"x" * (8 * 1024 * 1024)
+    assert cache.set("big", value)
+    with socket.create_connection((server.host, server.port)) as sock:
+        sock.sendall(b"*2\r\n$3\r\nGET\r\n$8\r\ntest:big\r\n" * 4)
+        sock.recv(1)
+        # Reset instead of a clean close, so the server's writes fail.
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+    time.sleep(0.3)
+    assert cache.get("big") == value
+    assert "Traceback" not in capsys.readouterr().err
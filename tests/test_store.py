@@ -0,0 +1,49 @@
+import sqlite3
+
+from freetar.store import SQLiteStore
+
+
+def test_max_entries_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(SQLiteStore, "EVICT_EVERY", 1)
+    monkeypatch.setattr(SQLiteStore, "TOUCH_INTERVAL", -1)
+    store = SQLiteStore(tmp_path / "cache.sqlite3", max_entries=20)
+    for i in range(20):
+        store.set(f"k{i}", i)
+    assert store.get("k0") == 0  # used recently, must survive
+    for i in range(20, 30):
+        store.set(f"k{i}", i)
+    assert store.count() <= 20
+    assert store.get("k0") == 0
+    assert store.get("k1") is None
+    assert store.get("k29") == 29
+    assert store.evicted >= 10
+
+
+def test_max_bytes_bounds_stored_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(SQLiteStore, "EVICT_EVERY", 1)
+    store = SQLiteStore(tmp_path / "cache.sqlite3", max_bytes=20_000)
+    for i in range(50):
+        store.set(f"k{i}", i.to_bytes(2, "big") * 1000 + bytes(range(256)) * i)
+    assert store.size_bytes() <= 20_000
+    assert store.get("k49") is not None
+
+
+def test_unlimited_store_never_evicts(tmp_path, monkeypatch):
+    monkeypatch.setattr(SQLiteStore, "EVICT_EVERY", 1)
+    store = SQLiteStore(tmp_path / "cache.sqlite3")
+    for i in range(100):
+        store.set(f"k{i}", i)
+    assert store.count() == 100
+    assert store.evicted == 0
+
+
+def test_old_database_gains_access_column(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+                 " stored_at REAL NOT NULL, expires_at REAL NOT NULL)")
+    conn.commit()
+    conn.close()
+    store = SQLiteStore(path, max_entries=5)
+    store.set("a", 1)
+    assert store.get("a") == 1
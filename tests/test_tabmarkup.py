@@ -0,0 +1,66 @@
+"""
+Golden tests: freetar.tabmarkup must render exactly what the previous
+replace/regex implementation of SongDetail.fix_tab produced.
+"""
+import random
+import re
+
+import pytest
+
+from freetar import tabmarkup
+
+
+def legacy_fix_tab(tab: str) -> str:
+    """SongDetail.fix_tab before the tokenizer, kept verbatim as the reference."""
+
+    def parse_chord(chord):
+        root = '<span class="chord-root">%s</span>' % chord.group('root')
+        quality = ''
+        bass = ''
+        if chord.group('quality') is not None:
+            quality = '<span class="chord-quality">%s</span>' % chord.group('quality')
+        if chord.group('bass') is not None:
+            bass = '/<span class="chord-bass">%s</span>' % chord.group('bass')[1:]
+        return '<span class="chord fw-bold">%s</span>' % (root + quality + bass)
+
+    tab = tab.replace("\r\n", "<br/>")
+    tab = tab.replace("\n", "<br/>")
+    tab = tab.replace(" ", "&nbsp;")
+    tab = tab.replace("[tab]", "")
+    tab = tab.replace("[/tab]", "")
+    return re.sub(r'\[ch\](?P<root>[A-Ha-h](#|b)?)(?P<quality>[^[/]+)?(?P<bass>/[A-Ha-h](#|b)?)?\[\/ch\]', parse_chord, tab)
+
+
+def fix_tab(tab: str) -> str:
+    return tabmarkup.to_html(tabmarkup.tokenize(tab))
+
+
+EDGE_CASES = {
+    "empty": "",
+    "plain": "plain",
+    "ch_in_tab_crlf": "[tab][ch]Am[/ch]  [ch]C/G[/ch]\r\nla  la[/tab]",
+    "nested_tab_blocks": "[tab][ch]G[/ch] [tab][ch]D/F#[/ch][/tab] text[/tab]",
+    "qualities_and_bass": "[ch]F#m7b5[/ch] [ch]Bbmaj7[/ch] [ch]Cm(maj7)[/ch] [ch]D/F#[/ch]",
+    "empty_and_invalid_chords": "[ch]C/[/ch] [ch]X[/ch] [ch][/ch] [ch]A m[/ch] [ch]A\nm[/ch] [ch]A\r\nm[/ch] [ch]A\rm[/ch]",
+    "lowercase_and_odd_bass": "[ch]h[/ch] [ch]Esus4 [/ch] [ch]G/b#[/ch][ch]G/Bbb[/ch]",
+    "whitespace_and_unclosed_tab": "\n\n\r\n   \r \t [tab] [/tab] [tab]",
+    "unclosed_ch": "[ch]Am[/ch[ch]C[/ch] [ch]Am[/ch]]",
+    "unclosed_ch_at_end": "[tab]la [ch]Am",
+    "stray_closing_tags": "[/ch][/tab]A[/ch]",
+    "only_crlf": "\r\n\r\n\n\r",
+    "tablature_and_html": "e|---0---|\nB|--1-1--|\n<b>bold</b> & stuff",
+}
+
+
+@pytest.mark.parametrize("tab", list(EDGE_CASES.values()), ids=list(EDGE_CASES))
+def test_edge_cases_match_legacy(tab):
+    assert fix_tab(tab) == legacy_fix_tab(tab)
+
+
+def test_random_markup_matches_legacy():
+    pieces = ["[ch]", "[/ch]", "[tab]", "[/tab]", "A", "b", "#", "m", "7", "/", "(", ")",
+              " ", "  ", "\n", "\r\n", "\r", "x", "[", "]", "G", "sus", "&nbsp;"]
+    rng = random.Random(1234)
+    for _ in range(2000):
+        tab = "".join(rng.choice(pieces) for _ in range(rng.randint(1, 200)))
+        assert fix_tab(tab) == legacy_fix_tab(tab), repr(tab)
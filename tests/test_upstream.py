@@ -0,0 +1,23 @@
+import pytest
+import requests
+
+from freetar import upstream
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(response=response)
+
+
+@pytest.mark.parametrize("exc, failure, retryable", [
+    (requests.exceptions.ConnectTimeout(), True, True),
+    (requests.exceptions.ConnectionError(), True, True),
+    (_http_error(503), True, True),
+    (_http_error(429), False, True),
+    (_http_error(404), False, False),
+    (upstream.UpstreamUnavailable("breaker open"), False, False),
+])
+def test_breaker_and_retry_predicates(exc, failure, retryable):
+    assert upstream._is_failure(exc) is failure
+    assert upstream._is_retryable(exc) is retryable
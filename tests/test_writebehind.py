@@ -0,0 +1,123 @@
+import atexit
+
+import pytest
+
+from freetar.collections_store import JSONCollectionsStore, RevisionConflict, SQLiteCollectionsStore
+from freetar.writebehind import WriteBehindStore
+
+
+def _library(name):
+    return [{"group": name, "rows": [{"chords": []}]}]
+
+
+def _open(path, tmp_path, name, delay=60):
+    store = WriteBehindStore(SQLiteCollectionsStore(path), tmp_path / f"{name}.journal", delay=delay)
+    atexit.unregister(store.close)
+    return store
+
+
+def test_patches_from_two_workers_conflict(tmp_path):
+    db = tmp_path / "collections.sqlite3"
+    first = _open(db, tmp_path, "first")
+    second = _open(db, tmp_path, "second")
+    first.store.write_library("a", _library("start"))
+    # As in pre-fork mode: both switch to writing through.
+    first.close()
+    second.close()
+
+    base = second.library_version("a")[0]
+    assert first.library_version("a")[0] == base
+    first.update_library("a", base, lambda current: current + _library("first"))
+    with pytest.raises(RevisionConflict):
+        second.update_library("a", base, lambda current: current + _library("second"))
+    assert [g["group"] for g in second.read_library("a")] == ["start", "first"]
+
+
+def test_patch_on_a_pending_save_uses_its_revision(tmp_path):
+    store = _open(tmp_path / "collections.sqlite3", tmp_path, "wb")
+    store.write_library("a", _library("one"))
+    base = store.library_version("a")[0]
+    revision = store.update_library("a", base, lambda current: current + _library("two"))
+    assert revision == store.library_version("a")[0] != base
+    # Journalled and coalesced with the pending save, not written yet.
+    assert store.stats()["pending"] == 1
+    assert store.stats()["coalesced"] == 1
+    assert not store.store.has_library("a")
+    with pytest.raises(RevisionConflict) as info:
+        store.update_library("a", base, lambda current: current)
+    assert info.value.revision == revision
+    store.flush()
+    assert [g["group"] for g in store.store.read_library("a")] == ["one", "two"]
+    assert store.library_version("a")[0] == revision
+
+
+def test_revision_survives_background_flush(tmp_path):
+    store = _open(tmp_path / "collections.sqlite3", tmp_path, "wb")
+    store.write_library("a", _library("one"))
+    base = store.library_version("a")[0]
+    store.flush()
+    assert store.library_version("a")[0] == base
+    store.update_library("a", base, lambda current: current + _library("two"))
+
+
+def test_journal_replays_acknowledged_saves_after_a_crash(tmp_path):
+    chords_dir = tmp_path / "collections"
+    journal = tmp_path / "collections.journal"
+    crashed = WriteBehindStore(JSONCollectionsStore(tmp_path / "meta.json", chords_dir), journal, delay=60)
+    atexit.unregister(crashed.close)
+    for name in ("one", "two", "three"):
+        crashed.write_library("a", _library(name))
+    crashed.write_library("b", _library("other"))
+    assert crashed.stats()["coalesced"] == 2
+    # Nothing reached storage; drop the process state without flushing.
+    assert not (chords_dir / "a.json").exists()
+    del crashed
+
+    storage = JSONCollectionsStore(tmp_path / "meta.json", chords_dir)
+    reopened = WriteBehindStore(storage, journal, delay=60)
+    atexit.unregister(reopened.close)
+    assert reopened.stats()["recovered"] == 2
+    assert reopened.read_library("a") == _library("three")
+    reopened.flush()
+    assert storage.read_library("a") == _library("three")
+    assert storage.read_library("b") == _library("other")
+    assert not journal.exists() or not journal.read_bytes()
+
+
+def test_torn_journal_record_is_ignored(tmp_path):
+    journal = tmp_path / "collections.journal"
+    journal.write_bytes(b'{"id":"a","data":[{"group":"ok","rows":[]}]}\n{"id":"b","da')
+    storage = JSONCollectionsStore(tmp_path / "meta.json", tmp_path / "collections")
+    store = WriteBehindStore(storage, journal, delay=60)
+    atexit.unregister(store.close)
+    store.flush()
+    assert storage.read_library("a") == [{"group": "ok", "rows": []}]
+    assert not storage.has_library("b")
+
+
+def test_burst_of_autosaves_is_one_storage_write(backend, client, tmp_path, monkeypatch):
+    store = WriteBehindStore(backend.collections_store, tmp_path / "collections.journal", delay=60)
+    atexit.unregister(store.close)
+    monkeypatch.setattr(backend, "collections_store", store)
+    cid = backend.collections_index.first_id()
+    store.flush()
+
+    writes = []
+    storage_write_many = store.store.write_many
+    monkeypatch.setattr(store.store, "write_many",
+                        lambda **kwargs: writes.append(kwargs) or storage_write_many(**kwargs))
+    for name in ("one", "two", "three"):
+        resp = client.post(f"/my-collections/{cid}/edit", json=_library(name))
+        assert resp.status_code == 204
+    revision = resp.headers["X-Library-Revision"]
+    resp = client.post(f"/my-collections/{cid}/patch",
+                       json={"base": revision, "ops": [{"op": "rename_group", "index": 0, "name": "four"}]})
+    assert resp.status_code == 200
+    assert store.stats()["writes"] == 4
+    assert store.stats()["pending"] == 1
+    assert writes == []
+    assert backend.load_chord_library(cid) == _library("four")
+
+    store.flush()
+    assert len(writes) == 1
+    assert store.store.read_library(cid) == _library("four")